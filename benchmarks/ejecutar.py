@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import statistics
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import cv2
+import numpy as np
+
+from script.plantillas import AlmacenPlantillas, Fotograma, CAPTURE_DIR, obtener_almacen
+from script.captura import Captura, registrar_capturador, obtener_capturador
+from script import cache_coordenadas
+from script.cache_coordenadas import CacheCoordenadas
+from benchmarks.repeticion import CapturadorRepeticion, pantalla_sintetica
+
+RESOLUCIONES = [(1920, 1080), (2560, 1440), (3840, 2160)]
+CANTIDADES = [4, 16]
+
+
+def _ms(segundos):
+    return round(segundos * 1000, 2)
+
+
+def _memoria_maxima_mb():
+    """Memoria residente máxima del proceso (MB); None donde `resource` no existe (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes.
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _preparar_plantillas(directorio: str, cantidad: int, semilla: int = 0):
+    """
+    Copia las plantillas de capture/ a `directorio` y, si hacen falta más, añade recortes
+    aleatorios con textura de tamaños parecidos hasta llegar a `cantidad`.
+    """
+    rng = np.random.default_rng(semilla)
+    nombres = []
+    for nombre in sorted(os.listdir(CAPTURE_DIR)):
+        if nombre.endswith(".png") and len(nombres) < cantidad:
+            shutil.copy(os.path.join(CAPTURE_DIR, nombre), directorio)
+            nombres.append(nombre)
+    while len(nombres) < cantidad:
+        alto, ancho = int(rng.integers(20, 120)), int(rng.integers(60, 450))
+        base = rng.integers(0, 256, (max(2, alto // 4), max(2, ancho // 4), 3), dtype=np.uint8)
+        recorte = cv2.resize(base, (ancho, alto), interpolation=cv2.INTER_NEAREST)
+        nombre = f"sintetica_{len(nombres):04d}.png"
+        cv2.imwrite(os.path.join(directorio, nombre), recorte)
+        nombres.append(nombre)
+    return nombres
+
+
+def medir_localizacion(resoluciones, cantidades, repeticiones: int = 5, referencia: bool = False):
+    """
+    Latencia de localización por plantilla y de la búsqueda conjunta de todas las plantillas
+    en un fotograma, para cada resolución y número de plantillas.
+    """
+    resultados = []
+    for cantidad in cantidades:
+        with tempfile.TemporaryDirectory() as directorio:
+            nombres = _preparar_plantillas(directorio, cantidad)
+            tracemalloc.start()
+            almacen = AlmacenPlantillas(directorio)
+            _, memoria_plantillas = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            for ancho, alto in resoluciones:
+                pantalla, posiciones = pantalla_sintetica(ancho, alto, nombres, almacen=almacen)
+                por_plantilla = {}
+                aciertos = 0
+                tracemalloc.start()
+                for nombre in nombres:
+                    tiempos = []
+                    for _ in range(repeticiones):
+                        inicio = time.perf_counter()
+                        box = almacen.localizar(nombre, Fotograma(pantalla))
+                        tiempos.append(time.perf_counter() - inicio)
+                    por_plantilla[nombre] = _ms(statistics.median(tiempos))
+                    if box is not None and (box.left, box.top) == posiciones.get(nombre):
+                        aciertos += 1
+
+                tiempos_varios = []
+                for _ in range(repeticiones):
+                    inicio = time.perf_counter()
+                    almacen.localizar_varios(nombres, Fotograma(pantalla))
+                    tiempos_varios.append(time.perf_counter() - inicio)
+                _, memoria_busqueda = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                # Con la caché de coordenadas ya poblada: solo se comprueba el parche de cada plantilla.
+                cache = CacheCoordenadas(os.path.join(directorio, "coordenadas.json"))
+                monitor = {"left": 0, "top": 0, "width": ancho, "height": alto}
+                cache.localizar_varios(nombres, Captura(pantalla, 0, 0, 1), monitor, almacen)
+                tiempos_cache = []
+                for _ in range(repeticiones):
+                    captura = Captura(pantalla, 0, 0, 1)
+                    inicio = time.perf_counter()
+                    cache.localizar_varios(nombres, captura, monitor, almacen)
+                    tiempos_cache.append((time.perf_counter() - inicio) / len(nombres))
+
+                fila = {
+                    "resolucion": f"{ancho}x{alto}",
+                    "plantillas": cantidad,
+                    "aciertos": aciertos,
+                    "ms_por_plantilla_mediana": round(statistics.median(por_plantilla.values()), 2),
+                    "ms_por_plantilla_max": max(por_plantilla.values()),
+                    "ms_todas_en_un_fotograma": _ms(statistics.median(tiempos_varios)),
+                    "ms_por_plantilla_con_cache": round(statistics.median(tiempos_cache) * 1000, 3),
+                    "mb_plantillas": round(memoria_plantillas / 2**20, 2),
+                    "mb_pico_busqueda": round(memoria_busqueda / 2**20, 2),
+                    "ms_por_plantilla": por_plantilla,
+                }
+                if referencia:
+                    # Lo que hacía pyautogui.locateOnScreen: correlación a resolución completa.
+                    inicio = time.perf_counter()
+                    for nombre in nombres:
+                        cv2.matchTemplate(pantalla, almacen.plantilla(nombre).color[0], cv2.TM_CCOEFF_NORMED)
+                    fila["ms_referencia_por_plantilla"] = _ms((time.perf_counter() - inicio) / len(nombres))
+                resultados.append(fila)
+                print(f"DEBUG Benchmark: localización {fila['resolucion']} con {cantidad} plantillas: "
+                      f"{fila['ms_por_plantilla_mediana']} ms/plantilla, {fila['ms_todas_en_un_fotograma']} ms todas, "
+                      f"{aciertos}/{cantidad} aciertos")
+    return resultados
+
+
+def medir_flujo(resolucion, latencia_plan: float, latencia_scl: float, repeticiones: int = 3):
+    """
+    Tiempo de principio a fin de ejecutar_flujo con pantallas reproducidas, LLM simulado y
+    acciones que solo localizan (sin ratón ni teclado).
+    """
+    from benchmarks.llm_simulado import instalar
+
+    nombres = obtener_almacen().nombres()[:4]
+    _, cliente_scl = instalar(nombres, latencia_plan, latencia_scl)
+    from script.orquestador import ejecutar_flujo
+
+    ancho, alto = resolucion
+    pantalla, _ = pantalla_sintetica(ancho, alto, nombres)
+    monitor_id = 1
+    registrar_capturador(monitor_id, CapturadorRepeticion([pantalla], monitor_id))
+    almacen = obtener_almacen()
+    acciones = []
+
+    def accion_simulada(step_image_name, action_type, text_content=None, monitor_id=None, region=None, location=None):
+        if location is None:
+            captura = obtener_capturador(monitor_id).capturar(region)
+            location = almacen.localizar(step_image_name, captura)
+            if location is None:
+                raise RuntimeError(f"No se pudo localizar '{step_image_name}' en la pantalla reproducida.")
+            location = captura.a_global(location)
+        acciones.append((step_image_name, action_type, location))
+
+    tiempos = []
+    # El flujo no debe tocar el estado real del proyecto: la caché de coordenadas se apunta al
+    # directorio temporal y no se escriben diario ni trazas (y se restaura todo al terminar).
+    entorno_previo = {nombre: os.environ.get(nombre) for nombre in ("PLCAID_SIN_DIARIO", "PLCAID_TRAZAS")}
+    cache_previa = cache_coordenadas._cache
+    with tempfile.TemporaryDirectory() as directorio:
+        os.environ["PLCAID_SIN_DIARIO"] = "1"
+        os.environ["PLCAID_TRAZAS"] = "0"
+        cache_coordenadas._cache = CacheCoordenadas(os.path.join(directorio, "coordenadas.json"))
+        try:
+            tracemalloc.start()
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                ejecutar_flujo("marcha paro", monitor_id, accion=accion_simulada,
+                               ruta_steps=os.path.join(directorio, "steps.json"))
+                tiempos.append(time.perf_counter() - inicio)
+            _, memoria = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            cache_coordenadas._cache = cache_previa
+            for nombre, valor in entorno_previo.items():
+                if valor is None:
+                    os.environ.pop(nombre, None)
+                else:
+                    os.environ[nombre] = valor
+
+    fila = {
+        "resolucion": f"{ancho}x{alto}",
+        "pasos": len(nombres),
+        "latencia_plan_s": latencia_plan,
+        "latencia_scl_s": latencia_scl,
+        "s_flujo_mediana": round(statistics.median(tiempos), 3),
+        "s_flujo_max": round(max(tiempos), 3),
+        "llamadas_scl": cliente_scl.llamadas,
+        "mb_pico_flujo": round(memoria / 2**20, 2),
+    }
+    print(f"DEBUG Benchmark: flujo {fila['resolucion']}: {fila['s_flujo_mediana']} s (mediana de {repeticiones})")
+    return fila
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pruebas de rendimiento sin escritorio ni OpenAI.")
+    parser.add_argument("--resoluciones", nargs="+", default=[f"{a}x{h}" for a, h in RESOLUCIONES],
+                        help="Resoluciones de pantalla, como 1920x1080.")
+    parser.add_argument("--plantillas", nargs="+", type=int, default=CANTIDADES, help="Números de plantillas a probar.")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--referencia", action="store_true", help="Medir también la búsqueda a resolución completa.")
+    parser.add_argument("--latencia-plan", type=float, default=0.0, help="Latencia simulada (s) del LLM de pasos.")
+    parser.add_argument("--latencia-scl", type=float, default=0.0, help="Latencia simulada (s) del LLM de SCL.")
+    parser.add_argument("--sin-flujo", action="store_true", help="No medir el flujo completo.")
+    parser.add_argument("--json", help="Guardar los resultados en este archivo JSON.")
+    args = parser.parse_args(argv)
+
+    resoluciones = [tuple(int(v) for v in r.lower().split("x")) for r in args.resoluciones]
+    resultados = {"localizacion": medir_localizacion(resoluciones, args.plantillas, args.repeticiones, args.referencia)}
+    if not args.sin_flujo:
+        resultados["flujo"] = [medir_flujo(r, args.latencia_plan, args.latencia_scl, args.repeticiones) for r in resoluciones]
+    resultados["mb_residente_max"] = _memoria_maxima_mb()
+
+    print("\nresolución   plantillas  aciertos  ms/plantilla  ms/plantilla(max)  ms todas  ms con caché  MB plantillas  ms referencia")
+    for fila in resultados["localizacion"]:
+        print(f"{fila['resolucion']:<12} {fila['plantillas']:>10} {fila['aciertos']:>9} {fila['ms_por_plantilla_mediana']:>13} "
+              f"{fila['ms_por_plantilla_max']:>18} {fila['ms_todas_en_un_fotograma']:>9} {fila['ms_por_plantilla_con_cache']:>13} "
+              f"{fila['mb_plantillas']:>14} {fila.get('ms_referencia_por_plantilla', '-'):>14}")
+    for fila in resultados.get("flujo", []):
+        print(f"Flujo {fila['resolucion']}: {fila['s_flujo_mediana']} s (máx. {fila['s_flujo_max']} s), pico {fila['mb_pico_flujo']} MB")
+    print(f"Memoria residente máxima: {resultados['mb_residente_max']} MB")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import os
+import json
+import time
+from types import SimpleNamespace
+
+# Respuesta fija del generador SCL: la forma que se espera de GPT-4 para "marcha paro".
+SCL_SIMULADO = """IF "Tag_1" AND NOT "Tag_2" THEN
+    "Tag_3" := TRUE;
+ELSIF "Tag_2" THEN
+    "Tag_3" := FALSE;
+END_IF;
+"""
+
+
+class ClienteOpenAISimulado:
+    """
+    Sustituto local de `openai.OpenAI` para `client.chat.completions.create(...)`.
+    Devuelve siempre `respuesta` tras `latencia` segundos y cuenta las llamadas. Con
+    `stream=True` la entrega en fragmentos de `tamano_fragmento` caracteres, con el consumo de
+    tokens en el último, como hace la API.
+    """
+
+    def __init__(self, respuesta: str = SCL_SIMULADO, latencia: float = 0.0, tamano_fragmento: int = 16):
+        self.respuesta = respuesta
+        self.latencia = latencia
+        self.tamano_fragmento = tamano_fragmento
+        self.llamadas = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._crear))
+
+    def _crear(self, stream: bool = False, **kwargs):
+        self.llamadas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        uso = SimpleNamespace(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+        if stream:
+            return self._fragmentos(self.respuesta, uso)
+        mensaje = SimpleNamespace(content=self.respuesta, role="assistant")
+        return SimpleNamespace(choices=[SimpleNamespace(message=mensaje, finish_reason="stop")], usage=uso)
+
+    def _fragmentos(self, respuesta: str, uso):
+        for i in range(0, len(respuesta), self.tamano_fragmento):
+            delta = SimpleNamespace(content=respuesta[i:i + self.tamano_fragmento], role="assistant")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)], usage=None)
+        yield SimpleNamespace(choices=[], usage=uso)
+
+
+def plan_simulado(nombres) -> str:
+    """Plan JSON como el que devuelve el agente: clic en cada plantilla y "texto" en la tercera."""
+    pasos = [{"step": nombre, "action": "texto" if i == 2 else "clic"} for i, nombre in enumerate(nombres)]
+    return json.dumps(pasos)
+
+
+def instalar(nombres_plan, latencia_plan: float = 0.0, latencia_scl: float = 0.0):
+    """
+    Sustituye los clientes LLM de agente_instrucciones y generador_scl por versiones locales
+    (la misma capa de script/cliente_llm.py, sobre clientes OpenAI simulados).
+
+    Como ambos módulos exigen OPENAI_API_KEY al importarse, se define una clave ficticia si no
+    hay ninguna. Desactiva también la caché de respuestas y la biblioteca de planes para que
+    cada medición pase por el cliente.
+
+    Returns:
+        tuple: (cliente OpenAI simulado del plan, cliente OpenAI simulado del SCL).
+    """
+    os.environ.setdefault("OPENAI_API_KEY", "sk-simulada")
+    os.environ["PLCAID_SIN_CACHE"] = "1"
+    os.environ["PLCAID_SIN_BIBLIOTECA"] = "1"
+
+    from script import agente_instrucciones, generador_scl
+    from script.cliente_llm import ClienteLLM
+
+    cliente_plan = ClienteOpenAISimulado(plan_simulado(nombres_plan), latencia=latencia_plan)
+    cliente_scl = ClienteOpenAISimulado(latencia=latencia_scl)
+    agente_instrucciones.cliente = ClienteLLM("plan", cliente=cliente_plan)
+    generador_scl.cliente = ClienteLLM("scl", cliente=cliente_scl)
+    return cliente_plan, cliente_scl
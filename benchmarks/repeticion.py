@@ -0,0 +1,107 @@
+import os
+import glob
+import time
+import itertools
+import threading
+
+import cv2
+import numpy as np
+
+from script.captura import Captura
+from script.plantillas import obtener_almacen
+
+
+class CapturadorRepeticion:
+    """
+    Capturador que reproduce pantallas grabadas en lugar de capturar el monitor real.
+
+    Ofrece la misma interfaz que script.captura.Capturador, así que se puede registrar con
+    `registrar_capturador` y el resto del flujo (búsqueda, anticipación, espera de pantalla)
+    funciona sin escritorio. Los fotogramas se devuelven en bucle.
+
+    Args:
+        fotogramas (list): Arrays BGR de la misma resolución.
+        monitor_id (int): Monitor al que sustituye.
+        left, top (int): Posición del monitor en el escritorio virtual.
+    """
+
+    def __init__(self, fotogramas, monitor_id: int = 1, left: int = 0, top: int = 0):
+        if not fotogramas:
+            raise ValueError("Se necesita al menos un fotograma para la repetición.")
+        alto, ancho = fotogramas[0].shape[:2]
+        self.fotogramas = fotogramas
+        self.monitor_id = monitor_id
+        self.monitor = {"left": left, "top": top, "width": ancho, "height": alto}
+        self._ciclo = itertools.cycle(range(len(fotogramas)))
+        self._lock = threading.Lock()
+        self.capturas = 0
+
+    @classmethod
+    def desde_directorio(cls, directorio: str, monitor_id: int = 1):
+        """Carga las capturas grabadas (*.png) de un directorio, en orden alfabético."""
+        rutas = sorted(glob.glob(os.path.join(directorio, "*.png")))
+        return cls([cv2.imread(ruta, cv2.IMREAD_COLOR) for ruta in rutas], monitor_id)
+
+    @property
+    def resolucion(self):
+        return self.monitor["width"], self.monitor["height"]
+
+    def capturar(self, region=None, copia: bool = False) -> Captura:
+        with self._lock:
+            color = self.fotogramas[next(self._ciclo)]
+            self.capturas += 1
+        left, top = self.monitor["left"], self.monitor["top"]
+        if region is not None:
+            x, y, w, h = (int(v) for v in region)
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(color.shape[1], x + w), min(color.shape[0], y + h)
+            if x1 <= x0 or y1 <= y0:
+                raise ValueError(f"La región {region} queda fuera del monitor {self.monitor_id}.")
+            color = color[y0:y1, x0:x1]
+            left, top = left + x0, top + y0
+        return Captura(color.copy() if copia else color, left, top, self.monitor_id)
+
+
+def pantalla_sintetica(ancho: int, alto: int, nombres, semilla: int = 0, almacen=None):
+    """
+    Genera un escritorio sintético de ancho x alto con las plantillas `nombres` (del almacén
+    dado o del compartido) pegadas en posiciones conocidas sobre un fondo con textura, para que
+    la correlación no sea trivial.
+
+    Returns:
+        tuple: (array BGR, dict nombre -> (left, top)).
+    """
+    rng = np.random.default_rng(semilla)
+    fondo = rng.integers(0, 256, (max(1, alto // 8), max(1, ancho // 8), 3), dtype=np.uint8)
+    pantalla = cv2.resize(cv2.GaussianBlur(fondo, (3, 3), 0), (ancho, alto), interpolation=cv2.INTER_NEAREST)
+
+    almacen = almacen or obtener_almacen()
+    posiciones = {}
+    ocupadas = []
+    for nombre in nombres:
+        plantilla = almacen.plantilla(nombre).color[0]
+        alto_p, ancho_p = plantilla.shape[:2]
+        if alto_p >= alto or ancho_p >= ancho:
+            continue
+        # Sin solapes, para que ninguna plantilla tape a otra y el acierto sea comprobable.
+        for _ in range(200):
+            x = int(rng.integers(0, ancho - ancho_p))
+            y = int(rng.integers(0, alto - alto_p))
+            if all(x + ancho_p <= ox or ox + ow <= x or y + alto_p <= oy or oy + oh <= y
+                   for ox, oy, ow, oh in ocupadas):
+                break
+        else:
+            continue
+        pantalla[y:y + alto_p, x:x + ancho_p] = plantilla
+        ocupadas.append((x, y, ancho_p, alto_p))
+        posiciones[nombre] = (x, y)
+    return pantalla, posiciones
+
+
+def grabar(capturador, directorio: str, cantidad: int = 10, intervalo: float = 1.0):
+    """Graba `cantidad` capturas reales del monitor en `directorio` para reproducirlas después."""
+    os.makedirs(directorio, exist_ok=True)
+    for i in range(cantidad):
+        captura = capturador.capturar(copia=True)
+        cv2.imwrite(os.path.join(directorio, f"pantalla_{i:04d}.png"), captura.color)
+        time.sleep(intervalo)
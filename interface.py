@@ -1,30 +1,35 @@
 import streamlit as st
 import sys
 import os
+import time
 import subprocess
-import speech_recognition as sr
 from mss import mss
 
+from script.servicio import arrancar_servicio, enviar_trabajo, ServicioOcupado
+from script.trazas import resumir, ultima_traza
+from script.voz import obtener_escucha
+
 # --- Funciones Auxiliares ---
 
-# Función para grabar audio y convertir a texto
-def transcribir_audio():
-    r = sr.Recognizer()
-    with sr.Microphone() as source:
-        st.info("🎙️ Hablando... (esperando voz)")
-        # Ajustar para ruido ambiental para mejor reconocimiento
-        r.adjust_for_ambient_noise(source) 
-        try:
-            audio = r.listen(source, timeout=5, phrase_time_limit=10) # Añadir timeouts
-            texto = r.recognize_google(audio, language="es-ES")
-            return texto
-        except sr.UnknownValueError:
-            st.error("No se entendió el audio. Por favor, intenta de nuevo.")
-        except sr.RequestError as e:
-            st.error(f"Error en el servicio de reconocimiento de voz: {e}. Revisa tu conexión a internet.")
-        except Exception as e:
-            st.error(f"Ocurrió un error inesperado durante la transcripción: {e}")
-    return ""
+# Escuchar en segundo plano mostrando la transcripción parcial hasta que el operador calle
+def transcribir_en_vivo(escucha, silencio_fin=2.0, maximo=30.0):
+    parcial = st.empty()
+    inicio = time.monotonic()
+    # La escucha termina sola tras `silencio_fin` segundos sin voz (o con el botón Terminar,
+    # que vuelve a ejecutar el script e interrumpe este bucle).
+    while escucha.activa:
+        parcial.info(f"🎙️ {escucha.texto() or 'Esperando voz...'}")
+        if escucha.silencio() > silencio_fin and not escucha.pendientes and escucha.texto():
+            escucha.detener()
+        elif time.monotonic() - inicio > maximo:
+            escucha.detener()
+        time.sleep(0.2)
+    if not escucha.esperar_pendientes():
+        st.warning("El reconocimiento de voz no terminó a tiempo; se usa la transcripción parcial.")
+    parcial.empty()
+    for error in escucha.errores:
+        st.error(f"Error en el servicio de reconocimiento de voz: {error}. Revisa tu conexión a internet o cambia de motor (PLCAID_MOTOR_VOZ).")
+    return escucha.texto()
 
 # Obtener monitores disponibles
 def obtener_monitores():
@@ -34,6 +39,91 @@ def obtener_monitores():
         monitors_list = sct.monitors[1:] 
         return monitors_list
 
+# Resumen de tiempos de la traza de una ejecución (LLM, capturas, búsquedas, acciones, pasos)
+def mostrar_traza(ruta_jsonl):
+    if not ruta_jsonl or not os.path.exists(ruta_jsonl):
+        return
+    with st.expander("⏱️ Tiempos de la ejecución"):
+        st.dataframe(resumir(ruta_jsonl), use_container_width=True)
+        st.caption(f"Traza completa: {ruta_jsonl} (el .trace.json se abre en chrome://tracing o ui.perfetto.dev)")
+
+# Ejecutar la orden en el servicio persistente mostrando el progreso en vivo
+def ejecutar_en_servicio(orden, monitor_id, reanudar=True):
+    st.info(f"Enviando la orden al servicio de ejecución para el monitor ID: {monitor_id}: '{orden}'...")
+    barra = st.progress(0.0, text="En cola...")
+    estado = st.empty()
+    ruta_traza = None
+    try:
+        for evento in enviar_trabajo(orden, monitor_id, reanudar=reanudar):
+            tipo = evento.get("evento")
+            if tipo == "encolado":
+                barra.progress(0.0, text=f"En cola (posición {evento['posicion']})...")
+            elif tipo == "inicio":
+                barra.progress(0.0, text="Generando plan y código SCL...")
+            elif tipo == "plan":
+                reutilizado = evento.get("biblioteca")
+                if reutilizado:
+                    # Que el operador vea que no se ha consultado al LLM y de qué orden viene el plan.
+                    estado.warning(f"Plan con {evento['total']} pasos reutilizado de la biblioteca, sin consultar al LLM: "
+                                   f"viene de la orden '{reutilizado.get('orden', '?')}' (similitud {reutilizado['similitud']:.2f}).")
+                else:
+                    estado.info(f"Plan con {evento['total']} pasos.")
+            elif tipo == "reanudar":
+                estado.info(f"Se reanuda la ejecución anterior en el paso {evento['paso']}/{evento['total']}.")
+            elif tipo == "paso_inicio":
+                barra.progress((evento["paso"] - 1) / evento["total"],
+                               text=f"Paso {evento['paso']}/{evento['total']}: {evento['action']} en {evento['step']}")
+            elif tipo == "paso_fin":
+                barra.progress(evento["paso"] / evento["total"], text=f"Paso {evento['paso']}/{evento['total']} completado")
+            elif tipo == "reintento":
+                estado.warning(f"Reintento {evento['reintento']} del paso {evento['paso']} (quedan {evento['restante_s']:.0f} s): {evento['error']}")
+            elif tipo == "traza":
+                ruta_traza = evento["jsonl"]
+            elif tipo == "fin":
+                if evento["ok"]:
+                    barra.progress(1.0, text="Flujo completado")
+                    st.success(f"✅ Flujo completado en {evento.get('duracion', 0):.1f} s.")
+                else:
+                    st.error(f"❌ El flujo falló: {evento['error']}")
+    except Exception as e:
+        st.error(f"❌ Ocurrió un error inesperado al comunicar con el servicio: {e}")
+    mostrar_traza(ruta_traza)
+
+# Ejecutar la orden lanzando main.py como subproceso (modo sin servicio)
+def ejecutar_con_subproceso(orden, monitor_id, reanudar=True):
+    # Preparar las variables de entorno para el subproceso
+    env = os.environ.copy()
+    env["MONITOR_ID"] = str(monitor_id)
+
+    # La raíz del proyecto es el mismo directorio donde se encuentra interface.py
+    project_root = os.path.dirname(os.path.abspath(__file__))
+    main_script_path = os.path.join(project_root, "main.py")
+    try:
+        st.info(f"Lanzando main.py para el monitor ID: {monitor_id} con la orden: '{orden}'...")
+
+        # El cwd del subproceso es la raíz del proyecto para que main.py encuentre
+        # sus propios archivos relativos (input_text, parsed_steps, script).
+        subprocess.run(
+            [sys.executable, main_script_path] + ([] if reanudar else ["--de-cero"]),
+            env=env,
+            check=True,
+            capture_output=False, # Permite que la salida de main.py se imprima directamente en la consola
+            text=True,
+            cwd=project_root
+        )
+
+        st.success("✅ Flujo lanzado con éxito. Revisa la consola para la salida de main.py.")
+        mostrar_traza(ultima_traza())
+
+    except subprocess.CalledProcessError as e:
+        st.error(f"❌ Error al ejecutar main.py (Código de salida: {e.returncode}): {e}")
+        if e.stdout: st.code(e.stdout)
+        if e.stderr: st.code(e.stderr)
+    except FileNotFoundError:
+        st.error(f"❌ Error: No se encontró el archivo '{main_script_path}'. Asegúrate de que el archivo 'main.py' exista en la raíz del proyecto.")
+    except Exception as e:
+        st.error(f"❌ Ocurrió un error inesperado: {e}")
+
 # --- Inicialización del Estado de Sesión de Streamlit ---
 # Se utiliza st.session_state para mantener el estado de la aplicación a través de las reruns.
 if 'current_order' not in st.session_state:
@@ -69,15 +159,24 @@ if st.session_state.input_mode == "Texto":
         key="text_input_area" # Clave única para el widget
     )
 elif st.session_state.input_mode == "Voz":
-    # Botón para iniciar la grabación de voz
-    if st.button("🎤 Grabar orden por voz", key="record_voice_button"):
-        with st.spinner("Escuchando... por favor, habla."):
-            transcribed_text = transcribir_audio()
-            if transcribed_text:
-                st.session_state.current_order = transcribed_text
-                st.success(f"Transcripción completada.")
-            else:
-                st.warning("No se pudo transcribir la voz.")
+    # El micrófono se escucha en segundo plano: el Recognizer y su calibración se reutilizan entre grabaciones.
+    escucha = obtener_escucha()
+    col_grabar, col_terminar = st.columns(2)
+    if col_grabar.button("🎤 Grabar orden por voz", key="record_voice_button", disabled=escucha.activa):
+        try:
+            escucha.iniciar()
+        except Exception as e:
+            st.error(f"No se pudo abrir el micrófono: {e}")
+    terminar = col_terminar.button("⏹️ Terminar", key="stop_voice_button", disabled=not escucha.activa)
+    if terminar:
+        escucha.detener()
+    if escucha.activa or escucha.pendientes or terminar:
+        transcribed_text = transcribir_en_vivo(escucha)
+        if transcribed_text:
+            st.session_state.current_order = transcribed_text
+            st.success(f"Transcripción completada.")
+        else:
+            st.warning("No se pudo transcribir la voz.")
     
     # Mostrar el texto transcrito en un área de texto editable
     # El valor se toma de st.session_state.current_order, permitiendo al usuario editarlo.
@@ -106,6 +205,9 @@ else:
     # Actualizar el índice del monitor en el estado de sesión
     st.session_state.selected_monitor_idx = selected_monitor_index
 
+# Si la misma orden falló antes, el flujo se reanuda desde el diario salvo que se pida empezar de cero.
+de_cero = st.checkbox("🔄 Empezar de cero (no reanudar una ejecución anterior de esta orden)", key="fresh_run_checkbox")
+
 # --- Botón de Ejecución del Flujo ---
 if st.button("🚀 Ejecutar flujo", key="execute_flow_button"):
     # La orden a ejecutar siempre se toma de st.session_state.current_order
@@ -119,42 +221,16 @@ if st.button("🚀 Ejecutar flujo", key="execute_flow_button"):
         with open(input_path, "w", encoding="utf-8") as f:
             f.write(orden_a_ejecutar)
         
-        # Preparar las variables de entorno para el subproceso
-        env = os.environ.copy()
-        # El ID real del monitor para mss es selected_monitor_index + 1
-        env["MONITOR_ID"] = str(selected_monitor_index + 1) 
-        
+        # El flujo se ejecuta en el servicio persistente (clientes y plantillas ya cargados);
+        # solo si no hay nada escuchando y no se puede arrancar, se recurre a lanzar main.py.
+        # Con un servicio ocupado no se lanza nada: dos flujos a la vez se pelearían por el escritorio.
         try:
-            st.info(f"Lanzando main.py para el monitor ID: {selected_monitor_index + 1} con la orden: '{orden_a_ejecutar}'...")
-            
-            # --- CAMBIO CRUCIAL AQUÍ: Construcción de la ruta a main.py y cwd ---
-            # Obtener el directorio del script actual (interface.py)
-            current_script_dir = os.path.dirname(os.path.abspath(__file__))
-            # La raíz del proyecto es el mismo directorio donde se encuentra interface.py
-            project_root = current_script_dir 
-            # Construir la ruta absoluta a main.py
-            main_script_path = os.path.join(project_root, "main.py")
-
-            # Ejecutar main.py como un subproceso
-            # El cwd (current working directory) del subproceso se establece a la raíz del proyecto.
-            # Esto asegura que main.py pueda encontrar sus propios archivos relativos (input_text, parsed_steps, script).
-            result = subprocess.run(
-                [sys.executable, main_script_path], 
-                env=env, 
-                check=True, 
-                capture_output=False, # Permite que la salida de main.py se imprima directamente en la consola
-                text=True,
-                cwd=project_root # <-- CWD ajustado a la raíz del proyecto
-            )
-
-            st.success("✅ Flujo lanzado con éxito. Revisa la consola para la salida de main.py.")
-            
-        except subprocess.CalledProcessError as e:
-            st.error(f"❌ Error al ejecutar main.py (Código de salida: {e.returncode}): {e}")
-            if e.stdout: st.code(e.stdout)
-            if e.stderr: st.code(e.stderr)
-        except FileNotFoundError:
-            st.error(f"❌ Error: No se encontró el archivo '{main_script_path}'. Asegúrate de que el archivo 'main.py' exista en la raíz del proyecto.")
-        except Exception as e:
-            st.error(f"❌ Ocurrió un error inesperado: {e}")
-
+            servicio_listo = arrancar_servicio()
+        except ServicioOcupado as e:
+            servicio_listo = None
+            st.warning(f"⏳ {e}")
+        if servicio_listo:
+            ejecutar_en_servicio(orden_a_ejecutar, selected_monitor_index + 1, reanudar=not de_cero)
+        elif servicio_listo is False:
+            st.warning("No se pudo arrancar el servicio de ejecución; se lanza main.py directamente.")
+            ejecutar_con_subproceso(orden_a_ejecutar, selected_monitor_index + 1, reanudar=not de_cero)
@@ -1,18 +1,27 @@
 import os
 import json
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
+from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.exceptions import OutputParserException
 from dotenv import load_dotenv
 
+from script.cache_llm import obtener_cache, normalizar_orden, huella_texto
+from script.trazas import span
+from script.indice_ui import obtener_indice
+from script.biblioteca_planes import obtener_biblioteca
+from script.cliente_llm import ClienteLLM, ErrorPrefijo
+
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 
 if not api_key:
     raise ValueError("La variable de entorno OPENAI_API_KEY no está configurada.")
 
-llm = ChatOpenAI(model_name="gpt-4", temperature=0.1, openai_api_key=api_key)
+MODELO = "gpt-4"
+TEMPERATURA = 0.1
+
+# Cliente con pool de conexiones, plazo, reintentos, cobertura y streaming (script/cliente_llm.py).
+cliente = ClienteLLM("plan")
 
 PROMPT_SYSTEM = """
 Eres un experto en automatización de interfaces de usuario para PLC Siemens TIA Portal y sistemas Windows.
@@ -29,7 +38,7 @@ En un monitor genérico, se muestra una interfaz de software, posiblemente TIA P
 **Reglas para la generación del JSON:**
 1.  **Formato de Salida**: Una lista de objetos JSON.
 2.  **Estructura de Cada Paso**: Cada objeto de paso debe tener EXACTAMENTE dos claves:
-    * `"step"`: Una cadena de texto que representa el nombre de un archivo de imagen (recorte de pantalla) para ese paso. Estos nombres deben ser secuenciales y descriptivos, como "i1.png", "i2.png", "i3.png", etc. Se asume que estas imágenes existen o se generarán.
+    * `"step"`: El ID de uno de los elementos de pantalla disponibles (lista "Elementos de pantalla disponibles" más abajo), por ejemplo "i1.png". Si ningún elemento de la lista encaja con el paso, escribe en su lugar una descripción breve del elemento sobre el que actuar (por ejemplo, "botón Compilar de la barra de herramientas").
     * `"action"`: Una cadena de texto que indica la acción a realizar. Los ÚNICOS valores permitidos son: `"clic"` o `"texto"`.
 3.  **Campo Adicional para 'texto'**: **IMPORTANTE**: Para la acción "texto", el JSON NO DEBE incluir un campo "value". El texto a escribir será determinado por otro módulo (`generador_scl.py`) más adelante en el flujo de ejecución.
 4.  **No explicaciones**: No incluyas ninguna explicación, texto adicional, comentarios, o formato de markdown aparte del JSON. Tu respuesta debe ser el JSON puro y nada más.
@@ -43,44 +52,138 @@ En un monitor genérico, se muestra una interfaz de software, posiblemente TIA P
 ]
 """
 
-def generar_json_desde_orden(orden: str, monitor_id: int = 1):
-    print(f"DEBUG Agente: Función generar_json_desde_orden iniciada con orden: '{orden[:50]}...' y monitor: {monitor_id}")
+PLANTILLA_PROMPT = "{format_instructions}\n{system_prompt}\nElementos de pantalla disponibles (ID: descripción):\n{catalogo}\nOrden del operador: {orden_input}\nMonitor seleccionado: {monitor_id_input}\n"
+
+def validar_prefijo_json(texto: str):
+    """Corta la respuesta en cuanto se ve que no empieza por un JSON (admite un bloque ```json)."""
+    inicio = texto.lstrip()
+    if inicio.startswith("```"):
+        if "\n" not in inicio:
+            return
+        inicio = inicio.split("\n", 1)[1].lstrip()
+    if inicio and inicio[0] not in "[{":
+        raise ValueError(f"la respuesta no empieza por un JSON: {inicio[:60]!r}")
+
+def guardar_steps(result_json, path: str = None):
+    """Escribe el plan en `path` (por defecto, parsed_steps/steps.json)."""
+    path = path or os.path.join("parsed_steps", "steps.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result_json, f, indent=2, ensure_ascii=False)
+    print("DEBUG Agente: Archivo steps.json guardado correctamente.")
+
+def plan_de_biblioteca(orden: str, monitor_id: int = 1):
+    """
+    Busca en la biblioteca un plan ya ejecutado con éxito para una orden parecida del mismo
+    monitor, cuyos elementos sigan todos en capture/. Devuelve el plan (con la clave
+    "biblioteca": identificador, similitud y orden original) o None.
+    """
+    indice = obtener_indice()
+    with span("biblioteca_planes", "llm") as traza:
+        encontrado = obtener_biblioteca().buscar(
+            orden, monitor_id, valido=lambda pasos: all(indice.elemento(p.get("step")) is not None for p in pasos))
+        traza["acierto"] = encontrado is not None
+        if encontrado is not None:
+            traza["similitud"] = round(encontrado[2], 3)
+    if encontrado is None:
+        return None
+    identificador, pasos, similitud, orden_original = encontrado
+    print(f"DEBUG Agente: Plan reutilizado de la biblioteca ('{orden_original.strip()[:50]}', similitud {similitud:.2f}), sin llamar al LLM.")
+    return {"orden_input": orden, "monitor_id_input": monitor_id, "text": pasos,
+            "biblioteca": {"id": identificador, "similitud": round(similitud, 3), "orden": orden_original}}
+
+def _clave_plan(orden: str, monitor_id: int, format_instructions: str, catalogo: str) -> str:
+    # La clave cubre todo lo que cambia la respuesta: orden, monitor, prompt (con el catálogo), modelo y temperatura.
+    return obtener_cache().clave(
+        funcion="plan",
+        orden=normalizar_orden(orden),
+        monitor_id=int(monitor_id),
+        prompt=huella_texto(PLANTILLA_PROMPT + format_instructions + PROMPT_SYSTEM + catalogo),
+        modelo=MODELO,
+        temperatura=TEMPERATURA,
+    )
+
+def clave_plan(orden: str, monitor_id: int = 1) -> str:
+    """Clave de la caché de respuestas para el plan de `orden` con el prompt y el catálogo actuales."""
+    return _clave_plan(orden, monitor_id, JsonOutputParser().get_format_instructions(), obtener_indice().catalogo())
+
+def guardar_plan_validado(orden: str, monitor_id: int, plan: dict):
+    """
+    Guarda en la caché de respuestas un plan que se ha ejecutado entero sin fallos. Los planes
+    solo se guardan así, nunca al recibirlos del LLM: un plan equivocado no se reutiliza.
+    """
+    obtener_cache().guardar(clave_plan(orden, monitor_id), plan, funcion="plan")
+
+def invalidar_plan(orden: str, monitor_id: int = 1):
+    """Borra de la caché de respuestas el plan de `orden` (por ejemplo, si su flujo ha fallado)."""
+    obtener_cache().invalidar(clave_plan(orden, monitor_id))
+
+def generar_plan(orden: str, monitor_id: int = 1, usar_cache: bool = True) -> dict:
+    """
+    Pide al LLM (o recupera de la caché o de la biblioteca de planes) el plan de pasos de la
+    orden, sin escribir steps.json. Devuelve el mismo diccionario que se guarda en steps.json
+    (pasos bajo la clave "text"); si el plan viene de la biblioteca, lleva además la clave
+    "biblioteca".
+
+    El plan del LLM no se guarda en la caché aquí: lo hace guardar_plan_validado cuando el
+    flujo termina bien.
+    """
+    print(f"DEBUG Agente: Función generar_plan iniciada con orden: '{orden[:50]}...' y monitor: {monitor_id}")
 
     parser = JsonOutputParser()
+    format_instructions = parser.get_format_instructions()
+    # Elementos de capture/ a los que puede referirse el plan, por ID o por descripción.
+    catalogo = obtener_indice().catalogo()
+
+    cache = obtener_cache()
+    clave = _clave_plan(orden, monitor_id, format_instructions, catalogo)
+    cacheado = cache.obtener(clave) if usar_cache else None
+    if cacheado is not None:
+        print("DEBUG Agente: Plan recuperado de la caché, sin llamar al LLM.")
+        with span("llm.plan", "llm", modelo=MODELO, cache=True):
+            return dict(cacheado, orden_input=orden)
+
+    plan = plan_de_biblioteca(orden, monitor_id) if usar_cache else None
+    if plan is not None:
+        return plan
 
     prompt = PromptTemplate(
-        template="{format_instructions}\n{system_prompt}\nOrden del operador: {orden_input}\nMonitor seleccionado: {monitor_id_input}\n",
+        template=PLANTILLA_PROMPT,
         input_variables=["orden_input", "monitor_id_input"],
-        partial_variables={"format_instructions": parser.get_format_instructions(), "system_prompt": PROMPT_SYSTEM}
+        partial_variables={"format_instructions": format_instructions, "system_prompt": PROMPT_SYSTEM, "catalogo": catalogo}
     )
+    texto_prompt = prompt.format(orden_input=orden, monitor_id_input=monitor_id)
 
-    chain = LLMChain(llm=llm, prompt=prompt, output_parser=parser)
-
-    print("DEBUG Agente: Invocando la cadena LLM para generar JSON...")
+    print("DEBUG Agente: Pidiendo al LLM el JSON de pasos...")
+    texto = None
     try:
-        result_json = chain.invoke({
-            "orden_input": orden,
-            "monitor_id_input": monitor_id
-        })
+        with span("llm.plan", "llm", modelo=MODELO, cache=False) as traza:
+            respuesta = cliente.completar([{"role": "user", "content": texto_prompt}], MODELO, TEMPERATURA,
+                                          validar_prefijo=validar_prefijo_json)
+            traza.update(respuesta.tokens())
+        texto = respuesta.texto
+        # Misma forma que devolvía LLMChain: entradas más los pasos bajo "text".
+        result_json = {"orden_input": orden, "monitor_id_input": monitor_id, "text": parser.parse(texto)}
 
         print(f"DEBUG Agente: JSON generado y parseado (primeros 200 caracteres):\n{json.dumps(result_json, indent=2, ensure_ascii=False)[:200]}...")
+        return result_json
 
-        path = os.path.join("parsed_steps", "steps.json")
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(result_json, f, indent=2, ensure_ascii=False)
-        print("DEBUG Agente: Archivo steps.json guardado correctamente.")
-        
-        return "steps.json generado y guardado exitosamente."
-
-    except json.JSONDecodeError as e:
-        try:
-            raw_output = chain.invoke({"orden_input": orden, "monitor_id_input": monitor_id}, return_only_outputs=True)
-        except Exception:
-            raw_output = "No se pudo obtener la salida cruda del LLM."
+    except (ErrorPrefijo, OutputParserException) as e:
+        # La salida cruda ya está aquí: no hace falta volver a invocar al modelo para mostrarla.
+        raw_output = e.texto if isinstance(e, ErrorPrefijo) else texto
         print(f"ERROR Agente: El LLM no generó un JSON válido: {e}. Output crudo: {raw_output}")
         raise ValueError(f"Fallo al generar JSON válido: {e}. Revisa el prompt y la capacidad del LLM.")
     except Exception as e:
-        print(f"ERROR Agente: Fallo en la invocación de la cadena LLM o al guardar el archivo: {e}")
-        raise
\ No newline at end of file
+        print(f"ERROR Agente: Fallo en la llamada al LLM: {e}")
+        raise
+
+def generar_json_desde_orden(orden: str, monitor_id: int = 1, usar_cache: bool = True):
+    print(f"DEBUG Agente: Función generar_json_desde_orden iniciada con orden: '{orden[:50]}...' y monitor: {monitor_id}")
+    result_json = generar_plan(orden, monitor_id, usar_cache)
+    try:
+        guardar_steps(result_json)
+    except Exception as e:
+        print(f"ERROR Agente: Fallo al guardar el archivo: {e}")
+        raise
+    return "steps.json generado y guardado exitosamente."
\ No newline at end of file
@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import difflib
+import threading
+
+import numpy as np
+
+from script.cache_llm import normalizar_orden, huella_texto
+from script.indice_ui import vector_texto, palabras_clave, DIMENSION_TEXTO
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BIBLIOTECA_PATH = os.path.join(project_root, "cache", "biblioteca_planes.json")
+
+
+def _palabra_equivalente(palabra: str, otras: list) -> bool:
+    """
+    True si `palabra` está en `otras`, admitiendo faltas de ortografía en las palabras largas.
+    Las cortas ("no", "sin", "ni") tienen que coincidir exactamente.
+    """
+    if palabra in otras:
+        return True
+    if len(palabra) < 4:
+        return False
+    return any(len(otra) >= 4 and difflib.SequenceMatcher(None, palabra, otra).ratio() >= 0.8 for otra in otras)
+
+
+def misma_intencion(orden_a: str, orden_b: str) -> bool:
+    """
+    Compara dos órdenes palabra a palabra (sin artículos ni preposiciones): cada palabra de una
+    tiene que estar en la otra, quizá mal escrita. La similitud de trigramas sola da por
+    parecidas "enciende el motor" y "apaga el motor" o "con enclavamiento" y "sin enclavamiento".
+    """
+    palabras_a, palabras_b = palabras_clave(orden_a), palabras_clave(orden_b)
+    return all(_palabra_equivalente(p, palabras_b) for p in palabras_a) and \
+        all(_palabra_equivalente(p, palabras_a) for p in palabras_b)
+
+
+class BibliotecaPlanes:
+    """
+    Planes de pasos ya ejecutados con éxito, para reutilizarlos con órdenes parecidas sin
+    llamar al LLM.
+
+    Cada plan se guarda con su orden, su monitor y un vector de trigramas de la orden (el
+    mismo que usa el índice de elementos de capture/). Una orden nueva se compara con todas a
+    la vez (producto matriz-vector) y se reutiliza el plan más parecido del mismo monitor si la
+    similitud coseno llega a `umbral` y además las dos órdenes tienen las mismas palabras
+    (verbos y negaciones incluidos, ver `misma_intencion`). Los planes que fallan más veces de
+    las que funcionan se descartan.
+
+    Args:
+        ruta (str): Archivo JSON de la biblioteca.
+        umbral (float): Similitud mínima (0-1) para reutilizar un plan. PLCAID_UMBRAL_PLAN.
+        max_planes (int): Planes máximos; se descartan los usados hace más tiempo.
+        activa (bool, optional): False para no usarla. PLCAID_SIN_BIBLIOTECA=1 la desactiva.
+    """
+
+    def __init__(self, ruta: str = BIBLIOTECA_PATH, umbral: float = None, max_planes: int = 500,
+                 activa: bool = None):
+        self.ruta = ruta
+        self.umbral = umbral if umbral is not None else float(os.getenv("PLCAID_UMBRAL_PLAN", "0.9"))
+        self.max_planes = max_planes
+        self.activa = activa if activa is not None else os.getenv("PLCAID_SIN_BIBLIOTECA", "0") != "1"
+        self._planes = {}
+        self._matriz = None
+        self._lock = threading.Lock()
+        self._cargar()
+
+    @staticmethod
+    def identificador(orden: str, monitor_id: int) -> str:
+        return huella_texto(f"{int(monitor_id)}|{normalizar_orden(orden)}")[:16]
+
+    def _cargar(self):
+        if not os.path.exists(self.ruta):
+            return
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                self._planes = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"DEBUG Biblioteca: biblioteca de planes ignorada ({e}).")
+            self._planes = {}
+
+    def _guardar(self):
+        with self._lock:
+            if len(self._planes) > self.max_planes:
+                antiguos = sorted(self._planes, key=lambda i: self._planes[i]["usado"])
+                for identificador in antiguos[:len(self._planes) - self.max_planes]:
+                    del self._planes[identificador]
+                self._matriz = None
+            datos = json.dumps(self._planes, ensure_ascii=False, indent=1)
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        temporal = f"{self.ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(datos)
+        os.replace(temporal, self.ruta)
+
+    def _construir_matriz(self):
+        with self._lock:
+            if self._matriz is None:
+                ids = list(self._planes)
+                vectores = np.array([vector_texto(self._planes[i]["orden"]) for i in ids], dtype=np.float32)
+                self._matriz = (ids, vectores.reshape(len(ids), DIMENSION_TEXTO),
+                                np.array([self._planes[i]["monitor_id"] for i in ids], dtype=np.int64))
+            return self._matriz
+
+    def __len__(self):
+        return len(self._planes)
+
+    def buscar(self, orden: str, monitor_id: int, valido=None):
+        """
+        Plan más parecido a `orden` para el mismo monitor.
+
+        Args:
+            orden (str): Orden del operador.
+            monitor_id (int): Solo se reutilizan planes de este monitor.
+            valido (callable, optional): Recibe los pasos y devuelve False si el plan ya no se
+                                         puede usar (por ejemplo, si falta alguna plantilla).
+
+        Returns:
+            tuple | None: (identificador, pasos, similitud, orden original) o None si ninguno
+                          llega al umbral con la misma intención.
+        """
+        if not self.activa or not self._planes:
+            return None
+        ids, vectores, monitores = self._construir_matriz()
+        similitudes = vectores @ vector_texto(orden)
+        similitudes[monitores != int(monitor_id)] = -1.0
+        for i in np.argsort(-similitudes)[:5]:
+            if similitudes[i] < self.umbral:
+                break
+            with self._lock:
+                plan = self._planes.get(ids[i])
+            if plan is None or not misma_intencion(orden, plan["orden"]):
+                continue
+            if valido is not None and not valido(plan["pasos"]):
+                continue
+            return ids[i], plan["pasos"], float(similitudes[i]), plan["orden"]
+        return None
+
+    def agregar(self, orden: str, monitor_id: int, pasos: list) -> str:
+        """Guarda (o refuerza) el plan de una ejecución correcta. Devuelve su identificador."""
+        if not self.activa:
+            return None
+        identificador = self.identificador(orden, monitor_id)
+        ahora = time.time()
+        with self._lock:
+            plan = self._planes.get(identificador)
+            if plan is None or plan["pasos"] != pasos:
+                self._planes[identificador] = {"orden": orden, "monitor_id": int(monitor_id), "pasos": pasos,
+                                               "exitos": 1, "fallos": 0, "creado": ahora, "usado": ahora}
+                self._matriz = None
+            else:
+                plan["exitos"] += 1
+                plan["usado"] = ahora
+        self._guardar()
+        return identificador
+
+    def registrar_resultado(self, identificador: str, ok: bool):
+        """Anota el resultado de reutilizar un plan; se descarta si falla más de lo que funciona."""
+        if not self.activa:
+            return
+        with self._lock:
+            plan = self._planes.get(identificador)
+            if plan is None:
+                return
+            plan["usado"] = time.time()
+            plan["exitos" if ok else "fallos"] += 1
+            if plan["fallos"] > plan["exitos"]:
+                print(f"DEBUG Biblioteca: se descarta el plan de '{plan['orden']}' ({plan['fallos']} fallos).")
+                del self._planes[identificador]
+                self._matriz = None
+        self._guardar()
+
+
+_biblioteca = None
+_biblioteca_lock = threading.Lock()
+
+
+def obtener_biblioteca() -> BibliotecaPlanes:
+    """Biblioteca de planes compartida por todo el proceso."""
+    global _biblioteca
+    with _biblioteca_lock:
+        if _biblioteca is None:
+            _biblioteca = BibliotecaPlanes()
+        return _biblioteca
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import zlib
+import threading
+
+import cv2
+import numpy as np
+
+from script.plantillas import Box, CONFIANZA_POR_DEFECTO, obtener_almacen
+from script.trazas import span
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COORDENADAS_PATH = os.path.join(project_root, "cache", "coordenadas.json")
+
+
+def suma_parche(parche: np.ndarray) -> int:
+    """Suma de comprobación (CRC32) de los píxeles de un parche."""
+    return zlib.crc32(np.ascontiguousarray(parche).data)
+
+
+class CacheCoordenadas:
+    """
+    Caché persistente de la última posición de cada plantilla, entre ejecuciones.
+
+    Los botones de TIA Portal quedan en los mismos píxeles mientras no cambie la disposición
+    del monitor, así que antes de buscar en toda la pantalla se comprueba solo el parche de la
+    última posición conocida:
+
+    1. Si la suma de comprobación del parche coincide con la de la última vez que se encontró
+       la plantilla, los píxeles son idénticos y la coincidencia es segura (microsegundos).
+    2. Si no, se correla la plantilla en una ventana de `holgura` píxeles alrededor de esa
+       posición, con el mismo umbral que la búsqueda completa.
+    3. Solo si ambas fallan se busca en todo el fotograma, y la posición nueva se guarda.
+
+    La clave es plantilla, monitor y resolución del monitor, así que cambiar de resolución no
+    reutiliza posiciones; cada entrada guarda además la huella de los píxeles de la plantilla
+    y se descarta si el recorte cambia. Las posiciones se guardan relativas al origen del
+    monitor en cache/coordenadas.json.
+
+    Si la plantilla aparece varias veces en pantalla se devuelve la posición recordada y no la
+    primera en orden de barrido.
+
+    Args:
+        ruta (str): Archivo JSON de la caché.
+        holgura (int): Píxeles de margen alrededor de la posición guardada al correlar.
+        max_entradas (int): Entradas máximas; se desalojan las usadas hace más tiempo.
+        activa (bool, optional): False para no usarla. Por defecto se desactiva con
+                                 PLCAID_SIN_CACHE_COORDENADAS=1.
+    """
+
+    def __init__(self, ruta: str = COORDENADAS_PATH, holgura: int = 2, max_entradas: int = 1000,
+                 activa: bool = None):
+        self.ruta = ruta
+        self.holgura = holgura
+        self.max_entradas = max_entradas
+        self.activa = activa if activa is not None else os.getenv("PLCAID_SIN_CACHE_COORDENADAS", "0") != "1"
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = {}
+        self._lock = threading.Lock()
+        self._cargar()
+
+    @staticmethod
+    def clave(nombre: str, monitor_id: int, resolucion) -> str:
+        return f"{monitor_id}|{resolucion[0]}x{resolucion[1]}|{nombre}"
+
+    def _cargar(self):
+        if not self.activa or not os.path.exists(self.ruta):
+            return
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                self._entradas = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"DEBUG CacheCoordenadas: caché ignorada ({e}).")
+            self._entradas = {}
+
+    def _guardar(self):
+        with self._lock:
+            if len(self._entradas) > self.max_entradas:
+                antiguas = sorted(self._entradas, key=lambda c: self._entradas[c]["usado"])
+                for clave in antiguas[:len(self._entradas) - self.max_entradas]:
+                    del self._entradas[clave]
+            datos = json.dumps(self._entradas)
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        temporal = f"{self.ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(datos)
+        os.replace(temporal, self.ruta)
+
+    def invalidar(self, nombre: str = None):
+        """Olvida las posiciones de `nombre` (en todos los monitores) o todas si es None."""
+        with self._lock:
+            for clave in list(self._entradas):
+                if nombre is None or clave.rsplit("|", 1)[1] == nombre:
+                    del self._entradas[clave]
+        self._guardar()
+
+    def verificar(self, plantilla, captura, monitor: dict, confianza: float = CONFIANZA_POR_DEFECTO):
+        """
+        Comprueba si `plantilla` sigue en su última posición conocida dentro de `captura`.
+
+        Returns:
+            Box | None: Posición relativa a la captura, o None si no hay entrada o no coincide.
+        """
+        clave = self.clave(plantilla.nombre, captura.monitor_id, (monitor["width"], monitor["height"]))
+        with self._lock:
+            entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        if entrada["plantilla"] != plantilla.huella:
+            # El recorte ha cambiado: la posición guardada ya no vale.
+            with self._lock:
+                self._entradas.pop(clave, None)
+            return None
+
+        x = monitor["left"] + entrada["left"] - captura.left
+        y = monitor["top"] + entrada["top"] - captura.top
+        if x < 0 or y < 0 or x + plantilla.ancho > captura.ancho or y + plantilla.alto > captura.alto:
+            return None
+
+        parche = captura.color[y:y + plantilla.alto, x:x + plantilla.ancho]
+        if suma_parche(parche) == entrada["suma"]:
+            box = Box(x, y, plantilla.ancho, plantilla.alto)
+        else:
+            x0, y0 = max(0, x - self.holgura), max(0, y - self.holgura)
+            x1 = min(captura.ancho, x + plantilla.ancho + self.holgura)
+            y1 = min(captura.alto, y + plantilla.alto + self.holgura)
+            resultado = cv2.matchTemplate(captura.color[y0:y1, x0:x1], plantilla.color[0], cv2.TM_CCOEFF_NORMED)
+            filas, columnas = np.nonzero(resultado >= confianza)
+            if filas.size == 0:
+                return None
+            box = Box(x0 + int(columnas[0]), y0 + int(filas[0]), plantilla.ancho, plantilla.alto)
+        return box
+
+    def registrar(self, plantilla, captura, monitor: dict, box: Box):
+        """Guarda `box` (relativo a la captura) como última posición conocida de la plantilla."""
+        clave = self.clave(plantilla.nombre, captura.monitor_id, (monitor["width"], monitor["height"]))
+        parche = captura.color[box.top:box.top + box.height, box.left:box.left + box.width]
+        entrada = {
+            "left": captura.left + box.left - monitor["left"],
+            "top": captura.top + box.top - monitor["top"],
+            "plantilla": plantilla.huella,
+            "suma": suma_parche(parche),
+            "usado": time.time(),
+        }
+        with self._lock:
+            anterior = self._entradas.get(clave)
+            self._entradas[clave] = entrada
+        # Solo se reescribe el archivo si cambia algo más que la fecha de uso.
+        if anterior is None or any(anterior.get(k) != entrada[k] for k in ("left", "top", "plantilla", "suma")):
+            self._guardar()
+
+    def localizar(self, nombre: str, captura, monitor: dict, almacen=None, confianza: float = CONFIANZA_POR_DEFECTO,
+                  grayscale: bool = False, respaldo_completo: bool = None):
+        """
+        Como AlmacenPlantillas.localizar, pero comprobando primero la última posición conocida.
+
+        Args:
+            nombre (str): Nombre del archivo de la plantilla.
+            captura (Captura): Captura del monitor o de una región de él.
+            monitor (dict): Monitor de la captura (left, top, width, height), como `Capturador.monitor`.
+            respaldo_completo (bool, optional): Como en AlmacenPlantillas.localizar.
+
+        Returns:
+            Box | None: Posición relativa a la captura, o None si no aparece.
+        """
+        almacen = almacen or obtener_almacen()
+        if not self.activa:
+            return almacen.localizar(nombre, captura, confianza, grayscale, respaldo_completo)
+        plantilla = almacen.plantilla(nombre)
+        with span("cache_coordenadas", "match", plantilla=nombre) as traza:
+            box = self.verificar(plantilla, captura, monitor, confianza)
+            traza["acierto"] = box is not None
+        with self._lock:
+            if box is None:
+                self.fallos += 1
+            else:
+                self.aciertos += 1
+        if box is None:
+            box = almacen.localizar(nombre, captura, confianza, grayscale, respaldo_completo)
+        if box is not None:
+            self.registrar(plantilla, captura, monitor, box)
+        return box
+
+    def localizar_varios(self, nombres, captura, monitor: dict, almacen=None,
+                         confianza: float = CONFIANZA_POR_DEFECTO, grayscale: bool = False,
+                         respaldo_completo: bool = None):
+        """Como AlmacenPlantillas.localizar_varios, con la caché de posiciones. Devuelve nombre -> Box | None."""
+        almacen = almacen or obtener_almacen()
+        resultados = {}
+        for nombre in dict.fromkeys(nombres):
+            try:
+                resultados[nombre] = self.localizar(nombre, captura, monitor, almacen, confianza, grayscale,
+                                                    respaldo_completo)
+            except FileNotFoundError:
+                resultados[nombre] = None
+        return resultados
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {"aciertos": self.aciertos, "fallos": self.fallos, "entradas": len(self._entradas)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obtener_cache_coordenadas() -> CacheCoordenadas:
+    """Caché de coordenadas compartida por todo el proceso."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheCoordenadas()
+        return _cache
@@ -0,0 +1,143 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(project_root, "cache", "llm")
+
+
+def normalizar_orden(orden: str) -> str:
+    """Minúsculas y espacios colapsados: "Marcha  Paro\\n" y "marcha paro" comparten entrada."""
+    return re.sub(r"\s+", " ", orden).strip().lower()
+
+
+def huella_texto(texto: str) -> str:
+    """SHA-256 de un texto (por ejemplo, de una plantilla de prompt)."""
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+class CacheLLM:
+    """
+    Caché persistente en disco, direccionada por contenido, para respuestas del LLM.
+
+    Cada entrada es un JSON en `directorio` cuyo nombre es el SHA-256 de todo lo que influye en
+    la respuesta (orden normalizada, monitor, huella del prompt, modelo y temperatura). Las
+    entradas caducan por edad y, al guardar, se desalojan las más antiguas si se superan los
+    límites de número de entradas o de tamaño total.
+
+    Args:
+        directorio (str): Carpeta de la caché.
+        max_entradas (int): Número máximo de entradas.
+        max_bytes (int): Tamaño total máximo en bytes.
+        max_edad (float): Edad máxima de una entrada en segundos.
+        activa (bool, optional): False para ignorar la caché. Por defecto se desactiva con PLCAID_SIN_CACHE=1.
+    """
+
+    def __init__(self, directorio: str = CACHE_DIR, max_entradas: int = None, max_bytes: int = None,
+                 max_edad: float = None, activa: bool = None):
+        self.directorio = directorio
+        self.max_entradas = max_entradas if max_entradas is not None else int(os.getenv("PLCAID_CACHE_MAX_ENTRADAS", "500"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("PLCAID_CACHE_MAX_MB", "50")) * 1024 * 1024)
+        self.max_edad = max_edad if max_edad is not None else float(os.getenv("PLCAID_CACHE_MAX_DIAS", "7")) * 86400
+        self.activa = activa if activa is not None else os.getenv("PLCAID_SIN_CACHE", "0") != "1"
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def clave(**partes) -> str:
+        """Clave de contenido a partir de todas las partes que determinan la respuesta."""
+        return huella_texto(json.dumps(partes, sort_keys=True, ensure_ascii=False))
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, f"{clave}.json")
+
+    def obtener(self, clave: str):
+        """Devuelve el valor guardado o None si no existe, ha caducado o la caché está desactivada."""
+        if not self.activa:
+            return None
+        ruta = self._ruta(clave)
+        valor = None
+        try:
+            if time.time() - os.path.getmtime(ruta) <= self.max_edad:
+                with open(ruta, "r", encoding="utf-8") as f:
+                    valor = json.load(f)["valor"]
+            else:
+                os.remove(ruta)
+        except (OSError, ValueError, KeyError):
+            valor = None
+
+        with self._lock:
+            if valor is None:
+                self.fallos += 1
+            else:
+                self.aciertos += 1
+        print(f"DEBUG Caché: {'acierto' if valor is not None else 'fallo'} {clave[:12]} ({self.aciertos} aciertos / {self.fallos} fallos)")
+        return valor
+
+    def guardar(self, clave: str, valor, **metadatos):
+        """Guarda `valor` (serializable a JSON) de forma atómica y aplica el desalojo."""
+        if not self.activa or valor is None:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = self._ruta(clave)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"valor": valor, "creado": time.time(), **metadatos}, f, ensure_ascii=False)
+        os.replace(temporal, ruta)
+        self._desalojar()
+
+    def invalidar(self, clave: str):
+        """Borra la entrada de `clave` si existe."""
+        self._borrar(self._ruta(clave))
+
+    def _desalojar(self):
+        ahora = time.time()
+        entradas = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(".json"):
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                info = os.stat(ruta)
+            except OSError:
+                continue
+            if ahora - info.st_mtime > self.max_edad:
+                self._borrar(ruta)
+            else:
+                entradas.append((info.st_mtime, info.st_size, ruta))
+
+        # Las más antiguas primero.
+        entradas.sort()
+        total = sum(tamano for _, tamano, _ in entradas)
+        while entradas and (len(entradas) > self.max_entradas or total > self.max_bytes):
+            _, tamano, ruta = entradas.pop(0)
+            self._borrar(ruta)
+            total -= tamano
+
+    @staticmethod
+    def _borrar(ruta: str):
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {"aciertos": self.aciertos, "fallos": self.fallos, "activa": self.activa}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obtener_cache() -> CacheLLM:
+    """Caché compartida por el agente de pasos y el generador SCL."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheLLM()
+        return _cache
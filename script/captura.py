@@ -0,0 +1,131 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+from mss import mss
+
+from script.plantillas import Box, Fotograma
+from script.trazas import span
+
+
+def monitor_por_defecto() -> int:
+    """Monitor indicado por interface.py a través de MONITOR_ID (1 = primario)."""
+    return int(os.getenv("MONITOR_ID", "1"))
+
+
+class Captura(Fotograma):
+    """
+    Fotograma de un monitor (o de una región de él) junto con su posición en el escritorio
+    virtual, para poder traducir las coincidencias a coordenadas globales de clic.
+    """
+
+    def __init__(self, color, left: int, top: int, monitor_id: int):
+        super().__init__(color)
+        self.left = left
+        self.top = top
+        self.monitor_id = monitor_id
+
+    def a_global(self, box: Box) -> Box:
+        """Traduce un Box relativo a la captura a coordenadas globales del escritorio."""
+        return Box(box.left + self.left, box.top + self.top, box.width, box.height)
+
+
+class Capturador:
+    """
+    Captura un único monitor con `mss` directamente a un buffer NumPy, sin pasar por PIL.
+
+    El buffer BGR de destino se reserva una vez por hilo y por tamaño y se reutiliza en cada
+    captura: la conversión BGRA -> BGR de OpenCV escribe sobre él. Por eso una Captura solo es
+    válida hasta la siguiente llamada a `capturar` desde el mismo hilo; usar `copia=True` si hay
+    que conservarla.
+
+    Args:
+        monitor_id (int): Índice de `mss().monitors` (1 = primario, 0 = escritorio virtual completo).
+    """
+
+    def __init__(self, monitor_id: int = None):
+        self.monitor_id = monitor_por_defecto() if monitor_id is None else monitor_id
+        # mss no se puede compartir entre hilos (sobre todo en X11), así que cada hilo tiene el suyo.
+        self._local = threading.local()
+        monitores = self._sct().monitors
+        if not 0 <= self.monitor_id < len(monitores):
+            print(f"ADVERTENCIA Captura: el monitor {self.monitor_id} no existe; se usa el primario.")
+            self.monitor_id = 1 if len(monitores) > 1 else 0
+        self.monitor = dict(monitores[self.monitor_id])
+
+    def _sct(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = mss()
+            self._local.sct = sct
+        return sct
+
+    def _buffer(self, alto: int, ancho: int):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape[:2] != (alto, ancho):
+            buffer = np.empty((alto, ancho, 3), dtype=np.uint8)
+            self._local.buffer = buffer
+        return buffer
+
+    @property
+    def resolucion(self):
+        return self.monitor["width"], self.monitor["height"]
+
+    def capturar(self, region=None, copia: bool = False) -> Captura:
+        """
+        Captura el monitor o una región de interés.
+
+        Args:
+            region (tuple, optional): (left, top, width, height) relativa al monitor. Se recorta
+                                      a los límites del monitor.
+            copia (bool): Devolver un array propio en lugar del buffer reutilizado.
+
+        Returns:
+            Captura: Fotograma BGR con su desplazamiento global.
+        """
+        left, top = self.monitor["left"], self.monitor["top"]
+        ancho, alto = self.monitor["width"], self.monitor["height"]
+        if region is not None:
+            x, y, w, h = (int(v) for v in region)
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(ancho, x + w), min(alto, y + h)
+            if x1 <= x0 or y1 <= y0:
+                raise ValueError(f"La región {region} queda fuera del monitor {self.monitor_id}.")
+            left, top, ancho, alto = left + x0, top + y0, x1 - x0, y1 - y0
+
+        with span("captura", "captura", monitor_id=self.monitor_id, ancho=ancho, alto=alto):
+            shot = self._sct().grab({"left": left, "top": top, "width": ancho, "height": alto})
+            # Vista sin copia sobre los bytes BGRA que devuelve mss.
+            bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+            if copia:
+                color = cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR)
+            else:
+                color = cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=self._buffer(shot.height, shot.width))
+        return Captura(color, left, top, self.monitor_id)
+
+
+_capturadores = {}
+_capturadores_lock = threading.Lock()
+
+
+def obtener_capturador(monitor_id: int = None) -> Capturador:
+    """Capturador compartido por monitor, para no reabrir mss en cada paso."""
+    if monitor_id is None:
+        monitor_id = monitor_por_defecto()
+    with _capturadores_lock:
+        capturador = _capturadores.get(monitor_id)
+        if capturador is None:
+            capturador = Capturador(monitor_id)
+            _capturadores[monitor_id] = capturador
+        return capturador
+
+
+def registrar_capturador(monitor_id: int, capturador):
+    """
+    Sustituye el capturador de un monitor, por ejemplo por uno que reproduce capturas
+    grabadas (ver benchmarks/repeticion.py). Debe ofrecer `capturar(region, copia)`,
+    `monitor`, `monitor_id` y `resolucion` como Capturador.
+    """
+    with _capturadores_lock:
+        _capturadores[monitor_id] = capturador
@@ -0,0 +1,324 @@
+import os
+import time
+import queue
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import openai
+from openai import OpenAI
+
+from script.trazas import span, evento
+
+
+class ErrorPrefijo(ValueError):
+    """La respuesta se cortó porque su comienzo ya no era válido. `texto` es lo recibido hasta ahí."""
+
+    def __init__(self, causa: Exception, texto: str):
+        self.causa = causa
+        self.texto = texto
+        super().__init__(str(causa))
+
+
+class LlamadaCancelada(Exception):
+    """Una petición (principal o duplicada) que ya no hace falta porque la otra respondió antes."""
+
+
+class Respuesta:
+    """Texto completo de una respuesta, con su consumo de tokens y su latencia (s)."""
+
+    def __init__(self, texto: str, uso=None, latencia: float = 0.0):
+        self.texto = texto
+        self.uso = uso
+        self.latencia = latencia
+
+    def tokens(self) -> dict:
+        """prompt_tokens, completion_tokens y total_tokens (vacío si el servidor no los informó)."""
+        if self.uso is None:
+            return {}
+        return {"prompt_tokens": self.uso.prompt_tokens, "completion_tokens": self.uso.completion_tokens,
+                "total_tokens": self.uso.total_tokens}
+
+
+# Errores transitorios de OpenAI que merece la pena reintentar.
+ERRORES_REINTENTABLES = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    httpx.TimeoutException,
+    httpx.TransportError,
+)
+
+class LimiteTasa:
+    """
+    Limitador de peticiones por minuto (cubo de fichas) compartido entre hilos.
+
+    Args:
+        por_minuto (float): Peticiones permitidas por minuto. 0 o negativo = sin límite.
+        rafaga (int): Peticiones que se pueden hacer seguidas antes de empezar a espaciar.
+    """
+
+    def __init__(self, por_minuto: float, rafaga: int = 1):
+        self.intervalo = 60.0 / por_minuto if por_minuto > 0 else 0.0
+        self.capacidad = max(1, rafaga)
+        self._fichas = float(self.capacidad)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self):
+        if self.intervalo == 0.0:
+            return
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultimo) / self.intervalo)
+                self._ultimo = ahora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) * self.intervalo
+            time.sleep(espera)
+
+
+_openai = None
+_openai_lock = threading.Lock()
+
+
+def cliente_openai_compartido() -> OpenAI:
+    """
+    Cliente OpenAI único del proceso sobre un httpx.Client con conexiones persistentes
+    (keep-alive), de modo que el plan y el SCL reutilizan la conexión TLS en lugar de abrir
+    una nueva por llamada. Los reintentos del SDK se desactivan: los gestiona ClienteLLM.
+    """
+    global _openai
+    with _openai_lock:
+        if _openai is None:
+            http = httpx.Client(
+                limits=httpx.Limits(max_connections=int(os.getenv("PLCAID_LLM_CONEXIONES", "8")),
+                                    max_keepalive_connections=4, keepalive_expiry=120),
+                timeout=httpx.Timeout(float(os.getenv("PLCAID_LLM_TIMEOUT", "30")), connect=5.0),
+            )
+            _openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http, max_retries=0)
+        return _openai
+
+
+class ClienteLLM:
+    """
+    Capa común de llamadas al modelo de chat para el plan y el SCL.
+
+    - Plazo por llamada: ningún reintento ni duplicado sigue más allá de `plazo` segundos.
+    - Reintentos acotados de los errores transitorios, con espera exponencial y jitter
+      completo (aleatoria entre 0 y la espera exponencial) para no sincronizar reintentos.
+    - Cobertura (hedging): si una petición lleva en curso más que el percentil 95 de las
+      últimas latencias de este cliente, se lanza una duplicada y se usa la que termine antes.
+      El tiempo se cuenta desde que la principal sale de verdad (tras `antes_de_peticion`), así
+      que esperar turno no provoca duplicados, y la que se queda atrás se abandona sin esperarla.
+    - Streaming: la respuesta se recibe por fragmentos y `validar_prefijo` puede cortarla en
+      cuanto su comienzo ya no es válido, sin esperar ni pagar el resto.
+
+    Args:
+        etiqueta (str): Nombre del uso ("plan", "scl"); separa las estadísticas de latencia.
+        cliente (optional): Objeto con la interfaz de openai.OpenAI. Por defecto, el compartido.
+        plazo (float): Segundos máximos por llamada, incluidos reintentos. PLCAID_LLM_PLAZO.
+        max_reintentos (int): Reintentos ante errores transitorios. PLCAID_LLM_REINTENTOS.
+        espera_inicial (float): Base de la espera exponencial entre reintentos (s).
+        espera_max (float): Tope de la espera entre reintentos (s).
+        cobertura (bool): Activar las peticiones duplicadas. PLCAID_LLM_COBERTURA=0 las desactiva.
+        min_muestras (int): Latencias necesarias antes de calcular el percentil 95.
+        antes_de_peticion (callable, optional): Se llama sin argumentos justo antes de cada
+                                                petición real al servidor (reintentos y
+                                                duplicados incluidos); por ejemplo,
+                                                LimiteTasa.adquirir para limitar la tasa.
+    """
+
+    def __init__(self, etiqueta: str, cliente=None, plazo: float = None, max_reintentos: int = None,
+                 espera_inicial: float = 0.5, espera_max: float = 8.0, cobertura: bool = None,
+                 min_muestras: int = 10, antes_de_peticion=None):
+        self.etiqueta = etiqueta
+        self._cliente = cliente
+        self.antes_de_peticion = antes_de_peticion
+        self.plazo = plazo if plazo is not None else float(os.getenv("PLCAID_LLM_PLAZO", "90"))
+        self.max_reintentos = max_reintentos if max_reintentos is not None else int(os.getenv("PLCAID_LLM_REINTENTOS", "3"))
+        self.espera_inicial = espera_inicial
+        self.espera_max = espera_max
+        self.cobertura = cobertura if cobertura is not None else os.getenv("PLCAID_LLM_COBERTURA", "1") != "0"
+        self.min_muestras = min_muestras
+        self.coberturas = 0
+        self._latencias = deque(maxlen=50)
+        self._lock = threading.Lock()
+        # Solo para las peticiones duplicadas; las principales no esperan turno aquí.
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix=f"llm-{etiqueta}")
+
+    @property
+    def cliente(self):
+        return self._cliente or cliente_openai_compartido()
+
+    def p95(self):
+        """Percentil 95 de las últimas latencias, o None si aún hay pocas muestras."""
+        with self._lock:
+            if len(self._latencias) < self.min_muestras:
+                return None
+            ordenadas = sorted(self._latencias)
+        return ordenadas[min(len(ordenadas) - 1, int(0.95 * len(ordenadas)))]
+
+    def completar(self, mensajes: list, modelo: str, temperatura: float, max_tokens: int = None,
+                  validar_prefijo=None, plazo: float = None) -> Respuesta:
+        """
+        Pide una respuesta de chat y la devuelve completa.
+
+        Args:
+            mensajes (list): Mensajes en formato de OpenAI.
+            modelo (str): Modelo a usar.
+            temperatura (float): Temperatura de muestreo.
+            max_tokens (int, optional): Máximo de tokens de la respuesta.
+            validar_prefijo (callable, optional): Recibe el texto acumulado tras cada fragmento
+                                                   y lanza una excepción si ya no es válido.
+            plazo (float, optional): Sustituye al plazo por defecto para esta llamada.
+
+        Raises:
+            ErrorPrefijo: Si `validar_prefijo` rechazó el comienzo de la respuesta.
+            TimeoutError: Si se agotó el plazo.
+            openai.OpenAIError: Si el error no es transitorio o se agotaron los reintentos.
+        """
+        parametros = {"model": modelo, "messages": mensajes, "temperature": temperatura}
+        if max_tokens is not None:
+            parametros["max_tokens"] = max_tokens
+        fin = time.monotonic() + (plazo if plazo is not None else self.plazo)
+
+        intento = 0
+        while True:
+            try:
+                return self._con_cobertura(parametros, validar_prefijo, fin)
+            except ERRORES_REINTENTABLES as e:
+                if intento >= self.max_reintentos:
+                    raise
+                espera = random.uniform(0, min(self.espera_max, self.espera_inicial * 2 ** intento))
+                if time.monotonic() + espera >= fin:
+                    raise
+                intento += 1
+                evento("reintento_llm", "llm", etiqueta=self.etiqueta, reintento=intento, espera_s=round(espera, 3), error=str(e))
+                print(f"DEBUG LLM {self.etiqueta}: error transitorio ({e}); reintento {intento}/{self.max_reintentos} en {espera:.2f} s")
+                time.sleep(espera)
+
+    def _con_cobertura(self, parametros: dict, validar_prefijo, fin: float) -> Respuesta:
+        umbral = self.p95() if self.cobertura else None
+        if umbral is None:
+            return self._llamar(parametros, validar_prefijo, fin)
+
+        # La principal va en un hilo propio (no espera turno en el pool) y el duplicado en el
+        # pool; quien llama espera a la primera que termine en `resultados`, aunque la otra siga
+        # bloqueada en la conexión. El duplicado se lanza cuando la principal lleva `umbral`
+        # segundos en curso, contados desde que sale de verdad (tras antes_de_peticion).
+        resultados = queue.Queue()
+        cancelaciones = [threading.Event(), threading.Event()]
+        estado = {"terminada": False, "lanzadas": 1, "temporizador": None}
+        estado_lock = threading.Lock()
+
+        def correr(indice: int, al_empezar=None):
+            try:
+                resultados.put((indice, self._llamar(parametros, validar_prefijo, fin, cancelaciones[indice], al_empezar), None))
+            except Exception as e:
+                resultados.put((indice, None, e))
+
+        def lanzar_duplicado():
+            with estado_lock:
+                if estado["terminada"]:
+                    return
+                estado["lanzadas"] += 1
+                with self._lock:
+                    self.coberturas += 1
+                evento("cobertura_llm", "llm", etiqueta=self.etiqueta, umbral_s=round(umbral, 3))
+                print(f"DEBUG LLM {self.etiqueta}: sin respuesta en {umbral:.2f} s (p95), se lanza una petición duplicada.")
+                self._pool.submit(correr, 1)
+
+        def al_empezar():
+            temporizador = threading.Timer(max(0.0, min(umbral, fin - time.monotonic())), lanzar_duplicado)
+            temporizador.daemon = True
+            with estado_lock:
+                if estado["terminada"]:
+                    return
+                estado["temporizador"] = temporizador
+            temporizador.start()
+
+        def terminar():
+            with estado_lock:
+                estado["terminada"] = True
+                if estado["temporizador"] is not None:
+                    estado["temporizador"].cancel()
+            # La que siga en curso se abandona: se corta en su siguiente fragmento o al agotar
+            # su timeout, sin que nadie la espere.
+            for cancelacion in cancelaciones:
+                cancelacion.set()
+
+        threading.Thread(target=correr, args=(0, al_empezar), name=f"llm-{self.etiqueta}-principal",
+                         daemon=True).start()
+        recibidas = 0
+        primer_error = None
+        while True:
+            try:
+                _, respuesta, error = resultados.get(timeout=max(0.0, fin - time.monotonic()))
+            except queue.Empty:
+                terminar()
+                raise TimeoutError(f"La llamada al LLM ({self.etiqueta}) superó su plazo.")
+            recibidas += 1
+            if error is None:
+                terminar()
+                return respuesta
+            primer_error = primer_error or error
+            with estado_lock:
+                # Sin duplicado en marcha no queda nada que esperar.
+                pendientes = estado["lanzadas"] - recibidas
+                if pendientes == 0:
+                    estado["terminada"] = True
+            if pendientes == 0:
+                terminar()
+                raise primer_error
+
+    def _llamar(self, parametros: dict, validar_prefijo, fin: float, cancelacion: threading.Event = None,
+                al_empezar=None) -> Respuesta:
+        if self.antes_de_peticion is not None:
+            self.antes_de_peticion()
+            if cancelacion is not None and cancelacion.is_set():
+                raise LlamadaCancelada()
+        inicio = time.monotonic()
+        restante = fin - inicio
+        if restante <= 0:
+            raise TimeoutError(f"La llamada al LLM ({self.etiqueta}) superó su plazo.")
+        if al_empezar is not None:
+            al_empezar()
+        with span("llm.peticion", "llm", etiqueta=self.etiqueta, con_cobertura=cancelacion is not None):
+            flujo = self.cliente.chat.completions.create(
+                **parametros, stream=True, stream_options={"include_usage": True}, timeout=restante)
+            partes = []
+            uso = None
+            try:
+                for fragmento in flujo:
+                    if cancelacion is not None and cancelacion.is_set():
+                        raise LlamadaCancelada()
+                    if time.monotonic() > fin:
+                        raise TimeoutError(f"La llamada al LLM ({self.etiqueta}) superó su plazo.")
+                    if getattr(fragmento, "usage", None) is not None:
+                        uso = fragmento.usage
+                    if not fragmento.choices:
+                        continue
+                    delta = fragmento.choices[0].delta.content
+                    if delta:
+                        partes.append(delta)
+                        if validar_prefijo is not None:
+                            texto = "".join(partes)
+                            try:
+                                validar_prefijo(texto)
+                            except Exception as e:
+                                raise ErrorPrefijo(e, texto) from e
+            finally:
+                cerrar = getattr(flujo, "close", None)
+                if cerrar is not None:
+                    cerrar()
+
+        latencia = time.monotonic() - inicio
+        with self._lock:
+            self._latencias.append(latencia)
+        return Respuesta("".join(partes), uso, latencia)
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import threading
+
+import cv2
+import numpy as np
+
+from script.cache_llm import normalizar_orden, huella_texto
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIARIO_DIR = os.path.join(project_root, "cache", "diario")
+
+LADO_HUELLA = 16
+
+
+def huella_pantalla(captura) -> str:
+    """
+    Huella del estado de la pantalla: hash de diferencias de 256 bits (cada píxel de una
+    miniatura en gris de 17x16 comparado con su vecino derecho), en hexadecimal. Tolera el
+    ruido de compresión y pequeños cambios (un cursor, el reloj) pero no otra ventana.
+    """
+    pequena = cv2.resize(captura.gris(), (LADO_HUELLA + 1, LADO_HUELLA), interpolation=cv2.INTER_AREA)
+    bits = (pequena[:, 1:] > pequena[:, :-1]).flatten()
+    return np.packbits(bits).tobytes().hex()
+
+
+def distancia_huellas(a: str, b: str) -> float:
+    """Fracción (0-1) de bits distintos entre dos huellas de pantalla."""
+    bits_a = np.unpackbits(np.frombuffer(bytes.fromhex(a), dtype=np.uint8))
+    bits_b = np.unpackbits(np.frombuffer(bytes.fromhex(b), dtype=np.uint8))
+    if bits_a.size != bits_b.size:
+        return 1.0
+    return float(np.count_nonzero(bits_a != bits_b)) / bits_a.size
+
+
+class DiarioEjecucion:
+    """
+    Diario de una ejecución en cache/diario/, para reanudar un flujo que falló o se
+    interrumpió sin volver a llamar al LLM ni repetir los pasos ya hechos.
+
+    Se guarda (con escritura atómica) el plan en cuanto se conoce, el código SCL en cuanto se
+    genera y, tras cada paso completado, su índice y la huella de la pantalla ya asentada. Al
+    volver a ejecutar la misma orden en el mismo monitor, el flujo reutiliza plan y SCL y
+    continúa en el primer paso pendiente si la pantalla sigue como quedó. El diario se borra
+    cuando el flujo termina bien o falla sin plan válido, y su plan se descarta si vuelve a
+    fallar en el mismo paso tras reanudar.
+
+    Args:
+        orden (str): Orden del operador.
+        monitor_id (int): Monitor de la ejecución.
+        directorio (str): Carpeta de los diarios.
+        vigencia_h (float): Horas tras las que un diario ya no se reanuda. PLCAID_DIARIO_HORAS.
+        activo (bool, optional): False para no usarlo. PLCAID_SIN_DIARIO=1 lo desactiva.
+    """
+
+    def __init__(self, orden: str, monitor_id: int, directorio: str = DIARIO_DIR, vigencia_h: float = None,
+                 activo: bool = None):
+        self.orden = orden
+        self.monitor_id = int(monitor_id)
+        self.activo = activo if activo is not None else os.getenv("PLCAID_SIN_DIARIO", "0") != "1"
+        self.vigencia_h = vigencia_h if vigencia_h is not None else float(os.getenv("PLCAID_DIARIO_HORAS", "24"))
+        identificador = huella_texto(f"{self.monitor_id}|{normalizar_orden(orden)}")[:16]
+        self.ruta = os.path.join(directorio, f"{identificador}.json")
+        self.datos = {"orden": orden, "monitor_id": self.monitor_id, "plan": None, "scl": None,
+                      "completados": [], "huellas": {}, "paso_fallido": None, "actualizado": time.time()}
+        self._cerrado = False
+        self._lock = threading.Lock()
+
+    def cargar(self) -> bool:
+        """Lee el diario de una ejecución anterior. False si no hay ninguno vigente."""
+        if not self.activo or not os.path.exists(self.ruta):
+            return False
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"DEBUG Diario: diario ignorado ({e}).")
+            return False
+        if time.time() - datos.get("actualizado", 0) > self.vigencia_h * 3600:
+            print("DEBUG Diario: el diario anterior ha caducado, se empieza de cero.")
+            self.borrar()
+            return False
+        if normalizar_orden(datos.get("orden", "")) != normalizar_orden(self.orden):
+            return False
+        with self._lock:
+            self.datos.update(datos)
+        return True
+
+    @property
+    def plan(self):
+        return self.datos["plan"]
+
+    @property
+    def scl(self):
+        return self.datos["scl"]
+
+    def primer_pendiente(self) -> int:
+        """Índice del primer paso sin completar (los pasos se completan en orden)."""
+        completados = set(self.datos["completados"])
+        indice = 0
+        while indice in completados:
+            indice += 1
+        return indice
+
+    def huella(self, indice: int):
+        """Huella de la pantalla guardada tras completar el paso `indice`, o None."""
+        return self.datos["huellas"].get(str(indice))
+
+    def guardar_plan(self, plan: dict):
+        """Guarda el plan (ya resuelto) y descarta los pasos completados con otro plan."""
+        with self._lock:
+            self.datos["plan"] = plan
+            self.datos["completados"] = []
+            self.datos["huellas"] = {}
+            self.datos["paso_fallido"] = None
+        self._guardar()
+
+    def guardar_scl(self, codigo: str):
+        with self._lock:
+            self.datos["scl"] = codigo
+        self._guardar()
+
+    def completar_paso(self, indice: int, huella: str = None):
+        """Anota el paso `indice` como hecho, con la huella de la pantalla que dejó."""
+        with self._lock:
+            if indice not in self.datos["completados"]:
+                self.datos["completados"].append(indice)
+            if huella is not None:
+                self.datos["huellas"][str(indice)] = huella
+        self._guardar()
+
+    def olvidar_pasos(self):
+        """Conserva plan y SCL pero vuelve a empezar los pasos (la pantalla ya no es la del diario)."""
+        with self._lock:
+            self.datos["completados"] = []
+            self.datos["huellas"] = {}
+        self._guardar()
+
+    @property
+    def paso_fallido(self):
+        """Índice del paso con el que falló la última ejecución con este plan, o None."""
+        return self.datos.get("paso_fallido")
+
+    def anotar_fallo(self, indice: int):
+        with self._lock:
+            self.datos["paso_fallido"] = indice
+        self._guardar()
+
+    def olvidar_plan(self):
+        """
+        Descarta el plan y los pasos (el SCL, ya validado, se conserva): la próxima ejecución
+        pide un plan nuevo en lugar de repetir uno que vuelve a fallar en el mismo paso.
+        """
+        with self._lock:
+            self.datos["plan"] = None
+            self.datos["completados"] = []
+            self.datos["huellas"] = {}
+            self.datos["paso_fallido"] = None
+        self._guardar()
+
+    def borrar(self):
+        try:
+            os.remove(self.ruta)
+        except FileNotFoundError:
+            pass
+
+    def cerrar(self):
+        """Flujo terminado: borra el diario y no vuelve a escribirlo (por ejemplo, si el SCL llega tarde)."""
+        with self._lock:
+            self._cerrado = True
+            self.borrar()
+
+    def _guardar(self):
+        if not self.activo:
+            return
+        # Bajo el candado: el SCL se anota desde su propio hilo y no puede reescribir un diario cerrado.
+        with self._lock:
+            if self._cerrado:
+                return
+            self.datos["actualizado"] = time.time()
+            os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+            temporal = f"{self.ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(self.datos, f, ensure_ascii=False, indent=1)
+            os.replace(temporal, self.ruta)
@@ -1,12 +1,41 @@
 import pyautogui
 import time
-import os
 import pyperclip # Para manejar el portapapeles
 
+from script.plantillas import obtener_almacen, CONFIANZA_POR_DEFECTO
+from script.captura import obtener_capturador
+from script.cache_coordenadas import obtener_cache_coordenadas
+from script.trazas import span
+
 # La pausa inicial se mantiene si es útil para el contexto general de la aplicación.
 # time.sleep(2)
 
-def action(step_image_name: str, action_type: str, text_content: str = None):
+def localizar(step_image_name: str, monitor_id: int = None, region=None):
+    """
+    Captura el monitor y busca en él la imagen del paso.
+
+    Args:
+        step_image_name (str): El nombre del archivo de imagen (ej. "i1.png") a localizar.
+        monitor_id (int, optional): Monitor de mss donde buscar. Por defecto, MONITOR_ID.
+        region (tuple, optional): Región (left, top, width, height) del monitor donde buscar.
+                                  Por defecto, el monitor completo.
+
+    Returns:
+        Box | None: Posición en coordenadas globales del escritorio, o None si no aparece.
+    """
+    try:
+        # Captura solo el monitor seleccionado y busca con las plantillas ya decodificadas en memoria,
+        # comprobando primero la última posición conocida de la plantilla en este monitor.
+        capturador = obtener_capturador(monitor_id)
+        captura = capturador.capturar(region)
+        location = obtener_cache_coordenadas().localizar(step_image_name, captura, capturador.monitor, obtener_almacen(),
+                                                         confianza=CONFIANZA_POR_DEFECTO, grayscale=False)
+    except (pyautogui.PyAutoGUIException, FileNotFoundError, ValueError) as e:
+        print(f"Error al buscar la imagen '{step_image_name}': {e}")
+        raise # Re-lanzar para que main.py lo capture
+    return captura.a_global(location) if location else None
+
+def action(step_image_name: str, action_type: str, text_content: str = None, monitor_id: int = None, region=None, location=None):
     """
     Realiza una acción (clic o escribir texto) en una imagen de la pantalla.
     
@@ -15,21 +44,21 @@ def action(step_image_name: str, action_type: str, text_content: str = None):
         action_type (str): El tipo de acción a realizar ("clic" o "texto").
         text_content (str, optional): El texto a escribir si action_type es "texto".
                                       Este parámetro se espera solo para acción "texto".
+        monitor_id (int, optional): Monitor de mss donde buscar. Por defecto, MONITOR_ID.
+        region (tuple, optional): Región (left, top, width, height) del monitor donde buscar.
+                                  Por defecto, el monitor completo.
+        location (Box, optional): Posición global ya localizada (por ejemplo, por la
+                                  búsqueda anticipada). Si se da, no se vuelve a buscar.
     """
-    # Ruta a la imagen en la carpeta capture
-    # Asumiendo que execute_actions.py está en 'script/', la raíz del proyecto es dos niveles arriba.
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    image_path = os.path.join(project_root, 'capture', step_image_name)
-
-    print(f"Buscando imagen: {image_path} para realizar acción: {action_type}")
+    with span("accion", "accion", plantilla=step_image_name, tipo=action_type, anticipada=location is not None):
+        _action(step_image_name, action_type, text_content, monitor_id, region, location)
 
-    location = None
-    try:
-        # Busca la imagen en pantalla.
-        location = pyautogui.locateOnScreen(image_path, confidence=0.8, grayscale=False)
-    except pyautogui.PyAutoGUIException as e:
-        print(f"Error al buscar la imagen '{step_image_name}': {e}")
-        raise # Re-lanzar para que main.py lo capture
+def _action(step_image_name, action_type, text_content, monitor_id, region, location):
+    if location is None:
+        print(f"Buscando imagen: {step_image_name} para realizar acción: {action_type}")
+        location = localizar(step_image_name, monitor_id, region)
+    else:
+        print(f"Usando posición anticipada de '{step_image_name}' para realizar acción: {action_type}")
 
     if location:
         center_x = location.left + location.width / 2
@@ -56,4 +85,4 @@ def action(step_image_name: str, action_type: str, text_content: str = None):
         else:
             print(f"Acción no reconocida: {action_type}. Ignorando paso.")
     else:
-        raise RuntimeError(f"No se pudo localizar el elemento '{step_image_name}' en la pantalla actual con la confianza dada (0.8).")
\ No newline at end of file
+        raise RuntimeError(f"No se pudo localizar el elemento '{step_image_name}' en la pantalla actual con la confianza dada ({CONFIANZA_POR_DEFECTO}).")
\ No newline at end of file
@@ -1,6 +1,10 @@
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from script.cache_llm import obtener_cache, normalizar_orden, huella_texto
+from script.trazas import span
+from script.validador_scl import validar_scl, validar_prefijo, ErrorSCL
+from script.cliente_llm import ClienteLLM, ErrorPrefijo
 
 # Cargar variables de entorno
 load_dotenv()
@@ -9,15 +13,14 @@ api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     raise ValueError("No se encontró la API key en el archivo .env")
 
-# Inicializar cliente OpenAI
-client = OpenAI(api_key=api_key)
+# Cliente con pool de conexiones, plazo, reintentos, cobertura y streaming (script/cliente_llm.py).
+cliente = ClienteLLM("scl")
 
-def codificar_scl(texto: str):
-    # Pedir input al usuario
-    orden = texto
+MODELO = "gpt-4"
+TEMPERATURA = 0.3
+MAX_TOKENS = 500
 
-    # Construir el prompt
-    prompt = f"""
+PROMPT_SCL = """
 Eres un experto programador de PLC Siemens S7-1200.
 Dado el siguiente requerimiento en lenguaje natural, genera el código en lenguaje SCL necesario para implementarlo.
 
@@ -34,19 +37,74 @@ Nombre de variables:
 );
 """
 
+PROMPT_CORRECCION = """El código anterior no es válido: {error}.
+Corrígelo y devuelve de nuevo solo y exclusivamente el código SCL completo, sin explicaciones ni formato markdown."""
+
+MAX_CORRECCIONES = int(os.getenv("PLCAID_CORRECCIONES_SCL", "2"))
+
+def _pedir_scl(mensajes: list) -> str:
+    with span("llm.scl", "llm", modelo=MODELO, cache=False, intento=(len(mensajes) + 1) // 2) as traza:
+        # El prefijo se valida mientras llega: una variable fuera de la interfaz corta la respuesta.
+        respuesta = cliente.completar(mensajes, MODELO, TEMPERATURA, MAX_TOKENS, validar_prefijo=validar_prefijo)
+        traza.update(respuesta.tokens())
+    return respuesta.texto
+
+def codificar_scl(texto: str, usar_cache: bool = True):
+    """
+    Genera el código SCL de la orden y lo valida localmente antes de devolverlo.
+
+    Si el validador encuentra un error, se vuelve a pedir el código al modelo con el error
+    en la conversación, hasta MAX_CORRECCIONES veces. Solo se guarda en caché código válido.
+
+    Returns:
+        str | None: Código SCL limpio y validado, o None si no se consiguió.
+    """
+    # Pedir input al usuario
+    orden = texto
+
+    # El código SCL no depende del monitor: la clave es orden, prompt, modelo y parámetros.
+    cache = obtener_cache()
+    clave = cache.clave(
+        funcion="scl",
+        orden=normalizar_orden(orden),
+        prompt=huella_texto(PROMPT_SCL),
+        modelo=MODELO,
+        temperatura=TEMPERATURA,
+        max_tokens=MAX_TOKENS,
+    )
+    cacheado = cache.obtener(clave) if usar_cache else None
+    if cacheado is not None:
+        try:
+            with span("llm.scl", "llm", modelo=MODELO, cache=True):
+                return validar_scl(cacheado)
+        except ErrorSCL as e:
+            # Entrada de antes de la validación: se regenera.
+            print(f"DEBUG SCL: el código en caché no es válido ({e}); se regenera.")
+
+    # Construir el prompt
+    prompt = PROMPT_SCL.format(orden=orden)
+    mensajes = [{"role": "user", "content": prompt}]
+
     # Solicitar la respuesta al modelo
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=500
-        )
-
-        codigo_scl = response.choices[0].message.content
-        return codigo_scl
+        for intento in range(MAX_CORRECCIONES + 1):
+            try:
+                codigo_scl = _pedir_scl(mensajes)
+                with span("validacion_scl", "validacion", intento=intento + 1):
+                    codigo_scl = validar_scl(codigo_scl)
+            except (ErrorSCL, ErrorPrefijo) as e:
+                if isinstance(e, ErrorPrefijo):
+                    codigo_scl = e.texto
+                print(f"DEBUG SCL: código rechazado por el validador (intento {intento + 1}/{MAX_CORRECCIONES + 1}): {e}")
+                mensajes = mensajes + [
+                    {"role": "assistant", "content": codigo_scl or ""},
+                    {"role": "user", "content": PROMPT_CORRECCION.format(error=e)},
+                ]
+                continue
+            if usar_cache:
+                cache.guardar(clave, codigo_scl, funcion="scl")
+            return codigo_scl
+        print(f"Ocurrió un error al generar el código SCL: el modelo no devolvió código válido tras {MAX_CORRECCIONES + 1} intentos.")
 
     except Exception as e:
         print(f"Ocurrió un error al generar el código SCL: {e}")
@@ -0,0 +1,363 @@
+import os
+import re
+import json
+import zlib
+import threading
+import unicodedata
+
+import cv2
+import numpy as np
+
+from script.plantillas import CAPTURE_DIR
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DESCRIPCIONES_PATH = os.path.join(CAPTURE_DIR, "descripciones.json")
+INDICE_CACHE_PATH = os.path.join(project_root, "cache", "indice_ui.json")
+
+DIMENSION_TEXTO = 256
+LADO_DESCRIPTOR = 8
+# Una descripción solo se traduce a un elemento si se parece mucho a él y claramente más que
+# al siguiente; si no, el paso falla en lugar de hacer clic en otro elemento.
+UMBRAL_TEXTO = 0.6
+MARGEN_TEXTO = 0.15
+
+# Palabras que no distinguen un elemento de otro: artículos, preposiciones y el tipo genérico
+# de control ("botón", "icono"...). Sin quitarlas, "botón Compilar de la barra de
+# herramientas" se parece a cualquier descripción que hable de botones.
+PALABRAS_VACIAS = frozenset("""
+    a al con de del el en la las lo los para por que se su sus un una unos unas y o u e
+    boton botones icono iconos barra herramientas ventana vista area lista menu opcion
+    elemento pantalla clic hacer haz pulsa pulsar
+""".split())
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas, sin tildes y solo letras, números y espacios simples."""
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(re.findall(r"[a-z0-9]+", texto.lower()))
+
+
+def palabras_clave(texto: str) -> list:
+    """Palabras normalizadas de `texto` sin las de PALABRAS_VACIAS."""
+    return [palabra for palabra in normalizar_texto(texto).split() if palabra not in PALABRAS_VACIAS]
+
+
+def vector_texto(texto: str, quitar_vacias: bool = False) -> np.ndarray:
+    """
+    Vector de trigramas de caracteres (con hashing a DIMENSION_TEXTO posiciones) normalizado,
+    de modo que el producto escalar entre dos vectores es su similitud coseno. Tolera faltas
+    de ortografía, tildes y palabras en otro orden sin necesitar un modelo de embeddings.
+    Con `quitar_vacias` se ignoran las palabras de PALABRAS_VACIAS.
+    """
+    vector = np.zeros(DIMENSION_TEXTO, dtype=np.float32)
+    palabras = palabras_clave(texto) if quitar_vacias else normalizar_texto(texto).split()
+    for palabra in palabras:
+        palabra = f" {palabra} "
+        for i in range(len(palabra) - 2):
+            # crc32 en lugar de hash(): tiene que ser estable entre procesos.
+            vector[zlib.crc32(palabra[i:i + 3].encode()) % DIMENSION_TEXTO] += 1.0
+    norma = np.linalg.norm(vector)
+    return vector / norma if norma else vector
+
+
+def dhash(gris: np.ndarray) -> int:
+    """Hash perceptual de diferencias (64 bits): compara cada píxel con su vecino derecho en 9x8."""
+    pequena = cv2.resize(gris, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (pequena[:, 1:] > pequena[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def descriptor_imagen(gris: np.ndarray) -> np.ndarray:
+    """Miniatura 8x8 centrada y normalizada más la relación de aspecto (log), como float32."""
+    miniatura = cv2.resize(gris, (LADO_DESCRIPTOR, LADO_DESCRIPTOR), interpolation=cv2.INTER_AREA).astype(np.float32)
+    miniatura -= miniatura.mean()
+    norma = np.linalg.norm(miniatura)
+    if norma:
+        miniatura /= norma
+    aspecto = np.log(gris.shape[1] / gris.shape[0])
+    return np.append(miniatura.flatten(), aspecto).astype(np.float32)
+
+
+class ElementoUI:
+    """Una plantilla de capture/ con su descripción y sus rasgos para buscarla."""
+
+    def __init__(self, nombre: str, mtime: float, hash_imagen: int, descriptor, alto: int, ancho: int,
+                 descripcion: str = ""):
+        self.nombre = nombre
+        self.mtime = mtime
+        self.hash_imagen = hash_imagen
+        self.descriptor = np.asarray(descriptor, dtype=np.float32)
+        self.alto = alto
+        self.ancho = ancho
+        self.descripcion = descripcion
+
+    @property
+    def id(self) -> str:
+        return os.path.splitext(self.nombre)[0]
+
+    def a_dict(self) -> dict:
+        return {"mtime": self.mtime, "hash": f"{self.hash_imagen:016x}", "descriptor": self.descriptor.round(5).tolist(),
+                "alto": self.alto, "ancho": self.ancho}
+
+    @classmethod
+    def desde_dict(cls, nombre: str, datos: dict):
+        return cls(nombre, datos["mtime"], int(datos["hash"], 16), datos["descriptor"], datos["alto"], datos["ancho"])
+
+
+class IndiceUI:
+    """
+    Índice local de los elementos de interfaz de capture/, sin servicios externos.
+
+    Cada plantilla guarda un hash perceptual (dHash) y un descriptor pequeño de la imagen, y
+    un vector de trigramas de su ID y su descripción (capture/descripciones.json). Los vectores
+    se apilan en matrices de NumPy, así que una búsqueda es un producto matriz-vector (texto) o
+    un XOR con popcount (imagen): unos cientos de microsegundos aun con miles de plantillas.
+
+    `sincronizar()` compara las fechas de modificación con las del índice y solo procesa las
+    capturas nuevas o cambiadas y quita las borradas. Los rasgos se guardan en
+    cache/indice_ui.json para no volver a decodificar todas las imágenes en cada arranque.
+
+    Args:
+        directorio (str): Carpeta de las plantillas.
+        ruta_descripciones (str): JSON nombre -> descripción.
+        ruta_cache (str | None): Dónde persistir los rasgos; None para no persistirlos.
+    """
+
+    def __init__(self, directorio: str = CAPTURE_DIR, ruta_descripciones: str = None,
+                 ruta_cache: str = INDICE_CACHE_PATH):
+        self.directorio = directorio
+        self.ruta_descripciones = ruta_descripciones or os.path.join(directorio, "descripciones.json")
+        self.ruta_cache = ruta_cache
+        self._elementos = {}
+        self._descripciones = {}
+        self._mtime_descripciones = None
+        self._matrices = None
+        self._lock = threading.RLock()
+        self._cargar_cache()
+
+    # --- Mantenimiento del índice ---
+
+    def _cargar_cache(self):
+        if not self.ruta_cache or not os.path.exists(self.ruta_cache):
+            return
+        try:
+            with open(self.ruta_cache, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+            self._elementos = {nombre: ElementoUI.desde_dict(nombre, d) for nombre, d in datos.items()}
+        except (OSError, ValueError, KeyError) as e:
+            print(f"DEBUG IndiceUI: caché del índice ignorada ({e}).")
+            self._elementos = {}
+
+    def _guardar_cache(self):
+        if not self.ruta_cache:
+            return
+        os.makedirs(os.path.dirname(self.ruta_cache), exist_ok=True)
+        temporal = self.ruta_cache + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({nombre: e.a_dict() for nombre, e in self._elementos.items()}, f)
+        os.replace(temporal, self.ruta_cache)
+
+    def _leer_descripciones(self):
+        try:
+            mtime = os.path.getmtime(self.ruta_descripciones)
+        except OSError:
+            mtime = None
+        if mtime == self._mtime_descripciones:
+            return False
+        self._mtime_descripciones = mtime
+        self._descripciones = {}
+        if mtime is not None:
+            with open(self.ruta_descripciones, "r", encoding="utf-8") as f:
+                self._descripciones = json.load(f)
+        return True
+
+    def agregar(self, nombre: str) -> ElementoUI:
+        """Añade (o actualiza) una plantilla del directorio al índice."""
+        ruta = os.path.join(self.directorio, nombre)
+        gris = cv2.imread(ruta, cv2.IMREAD_GRAYSCALE)
+        if gris is None:
+            raise FileNotFoundError(f"No se pudo leer la plantilla '{ruta}'.")
+        elemento = ElementoUI(nombre, os.path.getmtime(ruta), dhash(gris), descriptor_imagen(gris), *gris.shape[:2],
+                              descripcion=self._descripciones.get(nombre, ""))
+        with self._lock:
+            self._elementos[nombre] = elemento
+            self._matrices = None
+        return elemento
+
+    def eliminar(self, nombre: str):
+        with self._lock:
+            if self._elementos.pop(nombre, None) is not None:
+                self._matrices = None
+
+    def sincronizar(self):
+        """
+        Pone el índice al día con el directorio: añade las capturas nuevas o modificadas,
+        quita las borradas y recoge los cambios de descripciones.json.
+
+        Returns:
+            tuple: (añadidas, eliminadas) como listas de nombres.
+        """
+        with self._lock:
+            cambio_descripciones = self._leer_descripciones()
+            en_disco = {}
+            for nombre in os.listdir(self.directorio):
+                if nombre.lower().endswith(".png"):
+                    en_disco[nombre] = os.path.getmtime(os.path.join(self.directorio, nombre))
+
+            eliminadas = [nombre for nombre in self._elementos if nombre not in en_disco]
+            for nombre in eliminadas:
+                self.eliminar(nombre)
+            anadidas = []
+            for nombre, mtime in en_disco.items():
+                elemento = self._elementos.get(nombre)
+                if elemento is None or elemento.mtime != mtime:
+                    try:
+                        self.agregar(nombre)
+                    except FileNotFoundError as e:
+                        print(f"DEBUG IndiceUI: {e}")
+                        continue
+                    anadidas.append(nombre)
+
+            if cambio_descripciones or anadidas or eliminadas:
+                for nombre, elemento in self._elementos.items():
+                    elemento.descripcion = self._descripciones.get(nombre, "")
+                self._matrices = None
+            for nombre in anadidas:
+                parecida = self._parecida(self._elementos[nombre])
+                if parecida:
+                    print(f"DEBUG IndiceUI: '{nombre}' es casi igual que '{parecida}'.")
+            if anadidas or eliminadas:
+                self._guardar_cache()
+                print(f"DEBUG IndiceUI: {len(anadidas)} plantillas indexadas, {len(eliminadas)} eliminadas "
+                      f"({len(self._elementos)} en total).")
+            return anadidas, eliminadas
+
+    def _parecida(self, elemento: ElementoUI, distancia_max: int = 4):
+        otros = [(nombre, r) for nombre, r in self.buscar_imagen_rasgos(elemento.hash_imagen, elemento.descriptor, k=2)
+                 if nombre != elemento.nombre]
+        if otros and otros[0][1] <= distancia_max:
+            return otros[0][0]
+        return None
+
+    def _construir_matrices(self):
+        with self._lock:
+            if self._matrices is None:
+                nombres = sorted(self._elementos, key=_orden_natural)
+                elementos = [self._elementos[n] for n in nombres]
+                self._matrices = (
+                    nombres,
+                    np.array([vector_texto(f"{e.id} {e.descripcion}", quitar_vacias=True) for e in elementos],
+                             dtype=np.float32).reshape(len(nombres), DIMENSION_TEXTO),
+                    np.array([e.hash_imagen for e in elementos], dtype=np.uint64),
+                    np.array([e.descriptor for e in elementos], dtype=np.float32).reshape(len(nombres), -1),
+                )
+            return self._matrices
+
+    # --- Consultas ---
+
+    def __len__(self):
+        return len(self._elementos)
+
+    def nombres(self) -> list:
+        return self._construir_matrices()[0]
+
+    def elemento(self, nombre: str):
+        return self._elementos.get(nombre)
+
+    def buscar_texto(self, consulta: str, k: int = 3) -> list:
+        """
+        Los k elementos cuya descripción más se parece a `consulta`.
+
+        Returns:
+            list: (nombre, similitud entre 0 y 1), de mayor a menor similitud.
+        """
+        nombres, textos, _, _ = self._construir_matrices()
+        if not nombres:
+            return []
+        similitudes = textos @ vector_texto(consulta, quitar_vacias=True)
+        mejores = _k_mejores(-similitudes, k)
+        return [(nombres[i], float(similitudes[i])) for i in mejores]
+
+    def buscar_imagen(self, imagen, k: int = 3) -> list:
+        """
+        Los k elementos más parecidos a una imagen (BGR o gris), por ejemplo un recorte nuevo,
+        para detectar duplicados o saber a qué plantilla corresponde.
+
+        Returns:
+            list: (nombre, distancia de Hamming entre dHash), de más a menos parecido.
+        """
+        gris = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY) if imagen.ndim == 3 else imagen
+        return self.buscar_imagen_rasgos(dhash(gris), descriptor_imagen(gris), k)
+
+    def buscar_imagen_rasgos(self, hash_imagen: int, descriptor, k: int = 3) -> list:
+        nombres, _, hashes, descriptores = self._construir_matrices()
+        if not nombres:
+            return []
+        distancias = np.bitwise_count(hashes ^ np.uint64(hash_imagen)).astype(np.int32)
+        # Desempate por el descriptor: con plantillas pequeñas o planas el dHash coincide a menudo.
+        # El descriptor normalizado está a distancia < 2 (más la diferencia de aspecto, acotada).
+        desempate = np.linalg.norm(descriptores - np.asarray(descriptor, dtype=np.float32), axis=1)
+        mejores = _k_mejores(distancias + np.minimum(desempate, 9.0) / 10.0, k)
+        return [(nombres[i], int(distancias[i])) for i in mejores]
+
+    def resolver(self, referencia: str, umbral: float = UMBRAL_TEXTO, margen: float = MARGEN_TEXTO):
+        """
+        Traduce la referencia de un paso del plan a un archivo de plantilla: acepta el nombre
+        ("i1.png"), el ID ("i1") o una descripción ("icono de TIA Portal").
+
+        Una descripción solo se acepta si su similitud llega a `umbral` y supera en `margen` a
+        la del segundo elemento más parecido; ante la duda es mejor no resolver (el flujo se
+        detiene) que hacer clic en otro elemento.
+
+        Returns:
+            str | None: Nombre del archivo, o None si nada se parece lo suficiente.
+        """
+        if not referencia:
+            return None
+        referencia = str(referencia).strip()
+        for candidato in (referencia, referencia + ".png", os.path.basename(referencia)):
+            if candidato in self._elementos:
+                return candidato
+        resultados = self.buscar_texto(referencia, k=2)
+        if not resultados or resultados[0][1] < umbral:
+            return None
+        if len(resultados) > 1 and resultados[0][1] - resultados[1][1] < margen:
+            print(f"DEBUG IndiceUI: '{referencia}' es ambigua entre {resultados[0][0]} ({resultados[0][1]:.2f}) "
+                  f"y {resultados[1][0]} ({resultados[1][1]:.2f}).")
+            return None
+        return resultados[0][0]
+
+    def catalogo(self) -> str:
+        """Lista "- ID: descripción" de los elementos, para incluirla en el prompt del plan."""
+        lineas = []
+        for nombre in self.nombres():
+            elemento = self._elementos[nombre]
+            lineas.append(f"- {nombre}: {elemento.descripcion or 'sin descripción'}")
+        return "\n".join(lineas)
+
+
+def _k_mejores(costes: np.ndarray, k: int) -> np.ndarray:
+    """Índices de los k costes más bajos, ordenados, sin ordenar el array completo."""
+    if k < costes.size:
+        parte = np.argpartition(costes, k)[:k]
+    else:
+        parte = np.arange(costes.size)
+    return parte[np.argsort(costes[parte])]
+
+
+def _orden_natural(nombre: str):
+    return [int(t) if t.isdigit() else t for t in re.split(r"(\d+)", nombre)]
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def obtener_indice() -> IndiceUI:
+    """Índice compartido del proceso, sincronizado con capture/ en cada llamada."""
+    global _indice
+    with _indice_lock:
+        if _indice is None:
+            _indice = IndiceUI()
+    _indice.sincronizar()
+    return _indice
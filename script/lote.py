@@ -0,0 +1,152 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from script import agente_instrucciones, generador_scl
+from script.agente_instrucciones import generar_plan
+from script.generador_scl import codificar_scl
+from script.cliente_llm import LimiteTasa
+from script.orquestador import pasos_del_plan, resolver_elementos
+
+SALIDA_POR_DEFECTO = os.path.join(project_root, "salida_lote")
+
+
+def leer_ordenes(path: str, monitor_por_defecto: int = 1) -> list:
+    """
+    Lee un JSONL de órdenes. Cada línea puede tener la forma de steps.json
+    ("orden_input", "monitor_id_input") o de una petición ("request_id", "title", "body"),
+    o simplemente {"id": ..., "orden": ..., "monitor_id": ...}.
+    """
+    ordenes = []
+    with open(path, "r", encoding="utf-8") as f:
+        for num_linea, linea in enumerate(f, start=1):
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                datos = json.loads(linea)
+            except json.JSONDecodeError as e:
+                print(f"ADVERTENCIA Lote: línea {num_linea} ignorada, no es JSON válido: {e}")
+                continue
+            orden = datos.get("orden") or datos.get("orden_input") or datos.get("order") or datos.get("body")
+            if not orden:
+                print(f"ADVERTENCIA Lote: línea {num_linea} ignorada, no contiene ninguna orden.")
+                continue
+            ordenes.append({
+                "id": str(datos.get("id") or datos.get("request_id") or f"orden-{num_linea:04d}"),
+                "orden": orden,
+                "monitor_id": int(datos.get("monitor_id") or datos.get("monitor_id_input") or monitor_por_defecto),
+            })
+    return ordenes
+
+
+def _nombre_seguro(texto: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", texto).strip("_") or "orden"
+
+
+def procesar_lote(ordenes: list, salida: str = SALIDA_POR_DEFECTO, concurrencia: int = 4,
+                  por_minuto: float = 0, usar_cache: bool = True) -> list:
+    """
+    Genera plan y código SCL de cada orden sin tocar la pantalla.
+
+    Las dos llamadas de cada orden se lanzan a la vez y todas comparten un máximo de
+    `concurrencia` llamadas en vuelo y un límite de `por_minuto` peticiones. El límite se
+    aplica en los clientes LLM a cada petición real (correcciones del SCL, reintentos y
+    duplicados incluidos); lo que se sirve de la caché o de la biblioteca no lo consume. Por cada orden se
+    escribe `<salida>/<id>/plan.json` (con la forma de steps.json) y `<salida>/<id>/codigo.scl`,
+    y al final `<salida>/resumen.jsonl` con el resultado de cada una.
+
+    Returns:
+        list: Un dict de resumen por orden, en el orden de entrada.
+    """
+    os.makedirs(salida, exist_ok=True)
+    limite = LimiteTasa(por_minuto, rafaga=concurrencia)
+    clientes = (agente_instrucciones.cliente, generador_scl.cliente)
+    anteriores = [cliente.antes_de_peticion for cliente in clientes]
+    for cliente in clientes:
+        cliente.antes_de_peticion = limite.adquirir
+
+    def cronometrado(funcion, *args):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        return resultado, time.perf_counter() - inicio
+
+    try:
+        return _procesar(ordenes, salida, concurrencia, usar_cache, cronometrado)
+    finally:
+        for cliente, anterior in zip(clientes, anteriores):
+            cliente.antes_de_peticion = anterior
+
+
+def _procesar(ordenes: list, salida: str, concurrencia: int, usar_cache: bool, cronometrado) -> list:
+    with ThreadPoolExecutor(max_workers=max(1, concurrencia), thread_name_prefix="lote") as pool:
+        tareas = []
+        for orden in ordenes:
+            futuro_plan = pool.submit(cronometrado, generar_plan, orden["orden"], orden["monitor_id"], usar_cache)
+            futuro_scl = pool.submit(cronometrado, codificar_scl, orden["orden"], usar_cache)
+            tareas.append((orden, futuro_plan, futuro_scl))
+
+        resumen = []
+        for orden, futuro_plan, futuro_scl in tareas:
+            directorio = os.path.join(salida, _nombre_seguro(orden["id"]))
+            os.makedirs(directorio, exist_ok=True)
+            fila = {"id": orden["id"], "orden": orden["orden"], "monitor_id": orden["monitor_id"], "directorio": directorio}
+
+            try:
+                plan, fila["segundos_plan"] = futuro_plan.result()
+                # Igual que en la ejecución: los pasos quedan apuntando a archivos de capture/.
+                plan = dict(plan, text=resolver_elementos(pasos_del_plan(plan)))
+                with open(os.path.join(directorio, "plan.json"), "w", encoding="utf-8") as f:
+                    json.dump(plan, f, indent=2, ensure_ascii=False)
+                fila["plan"] = "ok"
+            except Exception as e:
+                fila["plan"] = f"error: {e}"
+
+            try:
+                codigo_scl, fila["segundos_scl"] = futuro_scl.result()
+                if codigo_scl is None:
+                    raise RuntimeError("codificar_scl no devolvió código.")
+                with open(os.path.join(directorio, "codigo.scl"), "w", encoding="utf-8") as f:
+                    f.write(codigo_scl)
+                fila["scl"] = "ok"
+            except Exception as e:
+                fila["scl"] = f"error: {e}"
+
+            print(f"DEBUG Lote: {orden['id']}: plan={fila['plan']} scl={fila['scl']}")
+            resumen.append(fila)
+
+    with open(os.path.join(salida, "resumen.jsonl"), "w", encoding="utf-8") as f:
+        for fila in resumen:
+            f.write(json.dumps(fila, ensure_ascii=False) + "\n")
+    return resumen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera planes y código SCL para un lote de órdenes sin usar la interfaz gráfica.")
+    parser.add_argument("entrada", help="Archivo JSONL con una orden por línea.")
+    parser.add_argument("--salida", default=SALIDA_POR_DEFECTO, help="Directorio de resultados.")
+    parser.add_argument("--concurrencia", type=int, default=4, help="Llamadas al LLM simultáneas.")
+    parser.add_argument("--por-minuto", type=float, default=0, help="Máximo de peticiones al LLM por minuto, reintentos y correcciones incluidos (0 = sin límite).")
+    parser.add_argument("--monitor", type=int, default=1, help="Monitor por defecto para las órdenes que no lo indiquen.")
+    parser.add_argument("--sin-cache", action="store_true", help="No leer ni escribir la caché de respuestas del LLM.")
+    args = parser.parse_args(argv)
+
+    ordenes = leer_ordenes(args.entrada, args.monitor)
+    print(f"DEBUG Lote: {len(ordenes)} órdenes leídas de {args.entrada}")
+    inicio = time.perf_counter()
+    resumen = procesar_lote(ordenes, args.salida, args.concurrencia, args.por_minuto, not args.sin_cache)
+    fallidas = sum(1 for fila in resumen if fila["plan"] != "ok" or fila["scl"] != "ok")
+    print(f"\n✅ Lote terminado en {time.perf_counter() - inicio:.1f} s: {len(resumen) - fallidas} correctas, {fallidas} con errores. Resultados en {args.salida}")
+    return 1 if fallidas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
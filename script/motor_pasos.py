@@ -0,0 +1,96 @@
+import time
+import threading
+
+from script.plantillas import obtener_almacen, CONFIANZA_POR_DEFECTO
+from script.captura import obtener_capturador
+from script.cache_coordenadas import obtener_cache_coordenadas
+
+
+class Prebusqueda:
+    """
+    Búsqueda anticipada de los próximos pasos en un hilo de fondo.
+
+    Mientras el hilo principal ejecuta el clic o el pegado del paso actual, este hilo captura
+    el monitor una y otra vez y busca en cada fotograma todas las plantillas pendientes a la
+    vez. Cada resultado guarda el instante de su captura: el hilo principal solo lo aprovecha
+    si el fotograma se tomó después de terminar la acción anterior, así nunca se hace clic con
+    una posición de una pantalla que ya no existe.
+
+    Args:
+        monitor_id (int, optional): Monitor donde buscar. Por defecto, MONITOR_ID.
+        anticipacion (int): Cuántos pasos por delante se buscan en cada fotograma.
+        intervalo (float): Pausa mínima (s) entre dos capturas del hilo de fondo.
+    """
+
+    def __init__(self, monitor_id: int = None, anticipacion: int = 2, intervalo: float = 0.05,
+                 confianza: float = CONFIANZA_POR_DEFECTO):
+        self.capturador = obtener_capturador(monitor_id)
+        self.almacen = obtener_almacen()
+        self.coordenadas = obtener_cache_coordenadas()
+        self.anticipacion = anticipacion
+        self.intervalo = intervalo
+        self.confianza = confianza
+
+        self._pendientes = []
+        self._resultados = {}  # nombre -> (instante_captura, Box global)
+        self._cond = threading.Condition()
+        self._activo = True
+        self._hilo = threading.Thread(target=self._bucle, name="prebusqueda", daemon=True)
+        self._hilo.start()
+
+    def programar(self, nombres):
+        """Sustituye la lista de plantillas pendientes (en orden de ejecución)."""
+        with self._cond:
+            self._pendientes = list(dict.fromkeys(nombres))[:self.anticipacion]
+            self._cond.notify()
+
+    def resultado(self, nombre: str, desde: float):
+        """
+        Devuelve la posición anticipada de `nombre` si se encontró en un fotograma capturado
+        después del instante `desde` (time.monotonic()). None en caso contrario.
+        """
+        with self._cond:
+            entrada = self._resultados.get(nombre)
+        if entrada is None or entrada[0] < desde:
+            return None
+        return entrada[1]
+
+    def detener(self):
+        with self._cond:
+            self._activo = False
+            self._pendientes = []
+            self._cond.notify()
+        self._hilo.join(timeout=2)
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                while self._activo and not self._pendientes:
+                    self._cond.wait()
+                if not self._activo:
+                    return
+                pendientes = list(self._pendientes)
+
+            inicio = time.monotonic()
+            try:
+                captura = self.capturador.capturar()
+                # Solo la vía gruesa: las plantillas de los pasos siguientes casi nunca están aún en
+                # pantalla y el respaldo a resolución completa costaría más de un segundo por cada
+                # una a 4K. Si algo solo se confirma a resolución completa, lo busca el propio paso.
+                encontrados = self.coordenadas.localizar_varios(pendientes, captura, self.capturador.monitor,
+                                                                self.almacen, self.confianza,
+                                                                respaldo_completo=False)
+            except Exception as e:
+                # La búsqueda anticipada es solo una optimización: si falla, el paso busca por su cuenta.
+                print(f"DEBUG Prebusqueda: fallo en la búsqueda anticipada: {e}")
+                time.sleep(0.5)
+                continue
+
+            with self._cond:
+                for nombre, box in encontrados.items():
+                    if box is not None:
+                        self._resultados[nombre] = (inicio, captura.a_global(box))
+
+            espera = self.intervalo - (time.monotonic() - inicio)
+            if espera > 0:
+                time.sleep(espera)
@@ -0,0 +1,368 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from script.motor_pasos import Prebusqueda
+from script.captura import obtener_capturador
+from script.sincronizacion import EsperaPantalla, PoliticaReintentos, PasoFallido
+from script.generador_scl import codificar_scl
+from script.agente_instrucciones import generar_plan, guardar_steps, guardar_plan_validado, invalidar_plan
+from script.trazas import iniciar_traza, finalizar_traza, span, evento
+from script.indice_ui import obtener_indice
+from script.biblioteca_planes import obtener_biblioteca
+from script.cache_coordenadas import obtener_cache_coordenadas
+from script.diario import DiarioEjecucion, huella_pantalla, distancia_huellas
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STEPS_JSON_PATH = os.path.join(project_root, "parsed_steps", "steps.json")
+
+# Fracción máxima de bits distintos entre la huella del diario y la pantalla para reanudar.
+DISTANCIA_REANUDAR = float(os.getenv("PLCAID_DIARIO_DISTANCIA", "0.1"))
+
+
+class FlujoError(RuntimeError):
+    """El flujo no se pudo preparar (plan o pasos inválidos)."""
+
+
+def pasos_del_plan(raw_steps_data) -> list:
+    """Devuelve la lista de pasos de un plan (bajo la clave 'text' o el JSON directo)."""
+    # Acceder a la lista de pasos a través de la clave 'text'
+    if isinstance(raw_steps_data, dict) and "text" in raw_steps_data:
+        steps = raw_steps_data["text"]
+    else:
+        # Si por alguna razón no es un dict o no tiene 'text', intentamos cargarlo directo
+        # Esto es un fallback, lo ideal es que siempre venga en "text"
+        steps = raw_steps_data
+        print("ADVERTENCIA: El JSON de pasos no contiene la clave 'text'. Asumiendo que el JSON es directamente la lista.")
+    if not isinstance(steps, list):
+        raise FlujoError(f"El plan no contiene una lista de pasos: {steps!r}")
+    return steps
+
+
+def resolver_elementos(steps: list) -> list:
+    """
+    Traduce el "step" de cada paso (nombre de plantilla, ID o descripción) a un archivo de
+    capture/ con el índice de elementos. La referencia original se conserva en "referencia"
+    cuando cambia.
+    """
+    indice = obtener_indice()
+    resueltos = []
+    for num, paso in enumerate(steps, start=1):
+        referencia = paso.get("step")
+        nombre = indice.resolver(referencia)
+        if nombre is None:
+            raise FlujoError(f"El paso {num} se refiere a '{referencia}', que no coincide con ningún elemento de capture/.")
+        if nombre != referencia:
+            print(f"DEBUG: Paso {num}: '{referencia}' resuelto como '{nombre}'.")
+            paso = dict(paso, step=nombre, referencia=referencia)
+        resueltos.append(paso)
+    return resueltos
+
+
+def leer_pasos(path: str = STEPS_JSON_PATH) -> list:
+    """Lee steps.json y devuelve la lista de pasos."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw_steps_data = json.load(f) # Cargar todo el diccionario
+    except FileNotFoundError:
+        raise FlujoError(f"No se encontró el archivo de pasos en {path}. El agente puede haber fallado o la ruta es incorrecta.")
+    except json.JSONDecodeError as e:
+        raise FlujoError(f"Error al parsear steps.json: {e}")
+    steps = pasos_del_plan(raw_steps_data)
+    print(f"DEBUG: {len(steps)} pasos cargados de {path}")
+    return steps
+
+
+class TareaSCL:
+    """
+    Generación del código SCL en segundo plano.
+
+    Se lanza en cuanto se conoce la orden, en paralelo con el plan de pasos y con los primeros
+    clics, y solo se bloquea en `obtener()`, es decir, al llegar al paso de pegado.
+
+    Args:
+        order (str): Orden del operador.
+        pool (ThreadPoolExecutor): Hilos donde se genera el código.
+        codigo (str, optional): Código ya generado (por ejemplo, el del diario); no se pide.
+        al_generar (callable, optional): Recibe el código en cuanto se genera bien.
+        max_generaciones (int): Generaciones fallidas tras las que se abandona el flujo.
+    """
+
+    def __init__(self, order: str, pool: ThreadPoolExecutor, codigo: str = None, al_generar=None,
+                 max_generaciones: int = 3):
+        self.order = order
+        self.pool = pool
+        self.al_generar = al_generar
+        self.max_generaciones = max_generaciones
+        self.fallidas = 0
+        if codigo is not None:
+            self._futuro = Future()
+            self._futuro.set_result(codigo)
+        else:
+            self._futuro = self._lanzar()
+
+    def _lanzar(self):
+        futuro = self.pool.submit(codificar_scl, self.order)
+        if self.al_generar is not None:
+            futuro.add_done_callback(self._generado)
+        return futuro
+
+    def _generado(self, futuro):
+        if not futuro.cancelled() and futuro.exception() is None and futuro.result() is not None:
+            self.al_generar(futuro.result())
+
+    def obtener(self) -> str:
+        if not self._futuro.done():
+            print("DEBUG: Esperando a que termine la generación del código SCL...")
+        codigo_scl = self._futuro.result()
+        if codigo_scl is None:
+            self.fallidas += 1
+            if self.fallidas >= self.max_generaciones:
+                # Reintentar el paso no lo arregla: cada reintento sería otra tanda de llamadas al LLM.
+                raise FlujoError(f"No se pudo generar un código SCL válido tras {self.fallidas} intentos.")
+            # codificar_scl devuelve None si falla: se relanza para el siguiente reintento del paso.
+            self._futuro = self._lanzar()
+            raise RuntimeError("No se pudo generar el código SCL.")
+        return codigo_scl
+
+
+def _sin_progreso(evento: dict):
+    pass
+
+
+def _paso_reanudable(diario: DiarioEjecucion, steps: list, capturador) -> int:
+    """
+    Paso por el que continuar una ejecución anterior: el primero pendiente del diario si la
+    pantalla coincide con la huella que dejó el último paso hecho o si ya se ve el elemento
+    del paso pendiente. Si no, los pasos del diario se descartan y se empieza por el primero.
+    """
+    pendiente = diario.primer_pendiente()
+    if pendiente == 0 or pendiente >= len(steps):
+        return pendiente
+    captura = capturador.capturar()
+    huella = diario.huella(pendiente - 1)
+    distancia = distancia_huellas(huella, huella_pantalla(captura)) if huella is not None else 1.0
+    if distancia <= DISTANCIA_REANUDAR:
+        print(f"DEBUG: La pantalla coincide con el diario (distancia {distancia:.2f}).")
+        return pendiente
+    step = steps[pendiente].get("step")
+    try:
+        visible = obtener_cache_coordenadas().localizar(step, captura, capturador.monitor) is not None
+    except FileNotFoundError:
+        visible = False
+    if visible:
+        print(f"DEBUG: La pantalla ha cambiado (distancia {distancia:.2f}), pero '{step}' está visible.")
+        return pendiente
+    print(f"DEBUG: La pantalla no coincide con el diario (distancia {distancia:.2f}) y '{step}' no está visible; se empieza por el primer paso.")
+    diario.olvidar_pasos()
+    return 0
+
+
+def ejecutar_flujo(order: str, monitor_id: int = 1, progreso=None, accion=None, ruta_steps: str = STEPS_JSON_PATH,
+                   reanudar: bool = True):
+    """
+    Genera el plan y el código SCL de la orden y ejecuta los pasos en pantalla.
+
+    Las dos llamadas al LLM solo dependen de la orden, así que el SCL se pide a la vez que el
+    plan y los pasos de clic avanzan mientras se genera; solo el paso "texto" espera por él.
+
+    Args:
+        order (str): Orden del operador.
+        monitor_id (int): Monitor de mss donde está TIA Portal.
+        progreso (callable, optional): Recibe un dict por cada evento del flujo ("plan",
+                                       "reanudar", "paso_inicio", "paso_fin", "reintento" y, al
+                                       terminar, "traza" con las rutas de la traza guardada).
+        accion (callable, optional): Sustituye a execute_actions.action (por ejemplo, en las
+                                     pruebas de rendimiento sin escritorio).
+        ruta_steps (str): Dónde se guarda el plan generado.
+        reanudar (bool): Continuar desde el diario de una ejecución anterior de la misma orden
+                         (script/diario.py) si la hay; si es False, se descarta y se empieza
+                         de cero (plan y SCL nuevos).
+
+    Raises:
+        FlujoError: Si no se pudo generar o leer el plan.
+        PasoFallido: Si un paso agota su tiempo (PLCAID_TIMEOUT_PASO) sin completarse.
+
+    Si todos los pasos terminan bien, el plan se guarda en la biblioteca de planes para
+    reutilizarlo con órdenes parecidas; si se había reutilizado y falla, se anota el fallo.
+
+    El plan, el SCL y cada paso completado se anotan en el diario de la ejecución; si el flujo
+    falla o se interrumpe, volver a ejecutar la misma orden reutiliza plan y SCL y continúa en
+    el primer paso pendiente. Si el plan reanudado vuelve a fallar en el mismo paso, se
+    descarta; tras un FlujoError se descarta el diario entero.
+    """
+    progreso = progreso or _sin_progreso
+    if accion is None:
+        # Importación diferida: pyautogui necesita un escritorio real.
+        from script.execute_actions import action as accion
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scl")
+    prebusqueda = None
+    plan = None
+    iniciar_traza("flujo", orden=order, monitor_id=monitor_id)
+    diario = DiarioEjecucion(order, monitor_id)
+    if not reanudar:
+        diario.borrar()
+    elif diario.cargar():
+        print(f"DEBUG: Diario de una ejecución anterior encontrado en {diario.ruta}.")
+    try:
+        if diario.scl is not None:
+            print("DEBUG: Código SCL recuperado del diario.")
+        else:
+            print("DEBUG: Generación de código SCL lanzada en paralelo.")
+        tarea_scl = TareaSCL(order, pool, codigo=diario.scl, al_generar=diario.guardar_scl)
+
+        plan_del_diario = diario.plan is not None
+        if plan_del_diario:
+            print("DEBUG: Plan recuperado del diario, sin llamar a generar_plan.")
+            plan = diario.plan
+        else:
+            # Ejecutar agente para generar steps.json
+            print("DEBUG: Llamando a generar_plan...")
+            try:
+                plan = generar_plan(order, monitor_id)
+                print("DEBUG: generar_plan completado.")
+            except Exception as e:
+                raise FlujoError(f"Fallo al generar JSON de pasos: {e}") from e
+
+        steps = resolver_elementos(pasos_del_plan(plan))
+        origen = plan.get("biblioteca") if isinstance(plan, dict) else None
+        reutilizado = origen["id"] if origen else None
+        if diario.plan is None:
+            diario.guardar_plan(dict(plan, text=steps))
+        guardar_steps(dict(plan, text=steps), ruta_steps)
+        print(f"DEBUG: {len(steps)} pasos en el plan.")
+        total_steps = len(steps)
+        progreso({"evento": "plan", "total": total_steps, "pasos": steps, "biblioteca": origen})
+
+        capturador = obtener_capturador(monitor_id)
+        num_step = _paso_reanudable(diario, steps, capturador)
+        if num_step > 0:
+            print(f"DEBUG: Se reanuda la ejecución en el paso {num_step + 1}/{total_steps}.")
+            evento("reanudar", "paso", paso=num_step + 1, total=total_steps)
+            progreso({"evento": "reanudar", "paso": num_step + 1, "total": total_steps})
+
+        # Búsqueda anticipada: mientras se ejecuta un paso, un hilo localiza los siguientes.
+        prebusqueda = Prebusqueda(monitor_id)
+        fin_paso_anterior = time.monotonic()
+        prebusqueda.programar([paso.get("step") for paso in steps[num_step:]])
+
+        # En lugar de pausas fijas, se espera a que la pantalla se asiente o aparezca el siguiente elemento.
+        espera_pantalla = EsperaPantalla.desde_entorno(capturador, prebusqueda)
+        politica = PoliticaReintentos.desde_entorno()
+        reintentos = 0
+        inicio_paso = time.monotonic()
+
+        print(f"DEBUG: Iniciando ejecución de {total_steps} pasos...")
+        while num_step < total_steps:
+            step_data = steps[num_step]
+            step_image_name = step_data.get("step", "N/A")
+            step_action_type = step_data.get("action", "N/A")
+
+            if reintentos == 0:
+                inicio_paso = time.monotonic()
+            print(f"DEBUG: Ejecutando paso {num_step + 1}/{total_steps}: Imagen='{step_image_name}', Acción='{step_action_type}'")
+            progreso({"evento": "paso_inicio", "paso": num_step + 1, "total": total_steps, "step": step_image_name, "action": step_action_type})
+
+            try:
+                with span("paso", "paso", paso=num_step + 1, step=step_image_name, action=step_action_type,
+                          intento=reintentos + 1):
+                    if step_action_type == "texto":
+                        with span("espera_scl", "llm"):
+                            codigo_scl = tarea_scl.obtener()
+                        print(f"DEBUG: Código SCL generado (primeras 50 chars):\n{codigo_scl[:50]}...") # Mostrar solo el inicio
+                        # Solo vale una posición capturada después de que terminara la acción anterior.
+                        location = prebusqueda.resultado(step_image_name, desde=fin_paso_anterior)
+                        accion(step_image_name, step_action_type, codigo_scl, monitor_id=monitor_id, location=location) # Pasar codigo_scl como text_content
+                    else: # "clic"
+                        location = prebusqueda.resultado(step_image_name, desde=fin_paso_anterior)
+                        accion(step_image_name, step_action_type, monitor_id=monitor_id, location=location)
+                fin_paso_anterior = time.monotonic()
+                print(f"DEBUG: Paso {num_step + 1} completado.")
+                progreso({"evento": "paso_fin", "paso": num_step + 1, "total": total_steps, "step": step_image_name})
+                num_step += 1
+                reintentos = 0
+                # El paso ya está hecho: nada de lo que sigue puede contarse como fallo del
+                # siguiente paso ni dejar de anotarlo en el diario (se volvería a repetir).
+                if num_step < total_steps:
+                    try:
+                        prebusqueda.programar([paso.get("step") for paso in steps[num_step:]])
+                        with span("espera_pantalla", "espera", step=steps[num_step].get("step")) as traza:
+                            motivo = espera_pantalla.esperar(steps[num_step].get("step"), desde=fin_paso_anterior)
+                            traza["motivo"] = motivo
+                        print(f"DEBUG: Espera tras el paso {num_step} terminada por: {motivo} ({time.monotonic() - fin_paso_anterior:.2f} s)")
+                    except Exception as e:
+                        # El siguiente paso localiza su elemento y reintenta por su cuenta.
+                        print(f"ADVERTENCIA: Falló la espera tras el paso {num_step}: {e}")
+                # Con la pantalla ya asentada: es el estado desde el que se reanudaría. Sin huella
+                # el paso se anota igualmente y al reanudar se mira si se ve el elemento pendiente.
+                huella = None
+                if diario.activo and num_step < total_steps:
+                    try:
+                        huella = huella_pantalla(capturador.capturar())
+                    except Exception as e:
+                        print(f"ADVERTENCIA: No se pudo tomar la huella de la pantalla tras el paso {num_step}: {e}")
+                try:
+                    diario.completar_paso(num_step - 1, huella)
+                except Exception as e:
+                    print(f"ADVERTENCIA: No se pudo anotar el paso {num_step} en el diario: {e}")
+            except FlujoError:
+                raise
+            except Exception as e:
+                print(f"ERROR en paso {num_step + 1} (Imagen: {step_image_name}, Acción: {step_action_type}): {e}")
+                reintentos += 1
+                if politica.agotada(reintentos, inicio_paso):
+                    if reutilizado is not None:
+                        obtener_biblioteca().registrar_resultado(reutilizado, ok=False)
+                    if plan_del_diario and diario.paso_fallido == num_step:
+                        # Segunda vez que el plan del diario se atasca en el mismo paso: no se repite más.
+                        print(f"DEBUG: El plan del diario ha vuelto a fallar en el paso {num_step + 1}; se descarta.")
+                        diario.olvidar_plan()
+                        siguiente = "Al repetir la orden se generará un plan nuevo."
+                    else:
+                        diario.anotar_fallo(num_step)
+                        siguiente = "Al repetir la orden se continuará desde este paso."
+                    raise PasoFallido(f"El paso {num_step + 1} ha fallado tras {reintentos - 1} reintentos "
+                                      f"({time.monotonic() - inicio_paso:.0f} s): {e}. {siguiente}") from e
+                espera = politica.espera(reintentos, inicio_paso)
+                restante = politica.restante(inicio_paso)
+                evento("reintento", "reintento", paso=num_step + 1, step=step_image_name, reintento=reintentos,
+                       espera_s=round(espera, 3), restante_s=round(restante, 1), error=str(e))
+                progreso({"evento": "reintento", "paso": num_step + 1, "total": total_steps, "step": step_image_name,
+                          "reintento": reintentos, "restante_s": restante, "error": str(e)})
+                print(f"DEBUG: Reintento {reintentos} en cuanto aparezca '{step_image_name}' (máx. {espera:.1f} s; quedan {restante:.0f} s para el paso)...")
+                if espera_pantalla.plantilla_visible(step_image_name, desde=fin_paso_anterior):
+                    # El elemento ya estaba en pantalla: el fallo es de otra cosa y se espera entera.
+                    time.sleep(espera)
+                    fin_paso_anterior = time.monotonic()
+                else:
+                    # El reintento puede usar una posición capturada durante la espera.
+                    fin_paso_anterior = time.monotonic()
+                    espera_pantalla.esperar_plantilla(step_image_name, desde=fin_paso_anterior, timeout=espera)
+
+        # Ejecución completa: el plan queda validado para esta orden y para órdenes parecidas.
+        pasos_validados = [{k: v for k, v in paso.items() if k != "referencia"} for paso in steps]
+        if reutilizado is None:
+            guardar_plan_validado(order, monitor_id, dict(plan, text=pasos_validados))
+        biblioteca = obtener_biblioteca()
+        identificador = biblioteca.agregar(order, monitor_id, pasos_validados)
+        if reutilizado is not None and reutilizado != identificador:
+            biblioteca.registrar_resultado(reutilizado, ok=True)
+        evento("biblioteca_planes", "llm", reutilizado=reutilizado is not None, total=len(biblioteca))
+        diario.cerrar()
+    except (FlujoError, PasoFallido) as e:
+        if plan is not None:
+            # Un plan con el que el flujo ha fallado no se vuelve a servir desde la caché.
+            invalidar_plan(order, monitor_id)
+        if isinstance(e, FlujoError):
+            # Sin plan o SCL utilizables no hay nada que reanudar: la próxima vez se empieza de cero.
+            diario.cerrar()
+        raise
+    finally:
+        if prebusqueda is not None:
+            prebusqueda.detener()
+        # No se espera a una generación SCL que ya no se va a usar (por ejemplo, si falló el plan).
+        pool.shutdown(wait=False, cancel_futures=True)
+        rutas = finalizar_traza()
+        if rutas is not None:
+            progreso({"evento": "traza", "jsonl": rutas[0], "chrome": rutas[1]})
@@ -0,0 +1,308 @@
+import os
+import glob
+import hashlib
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from script.trazas import span
+
+# Carpeta con los recortes de pantalla (plantillas) que se buscan en cada paso.
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CAPTURE_DIR = os.path.join(project_root, "capture")
+
+# Misma confianza que se usaba con pyautogui.locateOnScreen.
+CONFIANZA_POR_DEFECTO = 0.8
+
+# Resultado de una búsqueda, con la misma forma que pyscreeze.Box.
+Box = namedtuple("Box", "left top width height")
+
+
+def _reducir(imagen, escala: int):
+    """
+    Reduce la imagen `escala` veces. Se suaviza con sigma = escala/2 antes de promediar para
+    que el resultado apenas dependa de la fase: una plantilla con texto fino debe parecerse
+    igual a la pantalla reducida esté donde esté, no solo en posiciones múltiplo de `escala`.
+    """
+    suavizada = cv2.GaussianBlur(imagen, (0, 0), escala / 2)
+    alto, ancho = imagen.shape[:2]
+    return cv2.resize(suavizada, (max(1, ancho // escala), max(1, alto // escala)), interpolation=cv2.INTER_AREA)
+
+
+def _construir_piramide(imagen, niveles: int):
+    """Devuelve [imagen, imagen/2, imagen/4, ...] con `niveles` reducciones."""
+    return [imagen] + [_reducir(imagen, 1 << nivel) for nivel in range(1, niveles + 1)]
+
+
+class Plantilla:
+    """
+    Plantilla decodificada una única vez, con sus pirámides en color y en gris.
+
+    Args:
+        nombre (str): Nombre del archivo (ej. "i1.png").
+        ruta (str): Ruta absoluta al PNG.
+        niveles_max (int): Número máximo de reducciones de la pirámide.
+        lado_minimo (int): Lado mínimo (px) que debe conservar la plantilla en el nivel más grueso.
+    """
+
+    def __init__(self, nombre: str, ruta: str, niveles_max: int, lado_minimo: int):
+        # IMREAD_COLOR descarta el canal alfa, igual que hace pyscreeze al cargar la aguja.
+        color = cv2.imread(ruta, cv2.IMREAD_COLOR)
+        if color is None:
+            raise FileNotFoundError(f"No se pudo decodificar la plantilla '{ruta}'.")
+
+        self.nombre = nombre
+        self.ruta = ruta
+        self.mtime = os.path.getmtime(ruta)
+        self.alto, self.ancho = color.shape[:2]
+        # Huella de los píxeles: cambia si se sustituye el recorte, aunque se conserve el nombre.
+        self.huella = hashlib.sha1(color.tobytes()).hexdigest()[:16]
+
+        # Solo se reduce mientras la plantilla siga teniendo detalle suficiente para correlar.
+        niveles = 0
+        while niveles < niveles_max and min(self.alto, self.ancho) >> (niveles + 1) >= lado_minimo:
+            niveles += 1
+        self.niveles = niveles
+
+        self.color = _construir_piramide(color, niveles)
+        self.gris = _construir_piramide(cv2.cvtColor(color, cv2.COLOR_BGR2GRAY), niveles)
+
+
+class Fotograma:
+    """
+    Captura de pantalla (BGR) cuya pirámide en gris se construye bajo demanda y se
+    reutiliza para todas las plantillas que se busquen en ella.
+    """
+
+    def __init__(self, color):
+        self.color = color
+        self._gris = None
+        self._lock = threading.Lock()
+
+    @property
+    def alto(self):
+        return self.color.shape[0]
+
+    @property
+    def ancho(self):
+        return self.color.shape[1]
+
+    def gris(self, nivel: int = 0):
+        with self._lock:
+            if self._gris is None:
+                self._gris = [cv2.cvtColor(self.color, cv2.COLOR_BGR2GRAY)]
+            while len(self._gris) <= nivel:
+                self._gris.append(_reducir(self._gris[0], 1 << len(self._gris)))
+            return self._gris[nivel]
+
+
+def _primera_coincidencia(resultado, confianza: float):
+    """
+    Devuelve (x, y) de la primera posición en orden de barrido con puntuación >= confianza,
+    que es la que devuelve pyscreeze con limit=1 (None si no hay ninguna), y la mejor
+    puntuación del resultado.
+    """
+    mejor = float(resultado.max()) if resultado.size else 0.0
+    filas, columnas = np.nonzero(resultado >= confianza)
+    if filas.size == 0:
+        return None, mejor
+    # np.nonzero recorre en orden de filas, así que el primer elemento es el de pyscreeze.
+    return (int(columnas[0]), int(filas[0])), mejor
+
+
+class AlmacenPlantillas:
+    """
+    Almacén en memoria de las plantillas de `capture/`.
+
+    Cada PNG se decodifica una sola vez y la búsqueda se hace de grueso a fino: primero se
+    correla la pirámide en gris a baja resolución y después se confirma cada candidato en una
+    ventana pequeña a resolución completa con la misma confianza que pyautogui.locateOnScreen.
+
+    Args:
+        directorio (str): Carpeta con las plantillas.
+        niveles_max (int): Reducciones máximas de la pirámide (cada una divide el lado entre 2).
+        lado_minimo (int): Lado mínimo de la plantilla en el nivel grueso.
+        margen_grueso (float): Cuánto se relaja la confianza en el nivel grueso para no perder candidatos.
+        max_candidatos (int): Candidatos gruesos que se verifican a resolución completa.
+        respaldo_completo (bool): Si ningún candidato se confirma, repetir la búsqueda a resolución completa.
+    """
+
+    def __init__(self, directorio: str = CAPTURE_DIR, niveles_max: int = 2, lado_minimo: int = 8,
+                 margen_grueso: float = 0.3, max_candidatos: int = 5, respaldo_completo: bool = True):
+        self.directorio = directorio
+        self.niveles_max = niveles_max
+        self.lado_minimo = lado_minimo
+        self.margen_grueso = margen_grueso
+        self.max_candidatos = max_candidatos
+        self.respaldo_completo = respaldo_completo
+        self._plantillas = {}
+        self._lock = threading.Lock()
+        self.cargar()
+
+    def cargar(self):
+        """Decodifica todas las plantillas `*.png` del directorio."""
+        for ruta in sorted(glob.glob(os.path.join(self.directorio, "*.png"))):
+            self.plantilla(os.path.basename(ruta))
+        print(f"DEBUG Plantillas: {len(self._plantillas)} plantillas cargadas desde {self.directorio}")
+
+    def nombres(self):
+        with self._lock:
+            return list(self._plantillas)
+
+    def plantilla(self, nombre: str) -> Plantilla:
+        """
+        Devuelve la plantilla ya decodificada. Si el archivo es nuevo o ha cambiado en disco
+        desde la última carga, se vuelve a decodificar.
+        """
+        ruta = os.path.join(self.directorio, nombre)
+        if not os.path.isfile(ruta):
+            raise FileNotFoundError(f"No existe la plantilla '{ruta}'.")
+        with self._lock:
+            plantilla = self._plantillas.get(nombre)
+            if plantilla is None or plantilla.mtime != os.path.getmtime(ruta):
+                plantilla = Plantilla(nombre, ruta, self.niveles_max, self.lado_minimo)
+                self._plantillas[nombre] = plantilla
+            return plantilla
+
+    def localizar(self, nombre: str, fotograma, confianza: float = CONFIANZA_POR_DEFECTO,
+                  grayscale: bool = False, respaldo_completo: bool = None):
+        """
+        Busca la plantilla en el fotograma.
+
+        Args:
+            nombre (str): Nombre del archivo de la plantilla (ej. "i1.png").
+            fotograma (Fotograma | numpy.ndarray): Captura BGR donde buscar.
+            confianza (float): Umbral de TM_CCOEFF_NORMED, como en pyautogui.
+            grayscale (bool): Confirmar en gris en lugar de en color.
+            respaldo_completo (bool, optional): Sustituye a `self.respaldo_completo` en esta
+                                                búsqueda (False en las búsquedas especulativas).
+
+        Returns:
+            Box | None: Posición en coordenadas del fotograma, o None si no aparece.
+        """
+        if not isinstance(fotograma, Fotograma):
+            fotograma = Fotograma(fotograma)
+        plantilla = self.plantilla(nombre)
+        with span("match", "match", plantilla=nombre) as traza:
+            box, mejor, via = self._localizar(plantilla, fotograma, confianza, grayscale, respaldo_completo)
+            traza.update(encontrado=box is not None, mejor_confianza=round(mejor, 4), via=via,
+                         posicion=None if box is None else [box.left, box.top])
+        return box
+
+    def _localizar(self, plantilla: Plantilla, fotograma: Fotograma, confianza: float, grayscale: bool,
+                   respaldo_completo: bool = None):
+        """Devuelve (Box | None, mejor puntuación a resolución completa, "grueso" | "completo")."""
+        if plantilla.alto > fotograma.alto or plantilla.ancho > fotograma.ancho:
+            return None, 0.0, "completo"
+
+        nivel = plantilla.niveles
+        if nivel == 0:
+            return self._buscar_completo(plantilla, fotograma, confianza, grayscale) + ("completo",)
+
+        candidatos = self._candidatos_gruesos(plantilla, fotograma, nivel, confianza)
+        # Holgura de la ventana fina: cubre el error de posición de un píxel del nivel grueso.
+        holgura = 2 << nivel
+        encontrados = []
+        mejor = 0.0
+        for x, y in candidatos:
+            x0 = max(0, x - holgura)
+            y0 = max(0, y - holgura)
+            x1 = min(fotograma.ancho, x + plantilla.ancho + holgura)
+            y1 = min(fotograma.alto, y + plantilla.alto + holgura)
+            pajar = fotograma.gris(0) if grayscale else fotograma.color
+            ventana = pajar[y0:y1, x0:x1]
+            if ventana.shape[0] < plantilla.alto or ventana.shape[1] < plantilla.ancho:
+                continue
+            aguja = plantilla.gris[0] if grayscale else plantilla.color[0]
+            resultado = cv2.matchTemplate(ventana, aguja, cv2.TM_CCOEFF_NORMED)
+            punto, puntuacion = _primera_coincidencia(resultado, confianza)
+            mejor = max(mejor, puntuacion)
+            if punto is not None:
+                encontrados.append((y0 + punto[1], x0 + punto[0]))
+
+        if encontrados:
+            # Entre los confirmados se devuelve el primero en orden de barrido, como pyscreeze.
+            top, left = min(encontrados)
+            return Box(left, top, plantilla.ancho, plantilla.alto), mejor, "grueso"
+
+        if self.respaldo_completo if respaldo_completo is None else respaldo_completo:
+            return self._buscar_completo(plantilla, fotograma, confianza, grayscale) + ("completo",)
+        return None, mejor, "grueso"
+
+    def localizar_varios(self, nombres, fotograma, confianza: float = CONFIANZA_POR_DEFECTO,
+                         grayscale: bool = False, respaldo_completo: bool = None):
+        """
+        Busca varias plantillas en un mismo fotograma. La conversión a gris y la pirámide del
+        fotograma se calculan una sola vez y se comparten entre todas las búsquedas.
+
+        Returns:
+            dict: nombre -> Box | None. Las plantillas que no existen en disco devuelven None.
+        """
+        if not isinstance(fotograma, Fotograma):
+            fotograma = Fotograma(fotograma)
+        resultados = {}
+        for nombre in dict.fromkeys(nombres):
+            try:
+                resultados[nombre] = self.localizar(nombre, fotograma, confianza, grayscale, respaldo_completo)
+            except FileNotFoundError:
+                resultados[nombre] = None
+        return resultados
+
+    def _candidatos_gruesos(self, plantilla: Plantilla, fotograma: Fotograma, nivel: int,
+                            confianza: float):
+        """
+        Picos de correlación en el nivel grueso, del mejor al peor y sin solapes, ya traducidos
+        a coordenadas de resolución completa.
+        """
+        pajar = fotograma.gris(nivel)
+        aguja = plantilla.gris[nivel]
+        if aguja.shape[0] > pajar.shape[0] or aguja.shape[1] > pajar.shape[1]:
+            return []
+        resultado = cv2.matchTemplate(pajar, aguja, cv2.TM_CCOEFF_NORMED)
+        filas, columnas = np.nonzero(resultado >= confianza - self.margen_grueso)
+        if filas.size == 0:
+            return []
+        # Solo se recorren los mejores puntos: alrededor de cada pico hay muchos vecinos casi iguales.
+        orden = np.argsort(resultado[filas, columnas])[::-1][:1000]
+
+        escala = 1 << nivel
+        alto, ancho = aguja.shape[:2]
+        candidatos = []
+        for i in orden:
+            x, y = int(columnas[i]), int(filas[i])
+            # Supresión de no-máximos sencilla: descartar puntos dentro de un candidato ya aceptado.
+            if any(abs(x - cx) < ancho // 2 + 1 and abs(y - cy) < alto // 2 + 1 for cx, cy in candidatos):
+                continue
+            candidatos.append((x, y))
+            if len(candidatos) >= self.max_candidatos:
+                break
+        return [(x * escala, y * escala) for x, y in candidatos]
+
+    def _buscar_completo(self, plantilla: Plantilla, fotograma: Fotograma, confianza: float,
+                         grayscale: bool):
+        """
+        Búsqueda a resolución completa sobre todo el fotograma (comportamiento de pyscreeze).
+        Devuelve (Box | None, mejor puntuación).
+        """
+        pajar = fotograma.gris(0) if grayscale else fotograma.color
+        aguja = plantilla.gris[0] if grayscale else plantilla.color[0]
+        resultado = cv2.matchTemplate(pajar, aguja, cv2.TM_CCOEFF_NORMED)
+        punto, mejor = _primera_coincidencia(resultado, confianza)
+        if punto is None:
+            return None, mejor
+        return Box(punto[0], punto[1], plantilla.ancho, plantilla.alto), mejor
+
+
+_almacen = None
+_almacen_lock = threading.Lock()
+
+
+def obtener_almacen() -> AlmacenPlantillas:
+    """Almacén compartido por todo el proceso; se crea (y precarga) en la primera llamada."""
+    global _almacen
+    with _almacen_lock:
+        if _almacen is None:
+            _almacen = AlmacenPlantillas()
+        return _almacen
@@ -0,0 +1,326 @@
+import os
+import sys
+import glob
+import time
+import queue
+import socket
+import hashlib
+import secrets
+import itertools
+import threading
+import subprocess
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# El servicio solo escucha en local; la clave autentica a los clientes (HMAC de multiprocessing)
+# antes de que se lea ningún mensaje.
+DIRECCION = ("127.0.0.1", int(os.getenv("PLCAID_PUERTO", "6010")))
+CLAVE_PATH = os.path.join(project_root, "cache", "servicio.clave")
+LOG_PATH = os.path.join(project_root, "cache", "servicio.log")
+
+
+def obtener_clave(ruta: str = CLAVE_PATH) -> bytes:
+    """
+    Clave compartida entre el servicio y sus clientes.
+
+    Se toma de PLCAID_AUTHKEY si está definida. Si no, se genera una aleatoria la primera vez
+    y se guarda en `ruta` con permisos solo para el usuario (0600), de modo que otro usuario
+    de la máquina no puede conectarse al proceso que maneja el ratón y el teclado.
+    """
+    entorno = os.getenv("PLCAID_AUTHKEY")
+    if entorno:
+        return entorno.encode("utf-8")
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    try:
+        descriptor = os.open(ruta, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(secrets.token_bytes(32))
+    if os.name != "nt" and os.stat(ruta).st_mode & 0o077:
+        raise PermissionError(f"La clave del servicio {ruta} es legible por otros usuarios; bórrala o haz chmod 600.")
+    with open(ruta, "rb") as f:
+        clave = f.read()
+    if len(clave) < 16:
+        raise PermissionError(f"La clave del servicio {ruta} está vacía o es demasiado corta; bórrala para generar otra.")
+    return clave
+
+
+def version_codigo() -> str:
+    """
+    Huella del código de script/: un servicio arrancado con otra versión (por ejemplo, antes
+    de un git pull) se detiene y se vuelve a lanzar en lugar de seguir ejecutando código viejo.
+    """
+    huella = hashlib.sha1()
+    for ruta in sorted(glob.glob(os.path.join(project_root, "script", "*.py"))):
+        huella.update(os.path.basename(ruta).encode("utf-8"))
+        with open(ruta, "rb") as f:
+            huella.update(f.read())
+    return huella.hexdigest()[:12]
+
+
+class ServicioOcupado(RuntimeError):
+    """
+    Hay un servicio escuchando que no se puede usar ni sustituir ahora (por ejemplo, uno con
+    código anterior que sigue con un flujo). No se debe lanzar main.py en paralelo: los dos
+    manejarían el mismo ratón y teclado.
+    """
+
+
+def _enviar(conn, evento: dict):
+    """Envía un evento al cliente; si el cliente se ha ido, el trabajo sigue igualmente."""
+    try:
+        conn.send(evento)
+    except (OSError, EOFError):
+        pass
+
+
+class Servicio:
+    """
+    Proceso de ejecución persistente.
+
+    Importa una sola vez langchain, openai y pyautogui (con sus clientes ya creados), precarga
+    las plantillas de `capture/` y atiende trabajos por un socket local. Los trabajos se ejecutan
+    de uno en uno, en orden de llegada, porque todos comparten el mismo escritorio; cada cliente
+    recibe por su conexión los eventos de progreso de su trabajo hasta el evento "fin".
+
+    El mensaje "detener" termina el proceso en cuanto acaban los trabajos ya encolados.
+    """
+
+    def __init__(self, direccion=DIRECCION, authkey: bytes = None):
+        self.direccion = direccion
+        self.authkey = authkey if authkey is not None else obtener_clave()
+        self.version = version_codigo()
+        self._cola = queue.Queue()
+        self._ids = itertools.count(1)
+        self._listo = threading.Event()
+        self._deteniendo = threading.Event()
+
+    def precalentar(self):
+        inicio = time.perf_counter()
+        # Importar el orquestador crea los clientes LLM (script/cliente_llm.py); execute_actions carga pyautogui.
+        from script import orquestador, execute_actions  # noqa: F401
+        from script.plantillas import obtener_almacen
+        from script.captura import obtener_capturador
+        from script.indice_ui import obtener_indice
+        obtener_almacen()
+        obtener_indice()
+        obtener_capturador()
+        print(f"DEBUG Servicio: precalentado en {time.perf_counter() - inicio:.2f} s.")
+
+    def servir(self):
+        threading.Thread(target=self._trabajador, name="trabajador", daemon=True).start()
+        with Listener(self.direccion, authkey=self.authkey) as listener:
+            print(f"DEBUG Servicio: escuchando en {self.direccion[0]}:{self.direccion[1]}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # Un cliente con clave incorrecta no debe tumbar el servicio.
+                    print(f"ADVERTENCIA Servicio: conexión rechazada: {e}")
+                    continue
+                threading.Thread(target=self._atender, args=(conn,), daemon=True).start()
+
+    def _atender(self, conn):
+        try:
+            mensaje = conn.recv()
+        except (OSError, EOFError):
+            conn.close()
+            return
+
+        tipo = mensaje.get("tipo") if isinstance(mensaje, dict) else None
+        if tipo == "ping":
+            _enviar(conn, {"evento": "pong", "listo": self._listo.is_set(), "pendientes": self._cola.qsize(),
+                           "version": self.version, "pid": os.getpid()})
+            conn.close()
+        elif tipo == "detener":
+            print("DEBUG Servicio: detención solicitada; se termina tras los trabajos encolados.")
+            self._deteniendo.set()
+            self._cola.put(None)
+            _enviar(conn, {"evento": "deteniendo", "pendientes": self._cola.qsize() - 1})
+            conn.close()
+        elif self._deteniendo.is_set():
+            _enviar(conn, {"evento": "fin", "ok": False, "error": "El servicio se está deteniendo; vuelve a intentarlo."})
+            conn.close()
+        elif tipo == "trabajo" and mensaje.get("orden"):
+            trabajo_id = next(self._ids)
+            self._cola.put((trabajo_id, mensaje, conn))
+            _enviar(conn, {"evento": "encolado", "id": trabajo_id, "posicion": self._cola.qsize()})
+        else:
+            _enviar(conn, {"evento": "fin", "ok": False, "error": f"Mensaje no reconocido: {mensaje!r}"})
+            conn.close()
+
+    def _trabajador(self):
+        error_arranque = None
+        try:
+            self.precalentar()
+        except Exception as e:
+            # Sin clientes (por ejemplo, falta OPENAI_API_KEY) cada trabajo termina con este error.
+            error_arranque = f"El servicio no pudo inicializarse: {e}"
+            print(f"ERROR Servicio: {error_arranque}")
+        self._listo.set()
+
+        while True:
+            trabajo = self._cola.get()
+            if trabajo is None:
+                print("DEBUG Servicio: detenido.")
+                # El hilo principal está bloqueado en accept(): se sale del proceso directamente.
+                os._exit(0)
+            trabajo_id, mensaje, conn = trabajo
+            if error_arranque:
+                _enviar(conn, {"evento": "fin", "id": trabajo_id, "ok": False, "error": error_arranque})
+                conn.close()
+                continue
+            from script.orquestador import ejecutar_flujo
+            orden = mensaje["orden"]
+            monitor_id = int(mensaje.get("monitor_id", 1))
+            reanudar = bool(mensaje.get("reanudar", True))
+            print(f"DEBUG Servicio: trabajo {trabajo_id} iniciado: '{orden.strip()[:50]}' en monitor {monitor_id}")
+
+            def progreso(evento, trabajo_id=trabajo_id, conn=conn):
+                _enviar(conn, dict(evento, id=trabajo_id))
+
+            inicio = time.perf_counter()
+            progreso({"evento": "inicio"})
+            ok, error = True, None
+            try:
+                ejecutar_flujo(orden, monitor_id, progreso, reanudar=reanudar)
+            except Exception as e:
+                ok, error = False, str(e)
+                print(f"ERROR Servicio: trabajo {trabajo_id} fallido: {e}")
+            progreso({"evento": "fin", "ok": ok, "error": error, "duracion": time.perf_counter() - inicio})
+            conn.close()
+
+
+# --- Cliente ---
+
+def _ping(direccion=DIRECCION):
+    """Respuesta del servicio a un "ping" (con su versión de código), o None si no responde."""
+    try:
+        with Client(direccion, authkey=obtener_clave()) as conn:
+            conn.send({"tipo": "ping"})
+            respuesta = conn.recv()
+    except (OSError, EOFError, AuthenticationError):
+        return None
+    return respuesta if respuesta.get("evento") == "pong" else None
+
+
+def servicio_activo(direccion=DIRECCION) -> bool:
+    """True si hay un servicio escuchando y respondiendo en `direccion`."""
+    return _ping(direccion) is not None
+
+
+def puerto_ocupado(direccion=DIRECCION) -> bool:
+    """True si algún proceso acepta conexiones en `direccion`, responda o no como el servicio."""
+    try:
+        with socket.create_connection(direccion, timeout=1.0):
+            return True
+    except OSError:
+        return False
+
+
+def detener_servicio(direccion=DIRECCION, espera: float = 10.0) -> bool:
+    """
+    Pide al servicio que termine tras los trabajos encolados y espera hasta `espera` segundos
+    a que deje de responder. True si ya no hay servicio.
+    """
+    try:
+        with Client(direccion, authkey=obtener_clave()) as conn:
+            conn.send({"tipo": "detener"})
+            conn.recv()
+    except (OSError, EOFError):
+        return not servicio_activo(direccion)
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        if not servicio_activo(direccion):
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def arrancar_servicio(direccion=DIRECCION, espera: float = 30.0) -> bool:
+    """
+    Lanza el servicio en segundo plano si no está ya activo y espera a que acepte conexiones.
+    Si el que está activo se arrancó con otra versión del código, se detiene y se relanza.
+    La salida del servicio se guarda en cache/servicio.log.
+
+    Returns:
+        bool: True si el servicio está listo; False si no hay nada escuchando y no se pudo
+              lanzar (solo entonces se puede ejecutar main.py directamente).
+
+    Raises:
+        ServicioOcupado: Si el servicio anterior sigue con un flujo y no se ha detenido en
+                         `espera` segundos, o si otro proceso ocupa el puerto.
+    """
+    respuesta = _ping(direccion)
+    if respuesta is not None:
+        if respuesta.get("version") == version_codigo():
+            return True
+        print(f"DEBUG Servicio: el servicio activo (pid {respuesta.get('pid')}) tiene otra versión del código; se reinicia.")
+        if not detener_servicio(direccion, espera):
+            # Ya no acepta trabajos y terminará en cuanto acabe el que tiene en curso.
+            raise ServicioOcupado(f"El servicio de ejecución (pid {respuesta.get('pid')}) sigue con un flujo y se "
+                                  f"reiniciará con el código nuevo en cuanto termine; vuelve a lanzar la orden entonces.")
+
+    os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+    log = open(LOG_PATH, "a", encoding="utf-8")
+    opciones = {}
+    if os.name == "nt":
+        opciones["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        opciones["start_new_session"] = True
+    subprocess.Popen([sys.executable, "-u", "-m", "script.servicio"], cwd=project_root,
+                     stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, **opciones)
+    log.close()
+
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        if servicio_activo(direccion):
+            return True
+        time.sleep(0.2)
+    if puerto_ocupado(direccion):
+        raise ServicioOcupado(f"Hay otro proceso escuchando en {direccion[0]}:{direccion[1]} que no responde como el "
+                              f"servicio de ejecución (¿otra clave o versión?); detenlo o cambia PLCAID_PUERTO.")
+    return False
+
+
+def enviar_trabajo(orden: str, monitor_id: int = 1, direccion=DIRECCION, reanudar: bool = True):
+    """
+    Encola una orden en el servicio y va devolviendo sus eventos de progreso. Con
+    `reanudar=False` se descarta el diario de una ejecución anterior y se empieza de cero.
+
+    Yields:
+        dict: Eventos ("encolado", "inicio", "plan", "paso_inicio", "paso_fin", "reintento", "traza")
+              terminando siempre con {"evento": "fin", "ok": bool, "error": str | None}.
+    """
+    with Client(direccion, authkey=obtener_clave()) as conn:
+        conn.send({"tipo": "trabajo", "orden": orden, "monitor_id": monitor_id, "reanudar": reanudar})
+        while True:
+            try:
+                evento = conn.recv()
+            except (OSError, EOFError):
+                yield {"evento": "fin", "ok": False, "error": "Se perdió la conexión con el servicio."}
+                return
+            yield evento
+            if evento.get("evento") == "fin":
+                return
+
+
+if __name__ == "__main__":
+    if "--detener" in sys.argv[1:]:
+        detenido = detener_servicio()
+        print("Servicio detenido." if detenido else "El servicio no se ha detenido (¿sigue con un trabajo?).")
+        sys.exit(0 if detenido else 1)
+    print(f"DEBUG Servicio: iniciado (pid {os.getpid()}).")
+    # Las rutas relativas (parsed_steps/, input_text/) se resuelven desde la raíz del proyecto.
+    os.chdir(project_root)
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+    try:
+        Servicio().servir()
+    except OSError as e:
+        print(f"ERROR Servicio: no se pudo escuchar en {DIRECCION}: {e}")
+        sys.exit(1)
@@ -0,0 +1,176 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+def _env_float(nombre: str, defecto: float) -> float:
+    return float(os.getenv(nombre, str(defecto)))
+
+
+class PasoFallido(RuntimeError):
+    """Un paso agotó su tiempo (o sus reintentos) sin completarse."""
+
+
+class PoliticaReintentos:
+    """
+    Reintentos de un paso acotados por tiempo, con espera exponencial entre ellos.
+
+    Un paso se reintenta mientras no pasen `presupuesto` segundos desde su primer intento. El
+    límite es de tiempo y no de número de reintentos porque lo que varía es cuánto tarda la
+    aplicación en mostrar el elemento (arrancar TIA Portal puede llevar más de un minuto).
+
+    Args:
+        presupuesto (float): Segundos máximos por paso, reintentos incluidos.
+        max_reintentos (int, optional): Tope adicional de reintentos. None: sin tope.
+        espera_inicial (float): Espera (s) antes del primer reintento.
+        factor (float): Multiplicador de la espera en cada reintento.
+        espera_max (float): Tope (s) de una espera individual.
+    """
+
+    def __init__(self, presupuesto: float = 180.0, max_reintentos: int = None, espera_inicial: float = 0.5,
+                 factor: float = 2.0, espera_max: float = 8.0):
+        self.presupuesto = presupuesto
+        self.max_reintentos = max_reintentos
+        self.espera_inicial = espera_inicial
+        self.factor = factor
+        self.espera_max = espera_max
+
+    @classmethod
+    def desde_entorno(cls):
+        """
+        Lee la política de PLCAID_TIMEOUT_PASO, PLCAID_MAX_REINTENTOS (sin tope si no se
+        define), PLCAID_ESPERA_INICIAL, PLCAID_FACTOR_ESPERA y PLCAID_ESPERA_MAX.
+        """
+        max_reintentos = os.getenv("PLCAID_MAX_REINTENTOS")
+        return cls(
+            presupuesto=_env_float("PLCAID_TIMEOUT_PASO", 180.0),
+            max_reintentos=int(max_reintentos) if max_reintentos else None,
+            espera_inicial=_env_float("PLCAID_ESPERA_INICIAL", 0.5),
+            factor=_env_float("PLCAID_FACTOR_ESPERA", 2.0),
+            espera_max=_env_float("PLCAID_ESPERA_MAX", 8.0),
+        )
+
+    def restante(self, inicio: float) -> float:
+        """Segundos que le quedan al paso que empezó en `inicio` (time.monotonic())."""
+        return max(0.0, inicio + self.presupuesto - time.monotonic())
+
+    def agotada(self, reintentos: int, inicio: float) -> bool:
+        """True si el paso que empezó en `inicio` ya no admite el reintento número `reintentos`."""
+        if self.max_reintentos is not None and reintentos > self.max_reintentos:
+            return True
+        return self.restante(inicio) <= 0
+
+    def espera(self, intento: int, inicio: float = None) -> float:
+        """Espera antes del reintento número `intento` (1, 2, ...), sin pasar del presupuesto."""
+        espera = min(self.espera_max, self.espera_inicial * self.factor ** (intento - 1))
+        return espera if inicio is None else min(espera, self.restante(inicio))
+
+
+class EsperaPantalla:
+    """
+    Sincroniza los pasos con lo que ocurre en pantalla en lugar de con pausas fijas.
+
+    Compara huellas muy reducidas del monitor (gris, `lado` px de ancho) a alta frecuencia y
+    termina en cuanto la pantalla lleva `estable` segundos sin cambios o en cuanto aparece la
+    plantilla esperada, lo que ocurra antes. Justo después de un clic la aplicación suele
+    tardar en empezar a dibujar, así que mientras no se haya visto ningún cambio se exigen
+    `reaccion` segundos de calma en lugar de `estable`.
+
+    Args:
+        capturador (Capturador): Capturador del monitor de trabajo.
+        prebusqueda (Prebusqueda, optional): Búsqueda anticipada que informa de si la
+                                             plantilla esperada ya está en pantalla.
+        intervalo (float): Periodo de muestreo (s).
+        estable (float): Tiempo (s) sin cambios para considerar la pantalla asentada.
+        reaccion (float): Tiempo (s) sin ningún cambio tras el paso para darla por asentada.
+        timeout (float): Espera máxima (s) tras cada paso.
+        umbral (float): Diferencia media absoluta (0-255) por debajo de la cual dos huellas son iguales.
+        lado (int): Ancho de la huella en píxeles.
+    """
+
+    def __init__(self, capturador, prebusqueda=None, intervalo: float = 0.03, estable: float = 0.25,
+                 reaccion: float = 2.0, timeout: float = 10.0, umbral: float = 1.0, lado: int = 96):
+        self.capturador = capturador
+        self.prebusqueda = prebusqueda
+        self.intervalo = intervalo
+        self.estable = estable
+        self.reaccion = reaccion
+        self.timeout = timeout
+        self.umbral = umbral
+        self.lado = lado
+
+    @classmethod
+    def desde_entorno(cls, capturador, prebusqueda=None):
+        """
+        Lee los tiempos de PLCAID_INTERVALO_PANTALLA, PLCAID_ESTABLE, PLCAID_REACCION_PANTALLA
+        y PLCAID_TIMEOUT_PANTALLA.
+        """
+        return cls(
+            capturador,
+            prebusqueda,
+            intervalo=_env_float("PLCAID_INTERVALO_PANTALLA", 0.03),
+            estable=_env_float("PLCAID_ESTABLE", 0.25),
+            reaccion=_env_float("PLCAID_REACCION_PANTALLA", 2.0),
+            timeout=_env_float("PLCAID_TIMEOUT_PANTALLA", 10.0),
+        )
+
+    def huella(self):
+        """Captura el monitor y lo reduce a una imagen gris diminuta."""
+        captura = self.capturador.capturar()
+        alto = max(1, round(captura.alto * self.lado / captura.ancho))
+        return cv2.resize(captura.gris(0), (self.lado, alto), interpolation=cv2.INTER_AREA)
+
+    def plantilla_visible(self, plantilla, desde: float) -> bool:
+        """True si la búsqueda anticipada vio `plantilla` en un fotograma posterior a `desde`."""
+        return (self.prebusqueda is not None and plantilla is not None
+                and self.prebusqueda.resultado(plantilla, desde) is not None)
+
+    def esperar(self, plantilla: str = None, desde: float = None, timeout: float = None) -> str:
+        """
+        Bloquea hasta que la pantalla se asienta o aparece `plantilla`.
+
+        Args:
+            plantilla (str, optional): Plantilla del siguiente paso.
+            desde (float, optional): Instante (time.monotonic()) a partir del cual vale una
+                                     detección de la búsqueda anticipada. Por defecto, ahora.
+            timeout (float, optional): Sustituye al timeout configurado.
+
+        Returns:
+            str: "plantilla", "estable" o "timeout".
+        """
+        inicio = time.monotonic()
+        desde = inicio if desde is None else desde
+        limite = inicio + (self.timeout if timeout is None else timeout)
+
+        anterior = self.huella()
+        quieta_desde = time.monotonic()
+        cambiada = False
+        while True:
+            if self.plantilla_visible(plantilla, desde):
+                return "plantilla"
+            ahora = time.monotonic()
+            if ahora - quieta_desde >= (self.estable if cambiada else max(self.estable, self.reaccion)):
+                return "estable"
+            if ahora >= limite:
+                return "timeout"
+            time.sleep(self.intervalo)
+
+            actual = self.huella()
+            if actual.shape != anterior.shape or np.mean(cv2.absdiff(actual, anterior)) > self.umbral:
+                quieta_desde = time.monotonic()
+                cambiada = True
+            anterior = actual
+
+    def esperar_plantilla(self, plantilla: str, desde: float, timeout: float) -> bool:
+        """
+        Espera hasta `timeout` segundos a que la búsqueda anticipada vea `plantilla`.
+        Sin búsqueda anticipada equivale a una pausa de `timeout` segundos.
+        """
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            if self.plantilla_visible(plantilla, desde):
+                return True
+            time.sleep(self.intervalo)
+        return self.plantilla_visible(plantilla, desde)
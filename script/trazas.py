@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import glob
+import threading
+from contextlib import contextmanager
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRAZAS_DIR = os.path.join(project_root, "trazas")
+
+
+class Traza:
+    """
+    Colección de tramos (spans) y eventos de una ejecución.
+
+    Cada tramo guarda nombre, categoría ("llm", "captura", "match", "accion", "paso",
+    "reintento"...), inicio y duración en milisegundos relativos al inicio de la traza, hilo y
+    atributos libres (tokens, confianza, posición...).
+    """
+
+    def __init__(self, nombre: str, **atributos):
+        self.nombre = nombre
+        self.atributos = atributos
+        self.inicio_epoch = time.time()
+        self._inicio = time.perf_counter()
+        self.eventos = []
+        self._hilos = {}
+        self._lock = threading.Lock()
+
+    def ahora_ms(self) -> float:
+        return (time.perf_counter() - self._inicio) * 1000
+
+    def registrar(self, nombre: str, categoria: str, inicio_ms: float, duracion_ms: float = None, **atributos):
+        hilo = threading.current_thread()
+        evento = {
+            "nombre": nombre,
+            "categoria": categoria,
+            "inicio_ms": round(inicio_ms, 3),
+            "duracion_ms": None if duracion_ms is None else round(duracion_ms, 3),
+            "hilo": hilo.ident,
+            "atributos": atributos,
+        }
+        with self._lock:
+            self._hilos[hilo.ident] = hilo.name
+            self.eventos.append(evento)
+
+    def guardar(self, directorio: str = TRAZAS_DIR):
+        """
+        Escribe la traza como JSONL (un tramo por línea) y en formato Chrome trace
+        (abrir con chrome://tracing o https://ui.perfetto.dev).
+
+        Returns:
+            tuple: (ruta_jsonl, ruta_chrome)
+        """
+        os.makedirs(directorio, exist_ok=True)
+        milisegundos = int(self.inicio_epoch * 1000) % 1000
+        base = os.path.join(directorio, time.strftime("%Y%m%d-%H%M%S", time.localtime(self.inicio_epoch))
+                            + f"{milisegundos:03d}-{self.nombre}")
+        with self._lock:
+            eventos = list(self.eventos)
+            hilos = dict(self._hilos)
+
+        ruta_jsonl = base + ".jsonl"
+        with open(ruta_jsonl, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"traza": self.nombre, "inicio": self.inicio_epoch, **self.atributos}, ensure_ascii=False, default=str) + "\n")
+            for evento in eventos:
+                f.write(json.dumps(evento, ensure_ascii=False, default=str) + "\n")
+
+        pid = os.getpid()
+        trace_events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": nombre}}
+                        for tid, nombre in hilos.items()]
+        for evento in eventos:
+            chrome = {"name": evento["nombre"], "cat": evento["categoria"], "pid": pid, "tid": evento["hilo"],
+                      "ts": evento["inicio_ms"] * 1000, "args": evento["atributos"]}
+            if evento["duracion_ms"] is None:
+                chrome.update(ph="i", s="t")
+            else:
+                chrome.update(ph="X", dur=evento["duracion_ms"] * 1000)
+            trace_events.append(chrome)
+        ruta_chrome = base + ".trace.json"
+        with open(ruta_chrome, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f, ensure_ascii=False, default=str)
+        return ruta_jsonl, ruta_chrome
+
+
+_traza = None
+_traza_lock = threading.Lock()
+
+
+def trazas_activas() -> bool:
+    return os.getenv("PLCAID_TRAZAS", "1") != "0"
+
+
+def iniciar_traza(nombre: str, **atributos):
+    """Empieza una traza nueva para el proceso (una ejecución a la vez). None si están desactivadas."""
+    global _traza
+    with _traza_lock:
+        _traza = Traza(nombre, **atributos) if trazas_activas() else None
+        return _traza
+
+
+def finalizar_traza(directorio: str = TRAZAS_DIR):
+    """Guarda y cierra la traza en curso. Devuelve (ruta_jsonl, ruta_chrome) o None."""
+    global _traza
+    with _traza_lock:
+        traza, _traza = _traza, None
+    if traza is None:
+        return None
+    rutas = traza.guardar(directorio)
+    print(f"DEBUG Trazas: traza guardada en {rutas[0]} y {rutas[1]}")
+    return rutas
+
+
+@contextmanager
+def span(nombre: str, categoria: str, **atributos):
+    """
+    Mide un tramo de la traza en curso. El dict que devuelve se puede completar dentro del
+    bloque (por ejemplo, con los tokens o la confianza) y se guarda al salir. Si el bloque
+    lanza una excepción, se anota en el atributo "error". Sin traza activa no hace nada.
+    """
+    traza = _traza
+    if traza is None:
+        yield atributos
+        return
+    inicio = traza.ahora_ms()
+    try:
+        yield atributos
+    except BaseException as e:
+        atributos["error"] = str(e)
+        raise
+    finally:
+        traza.registrar(nombre, categoria, inicio, traza.ahora_ms() - inicio, **atributos)
+
+
+def evento(nombre: str, categoria: str, **atributos):
+    """Registra un evento puntual (sin duración) en la traza en curso."""
+    traza = _traza
+    if traza is not None:
+        traza.registrar(nombre, categoria, traza.ahora_ms(), **atributos)
+
+
+def ultima_traza(directorio: str = TRAZAS_DIR):
+    """Ruta del JSONL de traza más reciente, o None."""
+    rutas = glob.glob(os.path.join(directorio, "*.jsonl"))
+    return max(rutas, key=os.path.getmtime) if rutas else None
+
+
+def resumir(ruta_jsonl: str) -> list:
+    """
+    Agrega una traza JSONL por categoría y nombre: número de tramos, tiempo total y máximo,
+    y tokens de LLM cuando los hay. Ordenado por tiempo total descendente.
+    """
+    grupos = {}
+    with open(ruta_jsonl, "r", encoding="utf-8") as f:
+        next(f, None)  # cabecera
+        for linea in f:
+            evento = json.loads(linea)
+            clave = (evento["categoria"], evento["nombre"])
+            grupo = grupos.setdefault(clave, {"categoria": clave[0], "nombre": clave[1], "veces": 0,
+                                              "total_ms": 0.0, "max_ms": 0.0, "tokens": 0, "errores": 0})
+            grupo["veces"] += 1
+            duracion = evento["duracion_ms"] or 0.0
+            grupo["total_ms"] += duracion
+            grupo["max_ms"] = max(grupo["max_ms"], duracion)
+            grupo["tokens"] += evento["atributos"].get("total_tokens") or 0
+            grupo["errores"] += 1 if "error" in evento["atributos"] else 0
+    for grupo in grupos.values():
+        grupo["total_ms"] = round(grupo["total_ms"], 1)
+        grupo["max_ms"] = round(grupo["max_ms"], 1)
+    return sorted(grupos.values(), key=lambda g: g["total_ms"], reverse=True)
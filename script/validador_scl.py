@@ -0,0 +1,425 @@
+import re
+
+# Validación local del subconjunto de SCL que genera generador_scl.py: IF/ELSIF/ELSE/END_IF,
+# asignaciones, expresiones booleanas y aritméticas y llamadas a bloques como "MarchaParo_1".
+# Detecta en milisegundos el código que TIA Portal rechazaría al compilar, antes de pegarlo.
+
+PALABRAS_CLAVE = {
+    "IF", "THEN", "ELSIF", "ELSE", "END_IF", "AND", "OR", "XOR", "NOT", "MOD", "TRUE", "FALSE",
+}
+
+_TOKENS = [
+    ("comentario", r"//[^\n]*|\(\*.*?\*\)"),
+    ("nueva_linea", r"\n"),
+    ("espacio", r"[ \t\r]+"),
+    ("tag", r'"[^"\n]*"'),
+    ("cadena", r"'[^'\n]*'"),
+    ("local", r"#[A-Za-z_]\w*"),
+    # Enteros, reales, bases (16#FF) y literales con tipo (T#5s, INT#3).
+    ("numero", r"(?:\d+#[0-9A-Fa-f_]+|[A-Za-z]+#[0-9A-Za-z_.]+|\d[\d_]*(?:\.\d+)?(?:[eE][+-]?\d+)?)"),
+    ("nombre", r"[A-Za-z_]\w*"),
+    ("operador", r":=|=>|<>|<=|>=|\*\*|[-+*/=<>(),;.:\[\]&]"),
+]
+_PATRON = re.compile("|".join(f"(?P<{nombre}>{patron})" for nombre, patron in _TOKENS), re.DOTALL)
+
+
+class ErrorSCL(ValueError):
+    """Código SCL no válido. `linea` y `columna` señalan dónde (1 = primera)."""
+
+    def __init__(self, mensaje: str, linea: int = None, columna: int = None):
+        self.mensaje = mensaje
+        self.linea = linea
+        self.columna = columna
+        posicion = f"línea {linea}, columna {columna}: " if linea is not None else ""
+        super().__init__(posicion + mensaje)
+
+
+class Token:
+    __slots__ = ("tipo", "valor", "linea", "columna")
+
+    def __init__(self, tipo: str, valor: str, linea: int, columna: int):
+        self.tipo = tipo
+        self.valor = valor
+        self.linea = linea
+        self.columna = columna
+
+    @property
+    def palabra(self) -> str:
+        """Valor en mayúsculas si es un nombre (SCL no distingue mayúsculas), "" si no."""
+        return self.valor.upper() if self.tipo == "nombre" else ""
+
+    def __repr__(self):
+        return f"Token({self.tipo}, {self.valor!r}, {self.linea}:{self.columna})"
+
+
+def tokenizar(codigo: str) -> list:
+    """Divide el código en tokens, sin espacios ni comentarios. Lanza ErrorSCL ante un carácter inesperado."""
+    tokens = []
+    linea, inicio_linea, pos = 1, 0, 0
+    while pos < len(codigo):
+        m = _PATRON.match(codigo, pos)
+        if m is None:
+            raise ErrorSCL(f"carácter inesperado {codigo[pos]!r}", linea, pos - inicio_linea + 1)
+        tipo, valor = m.lastgroup, m.group()
+        if tipo == "nueva_linea":
+            linea, inicio_linea = linea + 1, m.end()
+        elif tipo == "comentario":
+            saltos = valor.count("\n")
+            if saltos:
+                linea, inicio_linea = linea + saltos, pos + valor.rindex("\n") + 1
+        elif tipo != "espacio":
+            tokens.append(Token(tipo, valor, linea, pos - inicio_linea + 1))
+        pos = m.end()
+    tokens.append(Token("fin", "", linea, pos - inicio_linea + 1))
+    return tokens
+
+
+def _es_sentencia(linea: str) -> bool:
+    """
+    True si la línea empieza como una sentencia del subconjunto: IF/ELSIF/ELSE/END_IF, una
+    asignación o llamada ("Tag_3" :=, #Start :=, Q_Motor :=, MarchaParo_1(...)) o un ";".
+    El texto del LLM ("Aquí tienes el código:", "Este programa enciende el motor.") no lo es.
+    """
+    try:
+        tokens = tokenizar(linea)
+    except ErrorSCL:
+        return False
+    primero, segundo = tokens[0], tokens[1] if len(tokens) > 1 else tokens[0]
+    if primero.palabra in ("IF", "ELSIF", "ELSE", "END_IF") or primero.valor == ";":
+        return True
+    if primero.tipo in ("tag", "local"):
+        return True
+    return primero.tipo == "nombre" and primero.palabra not in PALABRAS_CLAVE \
+        and segundo.valor in (":=", "(", ".", "[")
+
+
+def _recortar_lineas(lineas: list):
+    """
+    Quita las líneas de texto antes de la primera sentencia y tras el final del código (la
+    última línea terminada en ";"). Lo que haya en medio se deja para que el analizador lo
+    rechace. None si ninguna línea parece código.
+    """
+    inicio = next((i for i, linea in enumerate(lineas) if _es_sentencia(linea)), None)
+    if inicio is None:
+        return None
+    fin = max((i for i in range(inicio, len(lineas)) if lineas[i].rstrip().endswith(";")), default=None)
+    if fin is None or any(_es_sentencia(linea) for linea in lineas[fin + 1:]):
+        fin = len(lineas) - 1
+    return lineas[inicio:fin + 1]
+
+
+def limpiar_respuesta(texto: str) -> str:
+    """
+    Quita lo que el LLM añade alrededor del código: bloques ```scl ... ``` y líneas de texto
+    antes de la primera sentencia o después de la última. No se corta nada que sea código
+    (por ejemplo, una asignación antes del primer IF); si la respuesta mezcla texto y código
+    de otra forma, se devuelve tal cual y validar_scl la rechaza.
+    """
+    texto = (texto or "").strip()
+    bloque = re.search(r"```[A-Za-z]*\n(.*?)```", texto, re.DOTALL)
+    if bloque:
+        texto = bloque.group(1)
+    lineas = [linea for linea in texto.splitlines() if not linea.strip().startswith("```")]
+    codigo = _recortar_lineas(lineas)
+    if codigo is not None:
+        lineas = codigo
+    return "\n".join(lineas).strip() + "\n"
+
+
+class InterfazSCL:
+    """
+    Variables que puede usar el código generado.
+
+    Cada variable se acepta como tag global ("Tag_1"), como variable del bloque (#Start) o por
+    su nombre sin prefijo, y por cualquiera de sus nombres (tag o parámetro del bloque).
+
+    Args:
+        entradas (dict): Tag -> parámetro de entrada del bloque. Solo se pueden leer.
+        salidas (dict): Tag -> parámetro de salida del bloque. El código debe asignarlas.
+        bloques (dict): Instancia de bloque -> nombres de sus parámetros, para las llamadas.
+    """
+
+    def __init__(self, entradas: dict, salidas: dict, bloques: dict = None):
+        self.entradas = entradas
+        self.salidas = salidas
+        self.bloques = {nombre.upper(): {p.upper() for p in parametros} for nombre, parametros in (bloques or {}).items()}
+        self._canonicas = {}
+        for tag, parametro in list(entradas.items()) + list(salidas.items()):
+            for alias in (tag, parametro):
+                self._canonicas[alias.upper()] = tag
+
+    def canonica(self, nombre: str):
+        """Tag al que se refiere `nombre` (con o sin comillas o #), o None si no está en la interfaz."""
+        return self._canonicas.get(nombre.strip('"').lstrip("#").upper())
+
+    def es_entrada(self, tag: str) -> bool:
+        return tag in self.entradas
+
+
+INTERFAZ_MARCHA_PARO = InterfazSCL(
+    entradas={"Tag_1": "Start", "Tag_2": "Stop"},
+    salidas={"Tag_3": "Q_Motor"},
+    bloques={"MarchaParo_1": ["Start", "Stop", "Q_Motor"]},
+)
+
+
+class _Parser:
+    """Analizador descendente recursivo del subconjunto de SCL, con comprobación de la interfaz."""
+
+    def __init__(self, tokens: list, interfaz: InterfazSCL):
+        self.tokens = tokens
+        self.pos = 0
+        self.interfaz = interfaz
+        self.asignadas = set()
+
+    # --- Utilidades ---
+
+    @property
+    def actual(self) -> Token:
+        return self.tokens[self.pos]
+
+    def _error(self, mensaje: str, token: Token = None):
+        token = token or self.actual
+        raise ErrorSCL(mensaje, token.linea, token.columna)
+
+    def _avanzar(self) -> Token:
+        token = self.actual
+        self.pos += 1
+        return token
+
+    def _es(self, *valores) -> bool:
+        token = self.actual
+        return token.palabra in valores or (token.tipo == "operador" and token.valor in valores)
+
+    def _esperar(self, valor: str, contexto: str) -> Token:
+        if not self._es(valor):
+            encontrado = self.actual.valor or "el final del código"
+            self._error(f"se esperaba '{valor}' {contexto} y se encontró '{encontrado}'")
+        return self._avanzar()
+
+    # --- Sentencias ---
+
+    def programa(self):
+        if self.actual.tipo == "fin":
+            self._error("el código está vacío")
+        self._sentencias(terminadores=())
+        if self.actual.tipo != "fin":
+            self._error(f"'{self.actual.valor}' inesperado")
+
+    def _sentencias(self, terminadores):
+        while self.actual.tipo != "fin" and not self._es(*terminadores):
+            self._sentencia()
+
+    def _sentencia(self):
+        token = self.actual
+        if token.palabra == "IF":
+            self._si()
+        elif token.tipo in ("tag", "local", "nombre") and token.palabra not in PALABRAS_CLAVE:
+            self._asignacion_o_llamada()
+        elif self._es(";"):
+            self._avanzar()  # sentencia vacía
+        elif token.palabra in ("ELSIF", "ELSE", "END_IF"):
+            self._error(f"'{token.valor}' sin IF que lo abra")
+        else:
+            self._error(f"sentencia no soportada que empieza por '{token.valor}'")
+
+    def _si(self):
+        apertura = self._avanzar()
+        self._expresion()
+        self._esperar("THEN", "tras la condición del IF")
+        self._sentencias(("ELSIF", "ELSE", "END_IF"))
+        while self._es("ELSIF"):
+            self._avanzar()
+            self._expresion()
+            self._esperar("THEN", "tras la condición del ELSIF")
+            self._sentencias(("ELSIF", "ELSE", "END_IF"))
+        if self._es("ELSE"):
+            self._avanzar()
+            self._sentencias(("END_IF",))
+        if not self._es("END_IF"):
+            self._error(f"falta END_IF para el IF de la línea {apertura.linea}")
+        self._avanzar()
+        self._esperar(";", "tras END_IF")
+
+    def _asignacion_o_llamada(self):
+        destino = self._avanzar()
+        miembros = self._miembros()
+        if self._es("("):
+            self._llamada(destino)
+        elif self._es(":="):
+            self._avanzar()
+            if not miembros:
+                self._escritura(destino)
+            self._expresion()
+        else:
+            self._error(f"se esperaba ':=' o '(' tras '{destino.valor}'")
+        self._esperar(";", "al final de la sentencia")
+
+    def _miembros(self) -> bool:
+        """Acceso a miembros (.x) o índices ([i]); True si los hay."""
+        hay = False
+        while self._es(".", "["):
+            hay = True
+            if self._avanzar().valor == ".":
+                if self.actual.tipo not in ("nombre", "tag", "numero"):
+                    self._error("se esperaba un nombre tras '.'")
+                self._avanzar()
+            else:
+                self._expresion()
+                self._esperar("]", "para cerrar el índice")
+        return hay
+
+    def _escritura(self, token: Token):
+        tag = self._variable(token)
+        if tag is not None and self.interfaz.es_entrada(tag):
+            self._error(f"no se puede asignar la entrada {token.valor}", token)
+        if tag is not None:
+            self.asignadas.add(tag)
+
+    def _llamada(self, bloque: Token):
+        parametros = self.interfaz.bloques.get(bloque.valor.strip('"').lstrip("#").upper())
+        if parametros is None and bloque.tipo != "nombre":
+            self._error(f"el bloque {bloque.valor} no está en la interfaz", bloque)
+        self._avanzar()
+        if self._es(")"):
+            self._avanzar()
+            return
+        while True:
+            if self.actual.tipo != "nombre":
+                self._error("se esperaba el nombre de un parámetro")
+            parametro = self._avanzar()
+            if parametros is not None and parametro.palabra not in parametros:
+                self._error(f"el bloque {bloque.valor} no tiene el parámetro {parametro.valor}", parametro)
+            if self._es(":="):
+                self._avanzar()
+                self._expresion()
+            elif self._es("=>"):
+                self._avanzar()
+                if self.actual.tipo not in ("tag", "local", "nombre"):
+                    self._error("se esperaba una variable tras '=>'")
+                self._escritura(self._avanzar())
+                self._miembros()
+            else:
+                self._error(f"se esperaba ':=' o '=>' tras el parámetro {parametro.valor}")
+            if self._es(","):
+                self._avanzar()
+                continue
+            self._esperar(")", "para cerrar la llamada")
+            return
+
+    def _variable(self, token: Token):
+        """Comprueba que la variable existe en la interfaz y devuelve su tag (None si es una función)."""
+        tag = self.interfaz.canonica(token.valor)
+        if tag is None:
+            self._error(f"la variable {token.valor} no está en la interfaz "
+                        f"(disponibles: {', '.join(_nombres_interfaz(self.interfaz))})", token)
+        return tag
+
+    # --- Expresiones (de menor a mayor precedencia) ---
+
+    def _expresion(self):
+        self._binaria(("OR",), self._xor)
+
+    def _xor(self):
+        self._binaria(("XOR",), self._y)
+
+    def _y(self):
+        self._binaria(("AND", "&"), self._comparacion)
+
+    def _comparacion(self):
+        self._binaria(("=", "<>", "<", ">", "<=", ">="), self._suma)
+
+    def _suma(self):
+        self._binaria(("+", "-"), self._producto)
+
+    def _producto(self):
+        self._binaria(("*", "/", "MOD", "**"), self._unaria)
+
+    def _binaria(self, operadores, siguiente):
+        siguiente()
+        while self._es(*operadores):
+            self._avanzar()
+            siguiente()
+
+    def _unaria(self):
+        if self._es("NOT", "-", "+"):
+            self._avanzar()
+            self._unaria()
+        else:
+            self._primaria()
+
+    def _primaria(self):
+        token = self.actual
+        if self._es("("):
+            self._avanzar()
+            self._expresion()
+            self._esperar(")", "para cerrar el paréntesis")
+        elif token.tipo in ("numero", "cadena") or token.palabra in ("TRUE", "FALSE"):
+            self._avanzar()
+        elif token.tipo in ("tag", "local", "nombre") and token.palabra not in PALABRAS_CLAVE:
+            self._avanzar()
+            if token.tipo == "nombre" and self._es("("):
+                # Función estándar (ABS, MAX, R_TRIG...): se comprueban solo sus argumentos.
+                self._avanzar()
+                while not self._es(")"):
+                    self._expresion()
+                    if not self._es(")"):
+                        self._esperar(",", "entre los argumentos")
+                self._avanzar()
+            else:
+                self._variable(token)
+                self._miembros()
+        else:
+            encontrado = token.valor or "el final del código"
+            self._error(f"se esperaba una expresión y se encontró '{encontrado}'")
+
+
+def _nombres_interfaz(interfaz: InterfazSCL) -> list:
+    return [f'"{tag}"/#{parametro}' for tag, parametro in list(interfaz.entradas.items()) + list(interfaz.salidas.items())]
+
+
+def validar_prefijo(texto: str, interfaz: InterfazSCL = INTERFAZ_MARCHA_PARO):
+    """
+    Comprobación incremental para las respuestas en streaming: con las líneas ya completas
+    desde la primera sentencia, detecta caracteres inválidos y variables fuera de la interfaz
+    sin esperar al final del código. Lanza ErrorSCL.
+    """
+    lineas = texto[:texto.rfind("\n") + 1].splitlines()
+    vallas = [i for i, linea in enumerate(lineas) if linea.strip().startswith("```")]
+    if vallas:
+        # Solo el contenido del bloque ```scl (hasta su cierre, si ya ha llegado).
+        lineas = lineas[vallas[0] + 1:vallas[1] if len(vallas) > 1 else len(lineas)]
+    lineas = _recortar_lineas(lineas)
+    if lineas is None:
+        return  # Aún no ha empezado el código (o es texto que limpiar_respuesta quitará).
+    for token in tokenizar("\n".join(lineas)):
+        if token.tipo in ("tag", "local") and interfaz.canonica(token.valor) is None \
+                and token.valor.strip('"').upper() not in interfaz.bloques:
+            raise ErrorSCL(f"la variable {token.valor} no está en la interfaz "
+                           f"(disponibles: {', '.join(_nombres_interfaz(interfaz))})", token.linea, token.columna)
+
+
+def validar_scl(codigo: str, interfaz: InterfazSCL = INTERFAZ_MARCHA_PARO) -> str:
+    """
+    Valida el código SCL generado: sintaxis del subconjunto soportado, variables de la
+    interfaz, que no se escriban entradas y que se asignen todas las salidas.
+
+    Args:
+        codigo (str): Respuesta del LLM (puede venir en un bloque ```scl).
+        interfaz (InterfazSCL): Variables esperadas.
+
+    Returns:
+        str: El código limpio, listo para pegar.
+
+    Raises:
+        ErrorSCL: Con la línea y la columna del primer error.
+    """
+    if not codigo or not codigo.strip():
+        raise ErrorSCL("la respuesta no contiene código")
+    limpio = limpiar_respuesta(codigo)
+    parser = _Parser(tokenizar(limpio), interfaz)
+    parser.programa()
+    sin_asignar = [f'"{tag}" ({parametro})' for tag, parametro in interfaz.salidas.items() if tag not in parser.asignadas]
+    if sin_asignar:
+        raise ErrorSCL(f"no se asigna la salida {', '.join(sin_asignar)}")
+    return limpio
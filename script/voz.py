@@ -0,0 +1,186 @@
+import os
+import time
+import queue
+import threading
+
+import speech_recognition as sr
+
+IDIOMA = os.getenv("PLCAID_IDIOMA_VOZ", "es-ES")
+
+
+# --- Motores de reconocimiento ---
+# Cada motor recibe (recognizer, audio) y devuelve el texto, o lanza sr.UnknownValueError si no
+# entiende nada. Se elige con PLCAID_MOTOR_VOZ; se pueden añadir otros con registrar_motor.
+
+def _motor_google(recognizer, audio):
+    return recognizer.recognize_google(audio, language=IDIOMA)
+
+
+def _motor_sphinx(recognizer, audio):
+    # Sin conexión: requiere pocketsphinx y el modelo acústico del idioma.
+    return recognizer.recognize_sphinx(audio, language=IDIOMA)
+
+
+def _motor_whisper(recognizer, audio):
+    # Local: requiere openai-whisper. El modelo se elige con PLCAID_MODELO_WHISPER.
+    return recognizer.recognize_whisper(audio, model=os.getenv("PLCAID_MODELO_WHISPER", "base"),
+                                        language=IDIOMA.split("-")[0])
+
+
+def _motor_simulado(recognizer, audio):
+    # Para probar la interfaz sin red ni modelos: devuelve siempre el mismo texto.
+    return os.getenv("PLCAID_VOZ_SIMULADA", "marcha paro")
+
+
+MOTORES = {
+    "google": _motor_google,
+    "sphinx": _motor_sphinx,
+    "whisper": _motor_whisper,
+    "simulado": _motor_simulado,
+}
+
+
+def registrar_motor(nombre: str, funcion):
+    """Añade un motor de reconocimiento: `funcion(recognizer, audio) -> str`."""
+    MOTORES[nombre] = funcion
+
+
+class Escucha:
+    """
+    Escucha del micrófono en segundo plano con transcripción por frases.
+
+    El Recognizer y la calibración del ruido ambiente (alrededor de un segundo) se crean una
+    vez y se reutilizan en cada grabación; la calibración solo se repite pasados
+    `recalibrar_s` segundos (el umbral dinámico de energía sigue ajustándose mientras tanto).
+
+    `listen_in_background` captura el audio por bloques en su propio hilo y corta cada frase
+    en cuanto detecta `pausa` segundos de silencio (detección de actividad de voz por energía).
+    Cada frase se pasa a un segundo hilo que la reconoce con el motor elegido, de modo que la
+    captura no se detiene mientras el motor responde y los textos parciales van apareciendo
+    en `fragmentos`.
+
+    Args:
+        motor (str): Nombre del motor en MOTORES. Por defecto, PLCAID_MOTOR_VOZ o "google".
+        pausa (float): Segundos de silencio que terminan una frase.
+        limite_frase (float): Duración máxima de una frase (s).
+        recalibrar_s (float): Validez de la calibración del ruido ambiente (s).
+    """
+
+    def __init__(self, motor: str = None, pausa: float = None, limite_frase: float = 10,
+                 recalibrar_s: float = None):
+        self.motor = motor or os.getenv("PLCAID_MOTOR_VOZ", "google")
+        if self.motor not in MOTORES:
+            raise ValueError(f"Motor de voz desconocido '{self.motor}'. Disponibles: {', '.join(MOTORES)}")
+        self.limite_frase = limite_frase
+        self.recalibrar_s = recalibrar_s if recalibrar_s is not None else float(os.getenv("PLCAID_RECALIBRAR_VOZ_S", "600"))
+
+        self.recognizer = sr.Recognizer()
+        self.recognizer.pause_threshold = pausa if pausa is not None else float(os.getenv("PLCAID_PAUSA_VOZ", "0.6"))
+        self.recognizer.non_speaking_duration = min(self.recognizer.non_speaking_duration, self.recognizer.pause_threshold)
+        self.recognizer.dynamic_energy_threshold = True
+        self.calibrado_en = None
+
+        self.fragmentos = []
+        self.errores = []
+        self.ultima_voz = None
+        self._frases = queue.Queue()
+        self._pendientes = 0
+        self._detener_escucha = None
+        self._lock = threading.Lock()
+        threading.Thread(target=self._reconocer, name="reconocimiento-voz", daemon=True).start()
+
+    @property
+    def activa(self) -> bool:
+        return self._detener_escucha is not None
+
+    @property
+    def pendientes(self) -> int:
+        """Frases capturadas que aún no ha devuelto el motor."""
+        with self._lock:
+            return self._pendientes
+
+    def calibrar(self, duracion: float = 0.5):
+        """Mide el ruido ambiente para fijar el umbral de energía de la detección de voz."""
+        with sr.Microphone() as source:
+            self.recognizer.adjust_for_ambient_noise(source, duration=duracion)
+        self.calibrado_en = time.monotonic()
+        print(f"DEBUG Voz: calibrado, umbral de energía {self.recognizer.energy_threshold:.0f}")
+
+    def iniciar(self):
+        """Empieza a escuchar en segundo plano una orden nueva (descarta la transcripción anterior)."""
+        if self.activa:
+            return
+        if self.calibrado_en is None or time.monotonic() - self.calibrado_en > self.recalibrar_s:
+            self.calibrar()
+        with self._lock:
+            self.fragmentos = []
+            self.errores = []
+        self.ultima_voz = time.monotonic()
+        # Micrófono nuevo en cada escucha: el hilo de la anterior puede tardar hasta un segundo
+        # en soltar el suyo. Lo costoso (la calibración) está en el Recognizer y se conserva.
+        self._detener_escucha = self.recognizer.listen_in_background(
+            sr.Microphone(), self._frase_capturada, phrase_time_limit=self.limite_frase)
+        print(f"DEBUG Voz: escuchando (motor {self.motor}, pausa {self.recognizer.pause_threshold} s)")
+
+    def detener(self):
+        """
+        Deja de capturar audio; las frases ya capturadas se siguen reconociendo. La frase que
+        se esté diciendo en ese momento se descarta.
+        """
+        if self._detener_escucha is not None:
+            detener, self._detener_escucha = self._detener_escucha, None
+            detener(wait_for_stop=False)
+
+    def silencio(self) -> float:
+        """Segundos desde la última frase capturada (o desde el inicio de la escucha)."""
+        return time.monotonic() - self.ultima_voz if self.ultima_voz is not None else 0.0
+
+    def texto(self) -> str:
+        with self._lock:
+            return " ".join(self.fragmentos)
+
+    def esperar_pendientes(self, timeout: float = 10) -> bool:
+        """Espera a que el motor devuelva las frases ya capturadas. False si vence el tiempo."""
+        limite = time.monotonic() + timeout
+        while self.pendientes and time.monotonic() < limite:
+            time.sleep(0.05)
+        return not self.pendientes
+
+    def _frase_capturada(self, recognizer, audio):
+        # Se llama desde el hilo de listen_in_background: solo encola, para no frenar la captura.
+        self.ultima_voz = time.monotonic()
+        with self._lock:
+            self._pendientes += 1
+        self._frases.put(audio)
+
+    def _reconocer(self):
+        while True:
+            audio = self._frases.get()
+            try:
+                texto = MOTORES[self.motor](self.recognizer, audio)
+                if texto:
+                    with self._lock:
+                        self.fragmentos.append(texto.strip())
+                    print(f"DEBUG Voz: frase reconocida: '{texto}'")
+            except sr.UnknownValueError:
+                pass  # Ruido o frase ininteligible: no aporta texto.
+            except Exception as e:
+                with self._lock:
+                    self.errores.append(str(e))
+                print(f"ERROR Voz: fallo del motor {self.motor}: {e}")
+            finally:
+                with self._lock:
+                    self._pendientes -= 1
+
+
+_escucha = None
+_escucha_lock = threading.Lock()
+
+
+def obtener_escucha() -> Escucha:
+    """Escucha compartida del proceso (Streamlit vuelve a ejecutar el script, no los módulos)."""
+    global _escucha
+    with _escucha_lock:
+        if _escucha is None:
+            _escucha = Escucha()
+        return _escucha
@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import threading
+import unittest
+from types import SimpleNamespace
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from script.cliente_llm import ClienteLLM
+
+
+class ClienteBloqueado:
+    """
+    Cliente OpenAI de prueba. Cada llamada a create() recibe su comportamiento de `guion`
+    (por número de llamada): (segundos antes de responder, segundos antes del segundo
+    fragmento, texto). Las esperas simulan una conexión atascada.
+    """
+
+    def __init__(self, guion):
+        self.guion = guion
+        self.llamadas = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._crear))
+
+    def _crear(self, **kwargs):
+        with self._lock:
+            numero = self.llamadas
+            self.llamadas += 1
+        antes, entre, texto = self.guion(numero)
+        time.sleep(antes)
+        return self._fragmentos(entre, texto)
+
+    @staticmethod
+    def _fragmentos(entre, texto):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=texto[:1]))], usage=None)
+        time.sleep(entre)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=texto[1:]))], usage=None)
+        yield SimpleNamespace(choices=[], usage=None)
+
+
+RAPIDA = (0.0, 0.01, "rapida")
+
+
+def _cliente(guion, **opciones) -> ClienteLLM:
+    cliente = ClienteLLM("prueba", cliente=ClienteBloqueado(guion), cobertura=True, min_muestras=3,
+                         max_reintentos=0, plazo=10.0, **opciones)
+    # Latencias de referencia: el percentil 95 queda en unos 10 ms.
+    for _ in range(3):
+        cliente.completar([], "modelo", 0)
+    return cliente
+
+
+class TestCobertura(unittest.TestCase):
+
+    def test_principal_atascada_antes_de_responder(self):
+        cliente = _cliente(lambda n: (5.0, 0.0, "lenta") if n == 3 else RAPIDA)
+        inicio = time.monotonic()
+        respuesta = cliente.completar([], "modelo", 0)
+        self.assertLess(time.monotonic() - inicio, 1.0)
+        self.assertEqual(respuesta.texto, "rapida")
+        self.assertEqual(cliente.coberturas, 1)
+
+    def test_principal_atascada_entre_fragmentos(self):
+        cliente = _cliente(lambda n: (0.0, 5.0, "lenta") if n == 3 else RAPIDA)
+        inicio = time.monotonic()
+        respuesta = cliente.completar([], "modelo", 0)
+        self.assertLess(time.monotonic() - inicio, 1.0)
+        self.assertEqual(respuesta.texto, "rapida")
+
+    def test_la_espera_previa_no_lanza_duplicados(self):
+        cliente = _cliente(lambda n: RAPIDA)
+        cliente.antes_de_peticion = lambda: time.sleep(0.5)
+        respuesta = cliente.completar([], "modelo", 0)
+        self.assertEqual(respuesta.texto, "rapida")
+        self.assertEqual(cliente.coberturas, 0)
+
+    def test_error_de_la_principal_sin_duplicado(self):
+        def guion(n):
+            if n == 3:
+                raise ValueError("fallo")
+            return RAPIDA
+        cliente = _cliente(guion)
+        with self.assertRaises(ValueError):
+            cliente.completar([], "modelo", 0)
+        self.assertEqual(cliente.coberturas, 0)
+
+    def test_plazo_con_las_dos_atascadas(self):
+        cliente = _cliente(lambda n: (5.0, 0.0, "lenta") if n >= 3 else RAPIDA)
+        inicio = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            cliente.completar([], "modelo", 0, plazo=0.5)
+        self.assertLess(time.monotonic() - inicio, 1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
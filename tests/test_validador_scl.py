@@ -0,0 +1,96 @@
+import os
+import sys
+import unittest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from script.validador_scl import ErrorSCL, limpiar_respuesta, validar_prefijo, validar_scl
+
+CODIGO = (
+    'IF "Tag_1" AND NOT "Tag_2" THEN\n'
+    '    "Tag_3" := TRUE;\n'
+    'ELSIF "Tag_2" THEN\n'
+    '    "Tag_3" := FALSE;\n'
+    'END_IF;\n'
+)
+
+
+class TestLimpiarRespuesta(unittest.TestCase):
+
+    def test_no_corta_sentencias_antes_del_primer_if(self):
+        codigo = '"Tag_3" := FALSE;\nIF "Tag_1" THEN\n    "Tag_3" := TRUE;\nEND_IF;\n'
+        self.assertEqual(limpiar_respuesta(codigo), codigo)
+        self.assertEqual(validar_scl(codigo), codigo)
+
+    def test_asignacion_sin_comillas_antes_del_primer_if(self):
+        codigo = 'Q_Motor := FALSE;\nIF Start THEN\n    Q_Motor := TRUE;\nEND_IF;\n'
+        self.assertEqual(limpiar_respuesta(codigo), codigo)
+
+    def test_quita_bloque_markdown_y_texto_alrededor(self):
+        respuesta = f"Aquí tienes el código:\n```scl\n{CODIGO}```\nEspero que te sirva."
+        self.assertEqual(validar_scl(respuesta), CODIGO)
+
+    def test_quita_texto_sin_bloque_markdown(self):
+        respuesta = f"Este es el programa de marcha y paro.\n{CODIGO}Nota: Tag_3 es la salida del motor."
+        self.assertEqual(limpiar_respuesta(respuesta), CODIGO)
+
+    def test_texto_entre_sentencias_se_rechaza(self):
+        respuesta = '"Tag_3" := FALSE;\nAhora se comprueba la marcha.\n' + CODIGO
+        with self.assertRaises(ErrorSCL) as contexto:
+            validar_scl(respuesta)
+        self.assertEqual(contexto.exception.linea, 2)
+
+    def test_respuesta_sin_codigo(self):
+        with self.assertRaises(ErrorSCL):
+            validar_scl("No puedo generar ese código.")
+        with self.assertRaises(ErrorSCL):
+            validar_scl("   ")
+
+
+class TestInterfaz(unittest.TestCase):
+
+    def test_variable_fuera_de_la_interfaz(self):
+        with self.assertRaises(ErrorSCL) as contexto:
+            validar_scl('IF "Tag_9" THEN\n    "Tag_3" := TRUE;\nEND_IF;\n')
+        self.assertIn("Tag_9", contexto.exception.mensaje)
+        self.assertEqual((contexto.exception.linea, contexto.exception.columna), (1, 4))
+
+    def test_no_se_puede_escribir_una_entrada(self):
+        with self.assertRaises(ErrorSCL) as contexto:
+            validar_scl('"Tag_1" := TRUE;\n"Tag_3" := "Tag_1";\n')
+        self.assertIn("entrada", contexto.exception.mensaje)
+
+    def test_salida_sin_asignar(self):
+        with self.assertRaises(ErrorSCL) as contexto:
+            validar_scl('IF "Tag_1" THEN\n    ;\nEND_IF;\n')
+        self.assertIn("Tag_3", contexto.exception.mensaje)
+
+    def test_llamada_al_bloque(self):
+        codigo = '"MarchaParo_1"(Start := "Tag_1", Stop := "Tag_2", Q_Motor => "Tag_3");\n'
+        self.assertEqual(validar_scl(codigo), codigo)
+        with self.assertRaises(ErrorSCL):
+            validar_scl('"MarchaParo_1"(Reset := "Tag_1", Q_Motor => "Tag_3");\n')
+
+    def test_falta_end_if(self):
+        with self.assertRaises(ErrorSCL) as contexto:
+            validar_scl('IF "Tag_1" THEN\n    "Tag_3" := TRUE;\n')
+        self.assertIn("END_IF", contexto.exception.mensaje)
+
+
+class TestValidarPrefijo(unittest.TestCase):
+
+    def test_ignora_el_texto_previo_y_las_vallas(self):
+        validar_prefijo("Aquí tienes el código:\n```scl\n" + CODIGO + "```\nSe usa \"Otro\" como ejemplo.\n")
+
+    def test_detecta_variable_desconocida_antes_del_final(self):
+        with self.assertRaises(ErrorSCL):
+            validar_prefijo('```scl\n"Tag_3" := "Tag_9";\nIF')
+
+    def test_linea_incompleta_no_se_comprueba(self):
+        validar_prefijo('IF "Tag_1" THEN\n    "Tag_')
+
+
+if __name__ == "__main__":
+    unittest.main()